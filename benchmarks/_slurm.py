@@ -0,0 +1,46 @@
+"""Stand-ins of the Slurm commands used by sbench, to run it without a
+cluster.
+
+``sbatch`` accepts any batch file and prints a new job id, without
+running the job, and ``sacct`` reports every job as completed. They are
+shell scripts, which start much faster than a Python interpreter, so
+that they don't dominate the time of the commands being measured. The
+job id is the process id of ``sbatch``, which is unique among the
+concurrent submissions.
+"""
+import os
+import stat
+
+sbatch = '''#!/bin/sh
+echo $$
+'''
+
+sacct = '''#!/bin/sh
+for arg in "$@"; do
+    case $arg in
+        --jobs=*) ids=${arg#--jobs=} ;;
+    esac
+done
+for id in $(echo "$ids" | tr , ' '); do
+    echo "$id|COMPLETED"
+done
+'''
+
+
+def install(bin_dir):
+    """Writes the fake commands in a directory.
+
+    Returns:
+        The environment of the current process, with the directory at
+        the front of the PATH
+    """
+    os.makedirs(bin_dir, exist_ok=True)
+    for name, script in (('sbatch', sbatch), ('sacct', sacct)):
+        filename = os.path.join(bin_dir, name)
+        with open(filename, 'w') as f:
+            f.write(script)
+        os.chmod(filename, os.stat(filename).st_mode | stat.S_IXUSR)
+
+    env = dict(os.environ)
+    env['PATH'] = bin_dir + os.pathsep + env.get('PATH', '')
+    return env
@@ -0,0 +1,114 @@
+"""Generator of synthetic trees of result directories, as written by
+``sbench run`` and the jobs it submits.
+"""
+import datetime
+import json
+import os
+import random
+import uuid
+
+#: Tests generated, in turn
+tests = ['osu_bw', 'osu_latency', 'osu_bibw', 'osu_alltoall', 'osu_allreduce', 'hpl']
+
+#: Clusters and software stacks of the jobs, drawn at random when there
+#: are several
+clusters = ['fidis']
+stacks = [('gcc/7.4.0', 'mvapich2')]
+
+#: Headers printed by the OSU benchmarks
+osu_headers = {
+    'osu_bw': '# OSU MPI Bandwidth Test v5.4.0\n# Size      Bandwidth (MB/s)\n',
+    'osu_latency': '# OSU MPI Latency Test v5.4.0\n# Size          Latency (us)\n',
+    'osu_bibw': '# OSU MPI Bi-Directional Bandwidth Test v5.4.0\n# Size      Bandwidth (MB/s)\n',
+    'osu_alltoall': '# OSU MPI All-to-All Personalized Exchange Latency Test v5.4.0\n'
+                    '# Size       Avg Latency(us)\n',
+    'osu_allreduce': '# OSU MPI Allreduce Latency Test v5.4.0\n# Size       Avg Latency(us)\n',
+}
+
+hpl_output = (
+    'T/V                N    NB     P     Q               Time                 Gflops\n'
+    '--------------------------------------------------------------------------------\n'
+    'WR11C2R4      155904   256     7     8             {0:.2f}             {1:.4e}\n'
+)
+
+#: Date of the first job, in the time zone of the clusters
+first_start = datetime.datetime(
+    2019, 7, 1, 10, 0, tzinfo=datetime.timezone(datetime.timedelta(hours=2))
+)
+
+
+def _write(directory, name, content):
+    with open(os.path.join(directory, name), 'w') as f:
+        f.write(content)
+
+
+def _date(when):
+    # Same format as ``date -R``
+    return when.strftime('%a, %d %b %Y %H:%M:%S %z') + '\n'
+
+
+def generate(root, ndirs, seed=0, first_job_id=100000, env_size=150,
+             clusters=clusters, stacks=stacks, days=0):
+    """Writes ``ndirs`` result directories under root.
+
+    Each directory contains the context of its test and the files
+    written by a completed job: start and finish dates, environment
+    (with ``env_size`` variables besides those read by sbench), output
+    and error.
+
+    Args:
+        clusters (list): clusters of the jobs
+        stacks (list): (compiler, mpi) pairs of the jobs
+        days (int): the jobs start at random times during this number
+            of days, or all at the same time if 0
+
+    Returns:
+        The paths of the directories
+    """
+    rng = random.Random(seed)
+    directories = []
+    for i in range(ndirs):
+        test = tests[i % len(tests)]
+        cluster = clusters[0] if len(clusters) == 1 else rng.choice(clusters)
+        compiler, mpi = stacks[0] if len(stacks) == 1 else rng.choice(stacks)
+        directory = os.path.join(root, str(uuid.UUID(int=rng.getrandbits(128))))
+        os.makedirs(directory)
+        directories.append(directory)
+
+        job_id = first_job_id + i
+        context = {
+            'name': test, 'cluster': cluster, 'compiler': compiler,
+            'mpi': mpi, 'nnodes': 2, 'ntasks': 2, 'test_directory': directory
+        }
+        _write(directory, 'context.json', json.dumps(context))
+
+        start = first_start
+        if days:
+            start += datetime.timedelta(seconds=rng.randrange(days * 86400))
+        prefix = 'run.{0}.'.format(job_id)
+        _write(directory, prefix + 'start', _date(start))
+        _write(directory, prefix + 'finished', _date(start + datetime.timedelta(minutes=5)))
+        _write(directory, prefix + 'err', '')
+
+        # Dumps of the same cluster and software only differ by the
+        # variables that are specific to each job
+        first_node = rng.randint(1, 400)
+        env = ['VAR_{0}={1}'.format(k, 'x' * 40) for k in range(env_size)]
+        env[env_size // 2:env_size // 2] = [
+            'SLURM_JOB_ID={0}'.format(job_id), 'SLURM_JOBID={0}'.format(job_id),
+            'SLURM_NODELIST=f[{0:03d}-{1:03d}]'.format(first_node, first_node + 1),
+            'SLURM_CLUSTER_NAME={0}'.format(cluster), 'SLURM_NNODES=2', 'SLURM_NTASKS=2',
+            'SLURM_TASK_PID={0}'.format(rng.randint(1000, 99999)),
+            'TMPDIR=/tmp/{0}'.format(job_id), 'SPACK_TARGET_TYPE=E5v4'
+        ]
+        _write(directory, prefix + 'env', '\n'.join(env) + '\n')
+
+        if test == 'hpl':
+            output = hpl_output.format(300 + rng.random() * 300, 5e3 + rng.random() * 1e3)
+        else:
+            output = osu_headers[test] + ''.join(
+                '{0:<10d}{1:>18.2f}\n'.format(2**p, rng.random() * 1e4) for p in range(23)
+            )
+        _write(directory, prefix + 'out', output)
+
+    return directories
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""Benchmark of ``sbench collect`` on a tarball of results, compared to
+the same results extracted on disk.
+
+The page cache is not dropped between the two measures, so the extracted
+tree is read from memory: on a parallel filesystem the difference in
+favor of the tarball is larger.
+
+Usage:
+    python benchmarks/bench_archive.py [--dirs 5000] [--jobs 1] [--workdir DIR]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+from benchmarks import _tree  # NOQA: E402
+
+
+def collect(db, path, jobs):
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, '-c', 'from sbench.commands import sbench; sbench()',
+         'collect', '--db', db, '-j', str(jobs), path],
+        check=True, stdout=subprocess.DEVNULL, cwd=root
+    )
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dirs', type=int, default=5000,
+                        help='Number of result directories')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='Number of processes used by collect')
+    parser.add_argument('--workdir', default=None,
+                        help='Directory where the results are generated')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.workdir) as directory:
+        tree = os.path.join(directory, 'benchmarks')
+        _tree.generate(tree, args.dirs)
+        tarball = os.path.join(directory, 'benchmarks.tgz')
+        with tarfile.open(tarball, 'w:gz') as archive:
+            archive.add(tree, arcname='benchmarks')
+
+        timings = {
+            'extracted tree': collect(os.path.join(directory, 'tree.db'), tree, args.jobs),
+            'tarball': collect(os.path.join(directory, 'tarball.db'), tarball, args.jobs),
+        }
+
+    for name, elapsed in timings.items():
+        print('{0:<16} {1:>8.2f}s {2:>10.1f} directories/s'.format(
+            name, elapsed, args.dirs / elapsed
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""Benchmark of the DB writes of ``sbench collect``, on SQLite and on
+the other backends passed as SQLAlchemy URLs.
+
+The result directories are parsed once, then the same records are
+written to each DB, so that only the writes are measured. With
+--postgres-bin, a throwaway PostgreSQL server is started with the
+initdb and pg_ctl found there, and its DB is benchmarked both with COPY
+and with the INSERT statements used by other backends.
+
+Usage:
+    python benchmarks/bench_db.py [--dirs 2000] [--batch-size 1000]
+        [--url URL ...] [--postgres-bin DIR] [--workdir DIR]
+"""
+import argparse
+import contextlib
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import _tree  # NOQA: E402
+
+
+@contextlib.contextmanager
+def postgres(bin_dir, directory, port=54329):
+    """Runs a PostgreSQL server with a data directory in directory.
+
+    Yields:
+        The URL of a DB of the server
+    """
+    data = os.path.join(directory, 'pgdata')
+    subprocess.run(
+        [os.path.join(bin_dir, 'initdb'), '-D', data, '-U', 'sbench', '-A', 'trust'],
+        check=True, stdout=subprocess.DEVNULL
+    )
+    options = '-k {0} -p {1} -c listen_addresses=127.0.0.1 -c fsync=off'.format(directory, port)
+    pg_ctl = os.path.join(bin_dir, 'pg_ctl')
+    subprocess.run(
+        [pg_ctl, '-D', data, '-o', options, '-l', os.path.join(directory, 'pg.log'), '-w', 'start'],
+        check=True, stdout=subprocess.DEVNULL
+    )
+    try:
+        yield 'postgresql://sbench@127.0.0.1:{0}/postgres'.format(port)
+    finally:
+        subprocess.run([pg_ctl, '-D', data, '-m', 'fast', 'stop'], stdout=subprocess.DEVNULL)
+
+
+def parse(directories):
+    from sbench import commands
+
+    return [
+        commands._try_ingest(commands._ingest_task(root, {}, force=True))
+        for root in directories
+    ]
+
+
+def write(db, records, batch_size, copy=True):
+    from sbench import _sql, commands
+
+    drivers = _sql.copy_drivers
+    if not copy:
+        _sql.copy_drivers = ()
+    try:
+        session = commands._open_session(db, False)
+        start = time.perf_counter()
+        ndirs, nrows = commands.write_records(session, records, batch_size)
+        elapsed = time.perf_counter() - start
+        session.close()
+    finally:
+        _sql.copy_drivers = drivers
+    return nrows, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dirs', type=int, default=2000,
+                        help='Number of result directories')
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help='Directories committed per transaction')
+    parser.add_argument('--url', action='append', default=[],
+                        help='SQLAlchemy URL of an empty DB to be benchmarked')
+    parser.add_argument('--postgres-bin', default=None,
+                        help='Directory with the binaries of PostgreSQL')
+    parser.add_argument('--workdir', default=None,
+                        help='Directory where the results are generated')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.workdir) as directory:
+        records = parse(_tree.generate(os.path.join(directory, 'tree'), args.dirs))
+
+        with contextlib.ExitStack() as stack:
+            timings = [
+                ('sqlite', write(os.path.join(directory, 'b.db'), records, args.batch_size))
+            ]
+            urls = list(args.url)
+            if args.postgres_bin:
+                urls.append(stack.enter_context(postgres(args.postgres_bin, directory)))
+
+            for url in urls:
+                timings.append((url + ' (INSERT)', write(url, records, args.batch_size, copy=False)))
+                # The rows are already there: empty the tables first
+                from sbench._sql import Base, create_engine
+                with create_engine(url).begin() as connection:
+                    for table in reversed(Base.metadata.sorted_tables):
+                        connection.execute(table.delete())
+                timings.append((url + ' (COPY)', write(url, records, args.batch_size)))
+
+    for name, (nrows, elapsed) in timings:
+        print('{0:<56} {1:>8} rows {2:>8.2f}s {3:>10.1f} rows/s'.format(
+            name, nrows, elapsed, nrows / elapsed
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""Benchmark of the discovery of the result directories by ``collect``:
+compares ``os.walk`` followed by a listing and five globs per directory
+with the single ``os.scandir`` pass of ``sbench._discovery``.
+
+Both find the directories, fingerprint them for the ingestion manifest
+and sort the files of their job, which is what ``collect`` does before
+parsing. The tree is generated just before, so it is read from the page
+cache: on a parallel filesystem, where each listing is a round trip to
+the metadata servers, the difference is larger, and so is the gain of
+the threads.
+
+Usage:
+    python benchmarks/bench_discovery.py [--dirs 50000] [--threads 16] [--workdir DIR]
+"""
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+from benchmarks import _tree  # NOQA: E402
+from sbench import _discovery, _manifest  # NOQA: E402
+from sbench.slurm import SlurmJob  # NOQA: E402
+
+
+def legacy(directory, nthreads):
+    """Discovery before ``sbench._discovery``."""
+    n = 0
+    for path, dirs, files in os.walk(directory):
+        if dirs or 'context.json' not in files:
+            continue
+        _manifest.scan(path)
+        {key: glob.glob(os.path.join(path, pattern)) for key, pattern in SlurmJob.patterns.items()}
+        n += 1
+    return n
+
+
+def scandir(directory, nthreads):
+    def visit(path, entries):
+        return _manifest.scan(path, entries), SlurmJob.classify(path, entries)
+    return sum(1 for _ in _discovery.walk(directory, visit, nthreads))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dirs', type=int, default=50000,
+                        help='Number of result directories')
+    parser.add_argument('--threads', type=int, default=_discovery.threads,
+                        help='Number of threads listing directories')
+    parser.add_argument('--workdir', default=None,
+                        help='Directory where the results are generated')
+    args = parser.parse_args()
+
+    measures = [
+        ('os.walk + globs', legacy, 1),
+        ('scandir', scandir, 1),
+        ('scandir, threads', scandir, args.threads),
+    ]
+    with tempfile.TemporaryDirectory(dir=args.workdir) as directory:
+        tree = os.path.join(directory, 'benchmarks')
+        _tree.generate(tree, args.dirs)
+
+        results = {}
+        for name, function, nthreads in measures:
+            start = time.perf_counter()
+            n = function(tree, nthreads)
+            elapsed = time.perf_counter() - start
+            assert n == args.dirs
+            results[name] = elapsed
+            print('{0:<18} {1:>8.2f}s {2:>10.1f} directories/s'.format(
+                name, elapsed, args.dirs / elapsed
+            ))
+
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""Benchmark of the columnar export: compares loading the osu_bw results
+through the ORM with exporting them and reading the exported files.
+
+Usage:
+    python benchmarks/bench_export.py [--rows 1000000] [--workdir DIR]
+"""
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_queries import generate  # NOQA: E402
+
+
+def orm_load(db):
+    """Loads the osu_bw results and their jobs as ORM objects, as the
+    analysis notebooks did before the export.
+    """
+    import sqlalchemy.orm
+    from sbench._sql import create_engine
+    from sbench.osu import OsuBwRow
+    from sbench.slurm import JobRow
+
+    session = sqlalchemy.orm.sessionmaker(bind=create_engine(db))()
+    return session.query(OsuBwRow, JobRow).join(
+        JobRow, (OsuBwRow.cluster == JobRow.cluster) & (OsuBwRow.jobid == JobRow.id)
+    ).all()
+
+
+def export(db, directory, fmt):
+    from sbench import columnar, commands, slurm  # NOQA: F401
+    from sbench._sql import create_engine
+    from sbench.osu import OsuBwRow
+
+    engine = create_engine(db)
+    with engine.connect() as connection:
+        nrows, files = columnar.export_table(
+            connection, OsuBwRow.__table__, 'osu_bw', directory, fmt, {}
+        )
+    return nrows, sum(os.path.getsize(f) for f in files)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10**6,
+                        help='Number of rows of results in the DB')
+    parser.add_argument('--workdir', default=None,
+                        help='Directory where the DB is generated')
+    args = parser.parse_args()
+
+    from sbench import columnar
+
+    with tempfile.TemporaryDirectory(dir=args.workdir) as directory:
+        db = os.path.join(directory, 'benchmarks.db')
+        generate(db, args.rows)
+        db_size = os.path.getsize(db)
+
+        print('{0:<22} {1:>10} {2:>14} {3:>10}'.format('', 'time [s]', 'rows/s', 'size [MB]'))
+
+        start = time.perf_counter()
+        nrows = len(orm_load(db))
+        elapsed = time.perf_counter() - start
+        print('{0:<22} {1:>10.2f} {2:>14.0f} {3:>10.1f}'.format(
+            'ORM load', elapsed, nrows / elapsed, db_size / 2**20
+        ))
+
+        for fmt in ('parquet', 'npz'):
+            if fmt == 'parquet' and columnar.default_format() != 'parquet':
+                continue
+            output = os.path.join(directory, fmt)
+            start = time.perf_counter()
+            nrows, size = export(db, output, fmt)
+            elapsed = time.perf_counter() - start
+            print('{0:<22} {1:>10.2f} {2:>14.0f} {3:>10.1f}'.format(
+                'export ' + fmt, elapsed, nrows / elapsed, size / 2**20
+            ))
+
+            start = time.perf_counter()
+            arrays = columnar.read(os.path.join(output, 'test=osu_bw'), ['size', 'bandwidth'])
+            # Touch the data, as memory-mapped files are read lazily
+            arrays['bandwidth'].sum()
+            elapsed = time.perf_counter() - start
+            print('{0:<22} {1:>10.2f} {2:>14.0f}'.format(
+                'read ' + fmt, elapsed, len(arrays['size']) / elapsed
+            ))
+
+    print('Peak RSS: {0:.1f} MB'.format(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    ))
+
+
+if __name__ == '__main__':
+    main()
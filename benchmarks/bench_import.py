@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""Import-time benchmark of the sbench CLI, based on ``python -X importtime``.
+
+Exits with a non-zero status if importing ``sbench.commands`` takes more
+than the budget, or if it loads any of the modules that should only be
+imported by the commands that need them.
+
+Usage:
+    python benchmarks/bench_import.py [--budget-ms 150] [--repeat 5]
+"""
+import argparse
+import re
+import subprocess
+import sys
+
+#: Modules that must not be loaded just to start the CLI
+lazy_modules = ('sqlalchemy', 'jinja2', 'asyncio', 'multiprocessing')
+
+#: Parses a line of the output of -X importtime
+importtime_regex = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)')
+
+
+def measure(module):
+    """Imports a module in a fresh interpreter.
+
+    Returns:
+        The cumulative import time of the module in microseconds, and
+        the names of all the modules imported
+    """
+    p = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+        stderr=subprocess.PIPE, universal_newlines=True, check=True
+    )
+    cumulative, imported = None, []
+    for line in p.stderr.splitlines():
+        r = importtime_regex.match(line)
+        if not r:
+            continue
+        imported.append(r.group(4))
+        if r.group(4) == module:
+            cumulative = int(r.group(2))
+
+    return cumulative, imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--budget-ms', type=float, default=150.,
+                        help='Maximum import time of sbench.commands')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of measures, the best one is kept')
+    args = parser.parse_args()
+
+    timings = []
+    for _ in range(args.repeat):
+        cumulative, imported = measure('sbench.commands')
+        timings.append(cumulative / 1000.)
+
+    best = min(timings)
+    print('import sbench.commands: {0:.1f} ms (best of {1}, budget {2:.0f} ms)'.format(
+        best, args.repeat, args.budget_ms
+    ))
+
+    errors = []
+    if best > args.budget_ms:
+        errors.append('import time over budget')
+
+    eager = sorted({m.split('.')[0] for m in imported} & set(lazy_modules))
+    if eager:
+        errors.append('modules imported eagerly: ' + ', '.join(eager))
+
+    for error in errors:
+        print('FAILED: ' + error)
+
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
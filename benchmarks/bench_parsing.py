@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+"""Micro-benchmark of the output parsers: compares the streaming engine
+in ``sbench._parsing`` with the previous ``readlines`` based code.
+
+Each measure runs in a fresh interpreter, so that the peak RSS reported
+belongs to a single implementation.
+
+Usage:
+    python benchmarks/bench_parsing.py [--mbytes 200] [--workdir DIR]
+"""
+import argparse
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+
+#: Regexes used by SlurmJob before the streaming engine
+legacy_regexps = {
+    'nodelist': re.compile(r'SLURM_NODELIST=([\w\[,\]-]*)$'),
+    'cluster': re.compile(r'SLURM_CLUSTER_NAME=([\w\[,\]]*)$'),
+    'nnodes': re.compile(r'SLURM_NNODES=([\d]*)$'),
+    'ntasks': re.compile(r'SLURM_NTASKS=([\d]*)$'),
+    'target': re.compile(r'SPACK_TARGET_TYPE=([\d\w_]*)$')
+}
+
+int_and_float = re.compile(r'^([\d]+)[\s]*([\d.]+)$')
+
+
+def legacy_env(filename):
+    kwargs = {}
+    to_be_parsed = set(legacy_regexps)
+    with open(filename, 'r') as f:
+        for line in f.readlines():
+            for item in list(to_be_parsed):
+                t = legacy_regexps[item].search(line)
+                if t:
+                    kwargs[item] = t.group(1)
+                    to_be_parsed.remove(item)
+
+            if not to_be_parsed:
+                break
+    return kwargs
+
+
+def streaming_env(filename):
+    from sbench._parsing import iter_lines, scan_key_values
+    from sbench.slurm import SlurmJob
+    return scan_key_values(iter_lines(filename), SlurmJob.environment_fields)
+
+
+def legacy_out(filename):
+    rows = []
+    with open(filename) as f:
+        for line in f.readlines():
+            r = int_and_float.match(line)
+            if r:
+                rows.append((int(r.group(1)), float(r.group(2))))
+    return rows
+
+
+def streaming_out(filename):
+    from sbench._parsing import iter_lines, match_lines
+    return [
+        (int(r.group(1)), float(r.group(2)))
+        for r in match_lines(iter_lines(filename), int_and_float)
+    ]
+
+
+implementations = {
+    'legacy-env': legacy_env,
+    'streaming-env': streaming_env,
+    'legacy-out': legacy_out,
+    'streaming-out': streaming_out,
+}
+
+
+def generate(directory, mbytes):
+    """Writes an environment dump and an OSU output padded with
+    verbose MPI debug messages, each of roughly ``mbytes`` MB.
+    """
+    random.seed(0)
+    noise = 'MV2_DEBUG[{0}]: rank {1} posted recv of {2} bytes on hca mlx5_0:1\n'
+    files = {}
+
+    env = os.path.join(directory, 'run.1.env')
+    with open(env, 'w') as f:
+        size = 0
+        while size < mbytes * 2**20:
+            line = 'MODULE_VAR_{0}={1}\n'.format(random.getrandbits(32), 'x' * 80)
+            size += f.write(line)
+        # Worst case: the variables we look for are at the end
+        f.write('SLURM_NODELIST=f[001-002]\nSLURM_CLUSTER_NAME=fidis\n')
+        f.write('SLURM_NNODES=2\nSLURM_NTASKS=2\nSPACK_TARGET_TYPE=broadwell\n')
+    files['env'] = env
+
+    out = os.path.join(directory, 'run.1.out')
+    with open(out, 'w') as f:
+        size = 0
+        while size < mbytes * 2**20:
+            size += f.write(noise.format(random.randint(0, 1), random.randint(0, 1), random.getrandbits(16)))
+            if random.random() < 0.001:
+                size += f.write('{0:<10d}{1:>18.2f}\n'.format(2**random.randint(0, 22), random.random() * 1e4))
+    files['out'] = out
+
+    return files
+
+
+def run_one(name, filename):
+    """Runs an implementation in a child interpreter and returns its
+    timings and peak RSS.
+    """
+    code = (
+        'import json, resource, sys, time\n'
+        'sys.path.insert(0, {root!r})\n'
+        'from benchmarks.bench_parsing import implementations\n'
+        'start = time.perf_counter()\n'
+        'implementations[{name!r}]({filename!r})\n'
+        'elapsed = time.perf_counter() - start\n'
+        'rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss\n'
+        'print(json.dumps({{"elapsed": elapsed, "rss_kb": rss}}))\n'
+    ).format(
+        root=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        name=name, filename=filename
+    )
+    output = subprocess.check_output([sys.executable, '-c', code])
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mbytes', type=int, default=200,
+                        help='Approximate size of each generated file')
+    parser.add_argument('--workdir', default=None,
+                        help='Directory where the files are generated')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.workdir) as directory:
+        files = generate(directory, args.mbytes)
+        results = {}
+        for name in implementations:
+            filename = files[name.split('-')[1]]
+            with open(filename) as f:
+                nlines = sum(1 for _ in f)
+            measure = run_one(name, filename)
+            measure['lines_per_s'] = nlines / measure['elapsed']
+            results[name] = measure
+            print('{0:<15} {1:>12.0f} lines/s {2:>10.1f} MB peak RSS'.format(
+                name, measure['lines_per_s'], measure['rss_kb'] / 1024
+            ))
+
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+"""Benchmark of typical dashboard queries on a synthetic DB, with and
+without the secondary indexes and the pragmas set by ``sbench._sql``.
+
+Usage:
+    python benchmarks/bench_queries.py [--rows 1000000] [--workdir DIR]
+"""
+import argparse
+import datetime
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+#: Message sizes of an osu_bw run
+sizes = [2**i for i in range(23)]
+
+stacks = [
+    ('gcc/7.4.0', 'mvapich2'), ('gcc/7.4.0', 'openmpi'),
+    ('gcc/8.3.0', 'mvapich2'), ('gcc/8.3.0', 'openmpi'),
+    ('intel/18.0.5', 'intel-mpi')
+]
+
+clusters = ['deneb', 'eltanin', 'fidis', 'gacrux', 'helvetios']
+
+queries = {
+    'job by id (x1000)': (
+        'SELECT * FROM "Jobs" WHERE "id" = ?', 'ids'
+    ),
+    'per-size mean, one stack, last 30 days': (
+        'SELECT "size", AVG("bandwidth"), COUNT(*) FROM "OsuBandwithView" '
+        'WHERE "cluster" = ? AND "compiler" = ? AND "mpi" = ? AND "start" >= ? '
+        'GROUP BY "size"', 'stack'
+    ),
+    'time series, one stack and size': (
+        'SELECT "start", "bandwidth" FROM "OsuBandwithView" '
+        'WHERE "cluster" = ? AND "compiler" = ? AND "mpi" = ? AND "size" = 65536 '
+        'ORDER BY "start"', 'series'
+    ),
+    'latest job per stack': (
+        'SELECT "cluster", "compiler", "mpi", MAX("start") FROM "Jobs" '
+        'GROUP BY "cluster", "compiler", "mpi"', None
+    ),
+}
+
+
+def generate(db, nrows):
+    """Creates a DB with the sbench schema and ``nrows`` rows of osu_bw
+    results spread over two years of jobs.
+    """
+    from sbench import commands
+    from sbench._sql import create_engine
+
+    engine = create_engine(db)
+    commands._create_tables(engine)
+    engine.dispose()
+
+    random.seed(0)
+    njobs = nrows // len(sizes)
+    start = datetime.datetime(2018, 1, 1)
+    jobs, results = [], []
+    for jobid in range(njobs):
+        cluster = random.choice(clusters)
+        compiler, mpi = random.choice(stacks)
+        when = start + datetime.timedelta(minutes=random.randint(0, 2 * 365 * 24 * 60))
+        jobs.append((
+            cluster, jobid, str(when), str(when + datetime.timedelta(minutes=5)),
+            2, 2, 'E5v4', compiler, mpi, 'n[001-002]', '/scratch/sbench/' + str(jobid)
+        ))
+        results.extend((cluster, jobid, size, random.random() * 1e4) for size in sizes)
+
+    connection = sqlite3.connect(db)
+    connection.executemany(
+        'INSERT INTO "Jobs" (cluster, id, start, finish, nnodes, ntasks, target, '
+        'compiler, mpi, nodelist, root) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', jobs
+    )
+    connection.executemany('INSERT INTO "OsuBandwith" VALUES (?, ?, ?, ?)', results)
+    connection.commit()
+    connection.execute('ANALYZE')
+    connection.close()
+
+    return njobs
+
+
+def run_queries(connection, ids, since=datetime.datetime(2019, 12, 1)):
+    """Runs each query once.
+
+    Args:
+        connection: SQLite connection to the DB
+        ids (sequence): ids of the jobs in the DB, of which 1000 are
+            looked up
+        since (datetime): start of the window of recent results
+
+    Returns:
+        The time spent in each query
+    """
+    random.seed(1)
+    last_month = str(since)
+    timings = {}
+    for name, (sql, params) in queries.items():
+        start = time.perf_counter()
+        if params == 'ids':
+            for jobid in random.sample(ids, min(1000, len(ids))):
+                connection.execute(sql, (jobid,)).fetchall()
+        elif params == 'stack':
+            connection.execute(sql, ('fidis', 'gcc/7.4.0', 'mvapich2', last_month)).fetchall()
+        elif params == 'series':
+            connection.execute(sql, ('fidis', 'gcc/7.4.0', 'mvapich2')).fetchall()
+        else:
+            connection.execute(sql).fetchall()
+        timings[name] = time.perf_counter() - start
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10**6,
+                        help='Number of rows of results in the DB')
+    parser.add_argument('--workdir', default=None,
+                        help='Directory where the DB is generated')
+    args = parser.parse_args()
+
+    from sbench._sql import sqlite_pragmas
+
+    with tempfile.TemporaryDirectory(dir=args.workdir) as directory:
+        db = os.path.join(directory, 'benchmarks.db')
+        start = time.perf_counter()
+        njobs = generate(db, args.rows)
+        print('Generated {0} jobs and {1} rows in {2:.1f}s'.format(
+            njobs, njobs * len(sizes), time.perf_counter() - start
+        ))
+
+        tuned = sqlite3.connect(db)
+        for pragma, value in sqlite_pragmas.items():
+            tuned.execute('PRAGMA {0}={1}'.format(pragma, value))
+        after = run_queries(tuned, range(njobs))
+        tuned.close()
+
+        plain = sqlite3.connect(db)
+        plain.execute('PRAGMA journal_mode=DELETE')
+        for (name,) in plain.execute(
+                'SELECT name FROM sqlite_master WHERE type = \'index\' AND name LIKE \'ix_%\'').fetchall():
+            plain.execute('DROP INDEX "{0}"'.format(name))
+        before = run_queries(plain, range(njobs))
+        plain.close()
+
+    print('{0:<42} {1:>12} {2:>12}'.format('query', 'before [ms]', 'after [ms]'))
+    for name in queries:
+        print('{0:<42} {1:>12.1f} {2:>12.1f}'.format(
+            name, before[name] * 1e3, after[name] * 1e3
+        ))
+
+
+if __name__ == '__main__':
+    main()
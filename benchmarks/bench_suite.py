@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+"""End-to-end benchmark suite of sbench, on synthetic results and with
+stand-ins of the Slurm commands, so that it runs without a cluster.
+
+The suite measures:
+
+- ``sbench run`` of all the tests on all the clusters, which renders
+  the batch files and submits them to the fake ``sbatch``, with and
+  without --array;
+- ``sbench collect`` of a tree into a fresh DB, of the same tree again,
+  whose directories are then unchanged, and of a second tree into the
+  DB that already holds the first one;
+- the dashboard queries of ``bench_queries.py`` on the resulting DB.
+
+Each measure is repeated and the best time is kept. The results are
+written as JSON with --output, along with the commit and the phases
+recorded by ``--profile``. With --baseline, they are compared to the
+results of another commit, and the suite exits with a non-zero status
+if some measure is slower by more than --tolerance. --compare compares
+two files of results without running the suite.
+
+Usage:
+    python benchmarks/bench_suite.py [--dirs 5000] [--days 365] [--jobs 1]
+        [--repeat 3] [--output FILE] [--baseline FILE] [--tolerance 0.2]
+        [--workdir DIR]
+    python benchmarks/bench_suite.py --compare BASELINE RESULTS [--tolerance 0.2]
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+from benchmarks import _slurm, _tree  # NOQA: E402
+from benchmarks.bench_queries import clusters, queries, run_queries, stacks  # NOQA: E402
+
+#: Differences smaller than this are noise, whatever the tolerance
+noise_seconds = 0.005
+
+#: Parses the summaries printed by run and collect
+submitted_regex = re.compile(r'Submitted (\d+) jobs')
+collected_regex = re.compile(r'Collected (\d+) directories')
+
+
+def sbench(env, *args):
+    """Runs an sbench command in a fresh interpreter.
+
+    Returns:
+        The elapsed time, the standard output and the phases and
+        counters recorded by the command
+    """
+    with tempfile.NamedTemporaryFile(suffix='.json') as profile:
+        start = time.perf_counter()
+        p = subprocess.run(
+            [sys.executable, '-c', 'from sbench.commands import sbench; sbench()',
+             args[0], '--profile', profile.name, *args[1:]],
+            check=True, stdout=subprocess.PIPE, universal_newlines=True, cwd=root, env=env
+        )
+        elapsed = time.perf_counter() - start
+        report = json.load(profile)
+
+    return elapsed, p.stdout, {'phases': report['phases'], 'counters': report['counters']}
+
+
+def best_of(repeat, function):
+    """Calls function(i) repeat times. The function prepares the measure
+    and returns its elapsed time, the number of items processed and the
+    profile of the command.
+
+    Returns:
+        The results of the measure, with the profile of the best call
+    """
+    calls = [function(i) for i in range(repeat)]
+    elapsed, items, profile = min(calls, key=lambda call: call[0])
+    measure = {'seconds': elapsed, 'all': [call[0] for call in calls], 'items': items}
+    if profile:
+        measure.update(profile)
+    return measure
+
+
+def _items(regex, output):
+    match = regex.search(output)
+    return int(match.group(1)) if match else None
+
+
+def suite(args, directory):
+    """Runs the measures of the suite in a work directory.
+
+    Returns:
+        A dictionary mapping the name of each measure to its results
+    """
+    env = _slurm.install(os.path.join(directory, 'bin'))
+    measures = {}
+
+    def run(extra_args):
+        def function(i):
+            path = os.path.join(directory, 'run{0}-{1}'.format(len(measures), i))
+            os.makedirs(path)
+            elapsed, output, profile = sbench(env, 'run', *extra_args, path)
+            return elapsed, _items(submitted_regex, output), profile
+        return function
+
+    measures['run'] = best_of(args.repeat, run([]))
+    measures['run --array'] = best_of(args.repeat, run(['--array']))
+
+    # The first tree is collected, the second one is added to it
+    trees = [os.path.join(directory, name) for name in ('tree1', 'tree2')]
+    for seed, tree in enumerate(trees):
+        _tree.generate(
+            tree, args.dirs, seed=seed, first_job_id=100000 + seed * args.dirs,
+            clusters=clusters, stacks=stacks, days=args.days
+        )
+    # DBs holding the first tree, and both trees, that are not measured
+    populated = os.path.join(directory, 'populated.db')
+    sbench(env, 'collect', '--db', populated, trees[0])
+    both = os.path.join(directory, 'both.db')
+    shutil.copy(populated, both)
+    sbench(env, 'collect', '--db', both, trees[1])
+
+    def collect(tree, db=None):
+        def function(i):
+            path = os.path.join(directory, 'collect{0}-{1}.db'.format(len(measures), i))
+            if db:
+                shutil.copy(db, path)
+            elapsed, output, profile = sbench(env, 'collect', '--db', path, '-j', str(args.jobs), tree)
+            return elapsed, _items(collected_regex, output), profile
+        return function
+
+    measures['collect fresh'] = best_of(args.repeat, collect(trees[0]))
+    measures['collect unchanged'] = best_of(args.repeat, collect(trees[0], populated))
+    measures['collect populated'] = best_of(args.repeat, collect(trees[1], populated))
+
+    # Queries run with the pragmas set by sbench, which depend on
+    # SBENCH_SQLITE_LOCAL as for the sbench commands above
+    from sbench._sql import _sqlite_pragmas
+
+    connection = sqlite3.connect(both)
+    for pragma, value in _sqlite_pragmas().items():
+        connection.execute('PRAGMA {0}={1}'.format(pragma, value))
+    ids = [jobid for jobid, in connection.execute('SELECT "id" FROM "Jobs"')]
+    last = _tree.first_start.replace(tzinfo=None) + datetime.timedelta(days=args.days)
+    timings = [
+        run_queries(connection, ids, last - datetime.timedelta(days=30))
+        for _ in range(args.repeat)
+    ]
+    connection.close()
+    for name in queries:
+        measures['query: ' + name] = {
+            'seconds': min(t[name] for t in timings), 'all': [t[name] for t in timings], 'items': None
+        }
+
+    return measures
+
+
+def _commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'describe', '--always', '--dirty'], cwd=root,
+            stderr=subprocess.DEVNULL, universal_newlines=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, results, tolerance):
+    """Prints the measures of two sets of results side by side.
+
+    Returns:
+        The names of the measures that are slower in ``results`` by
+        more than the tolerance
+    """
+    if baseline['parameters'] != results['parameters']:
+        print('WARNING: the results were measured with different parameters')
+
+    print('{0:<48} {1:>14} {2:>14} {3:>8}'.format(
+        'measure', baseline['commit'] or 'baseline', results['commit'] or 'results', 'ratio'
+    ))
+    regressions = []
+    for name, measure in results['measures'].items():
+        if name not in baseline['measures']:
+            continue
+        before, after = baseline['measures'][name]['seconds'], measure['seconds']
+        slower = after > before * (1 + tolerance) and after - before > noise_seconds
+        if slower:
+            regressions.append(name)
+        print('{0:<48} {1:>13.3f}s {2:>13.3f}s {3:>8.2f}{4}'.format(
+            name, before, after, after / before if before else float('inf'),
+            '  SLOWER' if slower else ''
+        ))
+    return regressions
+
+
+def report(regressions):
+    """Prints the regressions found by ``compare``.
+
+    Returns:
+        The exit status of the suite
+    """
+    for name in regressions:
+        print('FAILED: {0} is slower than the baseline'.format(name))
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dirs', type=int, default=5000,
+                        help='Number of result directories of each tree')
+    parser.add_argument('--days', type=int, default=365,
+                        help='Number of days over which the jobs are spread')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='Number of processes used by collect')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of measures, the best one is kept')
+    parser.add_argument('--output', default=None,
+                        help='JSON file where the results are written')
+    parser.add_argument('--baseline', default=None,
+                        help='JSON file with the results the new ones are compared to')
+    parser.add_argument('--compare', nargs=2, default=None, metavar=('BASELINE', 'RESULTS'),
+                        help='Compare two JSON files of results, without running the suite')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Relative slowdown reported as a regression')
+    parser.add_argument('--workdir', default=None,
+                        help='Directory where the results are generated')
+    args = parser.parse_args()
+
+    if args.compare:
+        files = []
+        for filename in args.compare:
+            with open(filename) as f:
+                files.append(json.load(f))
+        return report(compare(files[0], files[1], args.tolerance))
+
+    if args.workdir:
+        os.makedirs(args.workdir, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=args.workdir) as directory:
+        measures = suite(args, directory)
+
+    results = {
+        'commit': _commit(),
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': {'dirs': args.dirs, 'days': args.days, 'jobs': args.jobs, 'repeat': args.repeat},
+        'measures': measures
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            return report(compare(json.load(f), results, args.tolerance))
+
+    for name, measure in measures.items():
+        rate = ''
+        if measure['items']:
+            rate = '{0:>10.1f} items/s'.format(measure['items'] / measure['seconds'])
+        print('{0:<48} {1:>9.3f}s {2}'.format(name, measure['seconds'], rate))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,3 +1,2 @@
-from . import osu  # NOQA: F401
-from . import hpl  # NOQA: F401
-from . import slurm  # NOQA: F401
+# Benchmark modules are imported lazily by the registries in
+# sbench.commands, the first time one of their tests is used
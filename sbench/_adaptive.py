@@ -0,0 +1,198 @@
+"""Adaptive repetition of noisy tests.
+
+A single run of a test is often not enough to tell a regression from
+noise, but running every configuration many times wastes node-hours on
+the ones that are stable. In adaptive mode, ``sbench run`` reads the
+results already in the DB and only submits the configurations whose
+confidence interval is still too wide:
+
+1. configurations with less than ``min_runs`` results are run until
+   they have ``min_runs``, as the variance can't be estimated before;
+2. for the others, the 95% confidence interval of the mean of each x
+   (e.g. each message size) is computed from the sample variance, and
+   the configuration is run again if the interval of some x is wider
+   than the target, relative to the mean;
+3. no configuration is run more than ``max_runs`` times.
+
+Results are only counted if they are recent enough, so that the
+repetitions of a campaign aren't mixed with older, maybe different,
+software. The runs of the campaign that are not in the DB yet, because
+they are still queued or not collected, are counted as pending: they
+are deducted from the repetitions, so that they aren't submitted again.
+"""
+import datetime
+import math
+import os.path
+
+import sqlalchemy
+from sqlalchemy import DateTime
+
+from ._parsing import metrics, series, spec
+from ._rollups import Summary, is_reduced
+
+#: Target half-width of the confidence intervals, relative to the mean
+target = 0.05
+
+#: Minimum and maximum number of runs of a configuration
+min_runs = 3
+max_runs = 10
+
+#: Quantiles of Student's t distribution for 95% confidence intervals,
+#: indexed by the degrees of freedom, above which the normal one is used
+_t95 = (
+    None, 12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042
+)
+
+
+def _t(dof):
+    return _t95[dof] if dof < len(_t95) else 1.960
+
+
+def relative_width(summary):
+    """Returns the half-width of the 95% confidence interval of the
+    mean of some results, relative to the mean. Infinite if there are
+    less than 2 results.
+    """
+    if summary.count < 2:
+        return math.inf
+    if summary.mean == 0:
+        return 0.0 if summary.m2 == 0 else math.inf
+    sem = math.sqrt(summary.variance / summary.count)
+    return _t(summary.count - 1) * sem / abs(summary.mean)
+
+
+def repetitions(summaries, target=target, max_runs=max_runs, pending=0):
+    """Returns how many more times a configuration should run.
+
+    Args:
+        summaries (dict): maps each x of the configuration to the
+            ``Summary`` of its results
+        target (float): target half-width of the confidence intervals,
+            relative to the mean
+        max_runs (int): maximum number of runs of the configuration
+        pending (int): runs of the configuration that were submitted,
+            but whose results are not in ``summaries`` yet
+
+    Returns:
+        The number of runs to be submitted (0 if the configuration
+        converged, used its budget or waits for its pending runs), the
+        number of runs so far, and the x with the widest confidence
+        interval and its relative width, or None if there are no results
+    """
+    runs = max((s.count for s in summaries.values()), default=0)
+    budget = max(max_runs - runs - pending, 0)
+    if runs < min_runs:
+        return min(max(min_runs - runs - pending, 0), budget), runs, None
+
+    x, summary = max(summaries.items(), key=lambda item: relative_width(item[1]))
+    width = relative_width(summary)
+    if width <= target:
+        return 0, runs, (x, width)
+
+    # Runs needed if the variance stays the same, as the width
+    # decreases with the square root of the number of runs
+    needed = math.ceil(runs * (width / target)**2)
+    more = max(needed - runs, 1) - pending
+    return min(max(more, 0), budget), runs, (x, width)
+
+
+def load(connection, parsers, since):
+    """Loads the summaries of the recent results of tests with an x axis.
+
+    Args:
+        connection: connection to the DB
+        parsers (dict): maps the name of the tests to their parser
+        since (datetime): only results of jobs started after this date
+            are loaded
+
+    Returns:
+        A dictionary mapping (cluster, compiler, mpi, test, nnodes,
+        ntasks) to a dictionary with the ``Summary`` of each x, as taken
+        by ``repetitions``. For tests with series columns or several
+        metrics, the summaries are those of each tuple of the metric,
+        the values of the series and x.
+    """
+    views = set(sqlalchemy.inspect(connection).get_view_names())
+    results = {}
+    for test, parser_cls in parsers.items():
+        x, _, higher_is_better = spec(parser_cls)
+        names = metrics(parser_cls)
+        table = parser_cls.row_cls.__table__
+        if x is None or not names or table.name + 'View' not in views:
+            continue
+
+        # Jobs that ran several problems for the same x count once, with
+        # their best result, as in the rollups
+        columns = series(parser_cls)
+        selected = ''.join('"{0}", '.format(c) for c in columns)
+        for metric in names:
+            value, group = '"{0}"'.format(metric), ''
+            if is_reduced(table, x, columns):
+                value = '{0}({1})'.format('MAX' if higher_is_better else 'MIN', value)
+                group = ' GROUP BY "cluster", "compiler", "mpi", "nnodes", "ntasks", "start", "jobid", {0}"{1}"'.format(
+                    selected, x
+                )
+            query = sqlalchemy.text(
+                'SELECT "cluster", "compiler", "mpi", "nnodes", "ntasks", "start", "jobid", {selected}"{x}", {value} '
+                'FROM "{table}View" WHERE "{metric}" IS NOT NULL AND "start" >= :since{group}'.format(
+                    x=x, selected=selected, value=value, metric=metric, table=table.name, group=group
+                )
+            ).bindparams(sqlalchemy.bindparam('since', type_=DateTime)).columns(start=DateTime)
+
+            for row in connection.execute(query, {'since': since}):
+                cluster, compiler, mpi, nnodes, ntasks, start, jobid = row[:7]
+                # The metric and series of the x, for tests that have them
+                point = ((metric,) if len(names) > 1 else ()) + tuple(row[7:-1])
+                point = point if len(point) > 1 else point[0]
+                sizes = results.setdefault((cluster, compiler, mpi, test, nnodes, ntasks), {})
+                sizes.setdefault(point, Summary()).add(row[-1], start, jobid)
+
+    return results
+
+
+def key(context):
+    """Returns the key of the configuration of a test in the results
+    returned by ``load``.
+    """
+    return (
+        context['cluster'], context['compiler'], context['mpi'], context['name'],
+        context['nnodes'], context['ntasks']
+    )
+
+
+def pending(connection, jobs, since):
+    """Counts the runs of each configuration that were submitted in a
+    campaign, but are not in the DB yet. Runs submitted before ``since``
+    are not counted, as their results wouldn't be either: this also
+    forgets the jobs that failed, and will never be collected.
+
+    Args:
+        connection: connection to the DB
+        jobs (dict): jobs of the campaign, as returned by
+            ``_campaign.load``
+        since (datetime): only runs submitted after this date are counted
+
+    Returns:
+        A dictionary mapping the key of each configuration, as returned
+        by ``key``, to its number of pending runs
+    """
+    collected = set()
+    if jobs and 'IngestionManifest' in sqlalchemy.inspect(connection).get_table_names():
+        collected = {uuid for uuid, in connection.execute(sqlalchemy.text('SELECT "uuid" FROM "IngestionManifest"'))}
+
+    counts = {}
+    for tests in jobs.values():
+        for directory, context in tests.items():
+            if os.path.basename(directory) in collected:
+                continue
+            # The context is written when the run is submitted
+            try:
+                submitted = os.path.getmtime(os.path.join(directory, 'context.json'))
+            except OSError:
+                continue
+            if datetime.datetime.fromtimestamp(submitted) >= since:
+                counts[key(context)] = counts.get(key(context), 0) + 1
+
+    return counts
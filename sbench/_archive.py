@@ -0,0 +1,57 @@
+import os.path
+import posixpath
+import tarfile
+
+from .slurm import SlurmJob
+
+#: Names of the files read from the result directories of an archive
+patterns = ('context.json',) + tuple(SlurmJob.patterns.values())
+
+
+def is_archive(path):
+    """Returns True if path is a tarball that can be collected."""
+    return os.path.isfile(path) and tarfile.is_tarfile(path)
+
+
+def _is_needed(name):
+    return name == 'context.json' or any(
+        name.endswith(pattern[1:]) for pattern in patterns[1:]
+    )
+
+
+def iter_directories(filename):
+    """Reads the result directories stored in a tarball, in a single
+    sequential pass and without extracting anything on disk.
+
+    Only the files needed to ingest a directory are kept in memory, one
+    directory at a time. This relies on tar storing the files of each
+    directory next to each other, which is the case for archives made
+    by ``tar`` from a tree of result directories.
+
+    Args:
+        filename (path): tarball, possibly compressed
+
+    Yields:
+        The path of each result directory, made of the path of the
+        tarball and of the directory in the tarball, and a dictionary
+        mapping the names of its files to their content
+    """
+    with tarfile.open(filename, 'r|*') as archive:
+        current, contents = None, {}
+        for member in archive:
+            if not member.isfile():
+                continue
+
+            dirname, name = posixpath.split(member.name)
+            if not _is_needed(name):
+                continue
+
+            if dirname != current:
+                if 'context.json' in contents:
+                    yield os.path.join(filename, current), contents
+                current, contents = dirname, {}
+
+            contents[name] = archive.extractfile(member).read()
+
+        if 'context.json' in contents:
+            yield os.path.join(filename, current), contents
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+import os.path
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+
+#: Keys of a fingerprint that identify the content of a directory
+fingerprint_keys = ('root', 'context_size', 'context_mtime') + tuple(
+    suffix + attr for suffix in ('out', 'env', 'start', 'finished')
+    for attr in ('_name', '_size', '_mtime')
+)
+
+
+def key(fingerprint):
+    """Returns the key of a directory in the cache, computed from the
+    metadata of its files as recorded by ``_manifest.scan``.
+    """
+    values = [fingerprint.get(k) for k in fingerprint_keys]
+    return hashlib.sha1(json.dumps(values).encode()).hexdigest()
+
+
+class ParseCache(object):
+    """Records parsed by ``collect``, shared by all the DBs collected
+    from the same directories.
+
+    Records are stored compressed in a SQLite file, keyed on the
+    metadata of the files of their directory. Each record also stores
+    the versions of the parsers that produced it, and is ignored if any
+    of them changed. The least recently used records are evicted when
+    the cache exceeds its maximum size.
+
+    The cache must only be used by a single process at a time, but it
+    can be shared by its threads (e.g. the one feeding a pool of workers).
+
+    Args:
+        filename (path): file of the cache, created if needed
+        max_size (int): maximum size of the records, in bytes
+        versions: function returning the versions of the parsers of
+            a test, given its name
+    """
+    def __init__(self, filename, max_size, versions):
+        directory = os.path.dirname(os.path.abspath(filename))
+        os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS "records" ('
+            '"key" TEXT PRIMARY KEY, "record" BLOB, "size" INTEGER, "used" REAL)'
+        )
+        self.max_size = max_size
+        self.versions = versions
+        #: Number of lookups that found a record, or didn't
+        self.hits, self.misses = 0, 0
+        self._used = []
+
+    def get(self, fingerprint):
+        """Returns the record of a directory, or None if it isn't in
+        the cache or if it was parsed by other versions of the parsers.
+        """
+        k = key(fingerprint)
+        with self._lock:
+            row = self.connection.execute(
+                'SELECT "record" FROM "records" WHERE "key" = ?', (k,)
+            ).fetchone()
+
+        record = None
+        if row is not None:
+            versions, record = pickle.loads(zlib.decompress(row[0]))
+            if versions != self.versions(record['name']):
+                record = None
+
+        if record is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._used.append(k)
+        return record
+
+    def put(self, record):
+        """Stores the record of a directory, parsed by ``_try_ingest``."""
+        fingerprint = record.get('manifest')
+        if 'job' not in record or not fingerprint:
+            return
+
+        data = zlib.compress(pickle.dumps(
+            (self.versions(record['name']), record), pickle.HIGHEST_PROTOCOL
+        ))
+        with self._lock:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO "records" VALUES (?, ?, ?, ?)',
+                (key(fingerprint), data, len(data), time.time())
+            )
+
+    def close(self):
+        """Records the use of the records that were hit, evicts the
+        least recently used records and closes the cache.
+        """
+        now = time.time()
+        self.connection.executemany(
+            'UPDATE "records" SET "used" = ? WHERE "key" = ?',
+            [(now, k) for k in self._used]
+        )
+        self.connection.execute(
+            'DELETE FROM "records" WHERE "key" IN ('
+            'SELECT "key" FROM (SELECT "key", SUM("size") OVER '
+            '(ORDER BY "used" DESC, "key") AS "total" FROM "records") '
+            'WHERE "total" > ?)', (self.max_size,)
+        )
+        self.connection.commit()
+        self.connection.close()
@@ -0,0 +1,130 @@
+import concurrent.futures
+import json
+import os
+import os.path
+
+#: Name of the file, at the root of a campaign, that lists its jobs
+filename = 'campaign.json'
+
+#: The steps of a pack after the first one write their files, and have
+#: their results stored, under the id of their job plus a multiple of
+#: this. Slurm job ids are smaller (MaxJobId can't exceed 67043328),
+#: except on federated clusters, whose jobs can't be packed.
+pack_step_base = 2**26
+
+#: Maximum number of steps of a pack, so that their ids fit in the
+#: 32-bit integers of the DB
+max_pack_steps = 2**31 // pack_step_base - 1
+
+
+def load(directory):
+    """Loads the manifest of the campaign run in a directory.
+
+    Args:
+        directory (path): directory passed to ``sbench run``
+
+    Returns:
+        A dictionary mapping each job id to the test directories it runs,
+        and each test directory to its context. The dictionary is empty
+        if no campaign was submitted in the directory.
+    """
+    manifest = os.path.join(directory, filename)
+    if not os.path.exists(manifest):
+        return {}
+
+    with open(manifest) as f:
+        jobs = json.load(f)['jobs']
+
+    # Test directories are stored relative to the campaign, so that the
+    # tree can be moved or extracted elsewhere. Manifests written before
+    # hold absolute paths, that are left as they are by the join.
+    return {
+        job_id: {os.path.normpath(os.path.join(directory, d)): c for d, c in tests.items()}
+        for job_id, tests in jobs.items()
+    }
+
+
+def save(directory, jobs):
+    """Adds jobs to the manifest of the campaign run in a directory.
+
+    Args:
+        directory (path): directory passed to ``sbench run``
+        jobs (dict): maps job ids to test directories, and test
+            directories to their context
+    """
+    all_jobs = load(directory)
+    all_jobs.update(jobs)
+    all_jobs = {
+        job_id: {os.path.relpath(os.path.abspath(d), os.path.abspath(directory)): c for d, c in tests.items()}
+        for job_id, tests in all_jobs.items()
+    }
+
+    manifest = os.path.join(directory, filename)
+    with open(manifest + '.tmp', 'w') as f:
+        json.dump({'jobs': all_jobs}, f, indent=2)
+    os.replace(manifest + '.tmp', manifest)
+
+
+def pack_step_id(job_id, step):
+    """Returns the key of a step of a pack in a campaign, which is
+    ``<job id>+<step>``. The first step is listed under the id of the
+    job, so that a pack of one test is listed as a job of its own.
+
+    Raises:
+        ValueError: if the id of the job is too large for the id of its
+            steps to be told apart from those of other jobs
+    """
+    if step == 0:
+        return job_id
+    if int(job_id) >= pack_step_base:
+        raise ValueError(
+            'the tests of job {0} can\'t be given job ids of their own: '
+            'the ids of federated clusters are too large to pack tests'.format(job_id)
+        )
+    return '{0}+{1}'.format(job_id, step)
+
+
+def job_tag(job_id):
+    """Returns the id under which a job of a campaign writes its files,
+    which for the steps of a pack is the id of the job plus a multiple of
+    ``pack_step_base``.
+    """
+    job_id, _, step = job_id.partition('+')
+    return str(int(job_id) + int(step) * pack_step_base) if step else job_id
+
+
+def slurm_job_id(job_id):
+    """Returns the id reported by sacct for a job of a campaign, which is
+    the id of the job itself for the steps of a pack.
+    """
+    return job_id.partition('+')[0]
+
+
+def job_ids(jobs):
+    """Returns the ids of the jobs submitted to Slurm, in a campaign where
+    the tasks of job arrays are listed as ``<array id>_<task id>`` and the
+    steps of packs by ``pack_step_id``.
+    """
+    ids = []
+    for job_id in jobs:
+        job_id = slurm_job_id(job_id).split('_')[0]
+        if job_id not in ids:
+            ids.append(job_id)
+    return ids
+
+
+def directories(jobs):
+    """Returns all the test directories of a campaign."""
+    return [d for job in jobs.values() for d in job]
+
+
+def missing(jobs, nthreads=16):
+    """Returns the test directories of a campaign that don't exist, e.g.
+    because they were moved or deleted since the jobs were submitted.
+    On parallel filesystems, the directories are checked by a pool of
+    threads.
+    """
+    paths = directories(jobs)
+    with concurrent.futures.ThreadPoolExecutor(nthreads) as executor:
+        exist = list(executor.map(os.path.isdir, paths))
+    return [d for d, ok in zip(paths, exist) if not ok]
@@ -0,0 +1,209 @@
+import numpy
+
+#: Number of groups resampled at once by the bootstrap
+bootstrap_block = 4096
+
+
+def load(connection, table, x, metric, nruns, date=None, higher_is_better=True, series=()):
+    """Loads the results of the most recent jobs of a test as numpy
+    arrays.
+
+    Jobs are ranked in the DB, so that only the results of the
+    ``nruns`` most recent jobs of each cluster, compiler, mpi and number
+    of nodes are loaded (on each side of ``date``, if given). Jobs that
+    ran several problems for the same x and series (e.g. HPL sweeps)
+    are reduced to their best result.
+
+    Args:
+        connection: connection to the DB
+        table: table of results of the test
+        x (str): column of the x axis, or None
+        metric (str): column compared
+        nruns (int): number of jobs loaded for each configuration
+        date (datetime): date splitting the jobs in two sides
+        higher_is_better (bool): whether the best result of a job is
+            the highest or the lowest
+        series (tuple): columns telling apart the series of the test,
+            as returned by ``_parsing.series``
+
+    Returns:
+        A dictionary with the cluster, compiler, mpi, nnodes, start, x,
+        value and series of each row of results, and a dictionary with
+        the labels of the codes stored for cluster, compiler, mpi and
+        series (the tuples of the values of the series columns)
+    """
+    side = ', j."start" >= \'{0}\''.format(date) if date else ''
+    # Results are only reduced if a job can have several of them for the
+    # same x, as grouping makes the query slower
+    value, group = 'v."{0}"'.format(metric), ''
+    selected = ''.join(', v."{0}"'.format(c) for c in series)
+    if {c.name for c in table.primary_key.columns} - {'cluster', 'jobid', x} - set(series):
+        value = '{0}({1})'.format('MAX' if higher_is_better else 'MIN', value)
+        group = ' GROUP BY v."cluster", v."jobid", v."compiler", v."mpi", v."nnodes", v."start"'
+        group += (', v."{0}"'.format(x) if x else '') + selected
+    query = (
+        'WITH "ranked" AS ('
+        'SELECT j."cluster", j."id", ROW_NUMBER() OVER ('
+        'PARTITION BY j."cluster", j."compiler", j."mpi", j."nnodes"{side} '
+        'ORDER BY j."start" DESC) AS "rank" FROM "Jobs" AS j '
+        'WHERE EXISTS (SELECT 1 FROM "{table}" AS r '
+        'WHERE r."cluster" = j."cluster" AND r."jobid" = j."id")) '
+        'SELECT v."cluster", v."compiler", v."mpi", v."nnodes", v."start", {x}, {value}{selected} '
+        'FROM "{table}View" AS v JOIN "ranked" AS k '
+        'ON v."cluster" = k."cluster" AND v."jobid" = k."id" '
+        'WHERE k."rank" <= {nruns} AND v."{metric}" IS NOT NULL{group}'
+    ).format(
+        side=side, table=table.name, metric=metric, nruns=int(nruns),
+        x='v."{0}"'.format(x) if x else '0', value=value, selected=selected, group=group
+    )
+    # Rows are fetched with the DBAPI cursor, as there's no need
+    # for the rows of SQLAlchemy
+    cursor = connection.connection.cursor()
+    try:
+        cursor.execute(query)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    columns = list(zip(*rows)) or [()] * (7 + len(series))
+    data = {
+        'nnodes': numpy.array([-1 if v is None else v for v in columns[3]], dtype='int64'),
+        'start': numpy.array(columns[4], dtype='datetime64[us]'),
+        'x': numpy.array(columns[5], dtype='int64'),
+        'value': numpy.array(columns[6], dtype='float64'),
+    }
+    # Strings are stored as codes, which are much faster to group
+    labels = {}
+    for name, values in zip(('cluster', 'compiler', 'mpi'), columns):
+        codes = {}
+        data[name] = numpy.array(
+            [codes.setdefault(v or '', len(codes)) for v in values], dtype='int64'
+        )
+        labels[name] = numpy.array(list(codes), dtype=object)
+
+    codes = {}
+    values = list(zip(*columns[7:])) if series else [()] * len(rows)
+    data['series'] = numpy.array([codes.setdefault(v, len(codes)) for v in values], dtype='int64')
+    labels['series'] = numpy.empty(len(codes), dtype=object)
+    labels['series'][:] = list(codes)
+
+    return data, labels
+
+
+def group(arrays):
+    """Numbers the distinct combinations of values of some arrays.
+
+    Returns:
+        The group of each element, and the index of the first element
+        of each group
+    """
+    code = numpy.zeros(len(arrays[0]), dtype='int64')
+    for a in arrays:
+        _, inverse = numpy.unique(a, return_inverse=True)
+        code = code * (inverse.max() + 1 if len(inverse) else 1) + inverse.ravel()
+
+    _, first, gid = numpy.unique(code, return_index=True, return_inverse=True)
+    return gid.ravel(), first
+
+
+def latest(gid, ngroups, start, value, nruns):
+    """Gathers the values of the ``nruns`` most recent runs of each group.
+
+    Returns:
+        An array with a row per group, where the values of the group
+        come first and are followed by NaNs, and the number of values
+        in each group
+    """
+    # Sort by group, then from the most recent run to the oldest
+    when = start.astype('int64')
+    order = numpy.lexsort((-when, gid))
+    gid, value = gid[order], value[order]
+
+    n = numpy.bincount(gid, minlength=ngroups)
+    rank = numpy.arange(len(gid)) - (numpy.cumsum(n) - n)[gid]
+    keep = rank < nruns
+    n = numpy.minimum(n, nruns)
+
+    padded = numpy.full((ngroups, n.max() if ngroups else 0), numpy.nan)
+    padded[gid[keep], rank[keep]] = value[keep]
+    return padded, n
+
+
+def medians(padded, n):
+    """Returns the median of the values of each group, NaN if empty."""
+    if not padded.shape[1]:
+        return numpy.full(len(n), numpy.nan)
+    ordered = numpy.sort(padded, axis=1)
+    rows = numpy.arange(len(n))
+    low, high = numpy.maximum((n - 1) // 2, 0), numpy.maximum(n // 2, 0)
+    m = (ordered[rows, low] + ordered[rows, high]) / 2
+    m[n == 0] = numpy.nan
+    return m
+
+
+def bootstrap_medians(padded, n, nboot, rng):
+    """Computes the median of ``nboot`` resamples of each group.
+
+    The values of each group are sorted first, so that the median of a
+    resample only depends on the indices drawn. Groups with the same
+    number of values share the same ``nboot`` draws of indices: the
+    interval of each group is still a bootstrap interval, but the
+    intervals of different groups are correlated.
+
+    Returns:
+        An array with a row of ``nboot`` medians per group
+    """
+    ordered = numpy.sort(padded, axis=1)
+    result = numpy.full((len(n), nboot), numpy.nan)
+    for k in numpy.unique(n[n > 0]):
+        rows = numpy.flatnonzero(n == k)
+        idx = numpy.sort(rng.integers(0, k, size=(nboot, k)), axis=1)
+        low, high = idx[:, (k - 1) // 2], idx[:, k // 2]
+        for i in range(0, len(rows), bootstrap_block):
+            block = ordered[rows[i:i + bootstrap_block]]
+            result[rows[i:i + bootstrap_block]] = (block[:, low] + block[:, high]) / 2
+    return result
+
+
+def compare(base, candidate, higher_is_better, nboot=1000, confidence=0.95, seed=0):
+    """Compares the median of the candidate and baseline values of each
+    group, with a bootstrap confidence interval of their ratio.
+
+    Args:
+        base (tuple): padded values and counts returned by ``latest``
+        candidate (tuple): same, for the values compared to the baseline
+        higher_is_better (bool): orientation of the metric
+        nboot (int): number of bootstrap resamples
+        confidence (float): level of the confidence interval
+        seed (int): seed of the random generator
+
+    Returns:
+        A dictionary with the baseline and candidate medians, and the
+        ratio of performance (below 1 if the candidate is worse) with
+        the bounds of its confidence interval. Groups with no values on
+        one side are NaN.
+    """
+    rng = numpy.random.default_rng(seed)
+    point, boot = [], []
+    for padded, n in (base, candidate):
+        point.append(medians(padded, n))
+        boot.append(bootstrap_medians(padded, n, nboot, rng))
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        if higher_is_better:
+            ratio, boot_ratio = point[1] / point[0], boot[1] / boot[0]
+        else:
+            ratio, boot_ratio = point[0] / point[1], boot[0] / boot[1]
+
+    low, high = numpy.full(len(ratio), numpy.nan), numpy.full(len(ratio), numpy.nan)
+    valid = numpy.isfinite(ratio)
+    if valid.any():
+        alpha = (1 - confidence) / 2
+        low[valid], high[valid] = numpy.quantile(
+            boot_ratio[valid], [alpha, 1 - alpha], axis=1
+        )
+
+    return {
+        'base': point[0], 'candidate': point[1],
+        'ratio': ratio, 'low': low, 'high': high
+    }
@@ -0,0 +1,91 @@
+"""Discovery of the result directories of a tree.
+
+Each directory is listed once with ``os.scandir``, and the entries of
+its files are handed to the caller, so that the files of a job are
+found without listing the directory again (e.g. one glob per kind of
+file). On parallel filesystems, each listing is a round trip to the
+metadata servers: directories are listed by a pool of threads, so that
+the latency of a listing is hidden by the ones running at the same
+time. Directories are still returned in a deterministic order, the
+order in which a breadth-first walk would find them.
+"""
+import collections
+import concurrent.futures
+import os
+
+#: Default number of threads listing directories
+threads = 16
+
+#: Number of directories listed ahead of the ones being returned, per
+#: thread, which bounds the memory used by the listings
+_lookahead = 64
+
+
+def list_files(root):
+    """Lists a directory once.
+
+    Returns:
+        The ``os.DirEntry`` of its subdirectories (including symbolic
+        links to directories), and a dictionary mapping the names of
+        the other entries to their ``os.DirEntry``
+    """
+    dirs, files = [], {}
+    with os.scandir(root) as it:
+        for entry in it:
+            if entry.is_dir():
+                dirs.append(entry)
+            else:
+                files[entry.name] = entry
+    return dirs, files
+
+
+def _visit(root, recurse, visit):
+    # Directories that can't be listed are skipped, as in os.walk
+    try:
+        dirs, files = list_files(root)
+    except OSError:
+        return [], None
+    # Symbolic links are not followed, as in os.walk
+    subdirs = [entry.path for entry in dirs if not entry.is_symlink()] if recurse else []
+    if (recurse and dirs) or 'context.json' not in files:
+        return subdirs, None
+    return subdirs, (root, files) if visit is None else visit(root, files)
+
+
+def _discover(roots, recurse, visit, nthreads):
+    with concurrent.futures.ThreadPoolExecutor(nthreads) as executor:
+        queue, running = collections.deque(roots), collections.deque()
+        while queue or running:
+            while queue and len(running) < nthreads * _lookahead:
+                running.append(executor.submit(_visit, queue.popleft(), recurse, visit))
+            subdirs, result = running.popleft().result()
+            queue.extend(subdirs)
+            if result is not None:
+                yield result
+
+
+def walk(directory, visit=None, nthreads=threads):
+    """Returns an iterator over the result directories of a tree, the
+    directories without subdirectories that contain a ``context.json``.
+
+    Args:
+        directory (path): root of the tree
+        visit (callable): if not None, called by the threads on each
+            result directory, with its path and the entries of its
+            files, and what it returns is yielded instead of them
+        nthreads (int): number of threads listing directories
+
+    Returns:
+        An iterator over (root, files) pairs, where files maps the names
+        of the files of the directory to their ``os.DirEntry``, or over
+        the values returned by ``visit``
+    """
+    return _discover([directory], True, visit, nthreads)
+
+
+def listed(roots, visit=None, nthreads=threads):
+    """Same as ``walk``, for a list of result directories that are known
+    in advance (e.g. from a campaign manifest). Directories that don't
+    exist or don't contain a ``context.json`` are skipped.
+    """
+    return _discover(roots, False, visit, nthreads)
@@ -0,0 +1,122 @@
+"""Schedule and analysis of the tests run between each pair of nodes
+of a job, to find slow nodes and links.
+
+Pairs are scheduled as a round-robin tournament: in each round, every
+node is in at most one pair, so that the pairs of a round run at the
+same time without sharing a node. The n (n - 1) / 2 pairs of n nodes
+are covered in n - 1 rounds (n if n is odd), and each round is run a
+second time with the roles of the nodes swapped, so that both
+directions of each link are measured.
+
+A result is scored by its ratio to the median of all the results of
+the same cluster and message size, inverted if lower values are
+better: scores below 1 are worse than the median. A link is scored by
+the median score of its results, and a node by the median score of
+its links, so that a single slow node doesn't make its peers look slow.
+"""
+import statistics
+
+
+def schedule(n):
+    """Returns the rounds of pairs that cover all the ordered pairs of
+    n nodes.
+
+    Args:
+        n (int): number of nodes
+
+    Returns:
+        A list of rounds, each one a list of (src, dst) pairs of node
+        indices, where each index appears at most once
+    """
+    # Circle method: the first node stays in place while the others
+    # rotate, and a dummy node is added if n is odd
+    nodes = list(range(n)) + ([None] if n % 2 else [])
+    m = len(nodes)
+    rounds = []
+    for _ in range(m - 1):
+        pairs = [(nodes[i], nodes[m - 1 - i]) for i in range(m // 2)]
+        rounds.append([(a, b) for a, b in pairs if a is not None and b is not None])
+        nodes = nodes[:1] + nodes[-1:] + nodes[1:-1]
+
+    return rounds + [[(b, a) for a, b in pairs] for pairs in rounds]
+
+
+def load(connection, table, metric, since=None):
+    """Loads the results of a test run between pairs of nodes.
+
+    Args:
+        connection: connection to the DB
+        table: table of results of the test
+        metric (str): column of the results
+        since (datetime): if given, only results of jobs started after
+            this date are loaded
+
+    Returns:
+        A dictionary mapping each cluster to the list of its results,
+        as (src, dst, size, value) tuples
+    """
+    # The preparators use ``schedule``, and must not load SQLAlchemy
+    import sqlalchemy
+    from sqlalchemy import DateTime
+
+    query = sqlalchemy.text(
+        'SELECT "cluster", "src", "dst", "size", "{metric}" FROM "{table}View" '
+        'WHERE "{metric}" IS NOT NULL{since}'.format(
+            metric=metric, table=table.name, since=' AND "start" >= :since' if since else ''
+        )
+    )
+    if since:
+        query = query.bindparams(sqlalchemy.bindparam('since', since, type_=DateTime))
+
+    results = {}
+    for cluster, src, dst, size, value in connection.execute(query):
+        results.setdefault(cluster, []).append((src, dst, size, value))
+    return results
+
+
+def scores(results, higher_is_better=True):
+    """Scores the links and nodes of a cluster.
+
+    Args:
+        results (list): results of the cluster, as returned by ``load``
+        higher_is_better (bool): whether higher values are better
+
+    Returns:
+        Two dictionaries, mapping each link, as a (src, dst) pair, and
+        each node to its score
+    """
+    per_size = {}
+    for src, dst, size, value in results:
+        per_size.setdefault(size, []).append(value)
+    medians = {size: statistics.median(values) for size, values in per_size.items()}
+
+    per_link = {}
+    for src, dst, size, value in results:
+        median = medians[size]
+        if higher_is_better:
+            score = value / median if median else 1.0
+        else:
+            score = median / value if value else 1.0
+        per_link.setdefault((src, dst), []).append(score)
+    links = {link: statistics.median(s) for link, s in per_link.items()}
+
+    per_node = {}
+    for (src, dst), score in links.items():
+        per_node.setdefault(src, []).append(score)
+        per_node.setdefault(dst, []).append(score)
+    nodes = {node: statistics.median(s) for node, s in per_node.items()}
+
+    return links, nodes
+
+
+def outliers(scored, threshold):
+    """Returns the items whose score is below the median by more than
+    the threshold, from the worst to the best.
+
+    Args:
+        scored (dict): scores of the links or nodes, as returned by
+            ``scores``
+        threshold (float): relative loss reported as an outlier
+    """
+    slow = [(item, score) for item, score in scored.items() if score < 1 - threshold]
+    return sorted(slow, key=lambda item_score: item_score[1])
@@ -0,0 +1,171 @@
+import datetime
+import hashlib
+import os
+import os.path
+import re
+
+from sqlalchemy import Column, DateTime, Float, Integer, String
+
+from . import _profile
+from ._sql import Base, replace_rows
+
+#: Suffixes of the files that are fingerprinted in the manifest
+suffixes = ('out', 'env', 'start', 'finished')
+
+#: Regex needed to get the id of a job from its files
+jobid_regex = re.compile(r'run\.(\d+)(?:_\d+)?\.start$')
+
+
+class ManifestRow(Base):
+    """Describes a result directory that was ingested in the DB"""
+    __tablename__ = 'IngestionManifest'
+
+    # Name of the result directory and id of the job that ran there
+    uuid = Column(String, primary_key=True, nullable=False)
+    jobid = Column(Integer, primary_key=True, nullable=False)
+    root = Column(String, nullable=False)
+    # Size in bytes and modification time of each fingerprinted file
+    out_size = Column(Integer)
+    out_mtime = Column(Float)
+    env_size = Column(Integer)
+    env_mtime = Column(Float)
+    start_size = Column(Integer)
+    start_mtime = Column(Float)
+    finished_size = Column(Integer)
+    finished_mtime = Column(Float)
+    # SHA-1 of the content of the fingerprinted files
+    digest = Column(String)
+    ingested = Column(DateTime)
+
+
+def scan(root, entries=None):
+    """Fingerprints a result directory using only file metadata.
+
+    Args:
+        root (path): directory containing the tests results
+        entries (dict): if not None, maps the names of the files in
+            ``root`` to their ``os.DirEntry``, and ``root`` is not listed
+
+    Returns:
+        A dictionary with the columns of a ``ManifestRow``, except the
+        digest, or None if the directory doesn't contain a job
+    """
+    root = os.path.abspath(root)
+    if entries is None:
+        with os.scandir(root) as it:
+            entries = {entry.name: entry for entry in it}
+
+    files, context = {}, None
+    for name in sorted(entries):
+        suffix = name.rsplit('.', 1)[-1]
+        if suffix in suffixes and suffix not in files:
+            files[suffix] = entries[name]
+        elif name == 'context.json':
+            context = entries[name]
+
+    if 'start' not in files:
+        return None
+
+    match = jobid_regex.search(files['start'].name)
+    if not match:
+        return None
+
+    fingerprint = {
+        'uuid': os.path.basename(root),
+        'jobid': int(match.group(1)),
+        'root': root
+    }
+    for suffix in suffixes:
+        entry = files.get(suffix)
+        stat = entry.stat() if entry else None
+        fingerprint[suffix + '_size'] = stat.st_size if stat else None
+        fingerprint[suffix + '_mtime'] = stat.st_mtime if stat else None
+        fingerprint[suffix + '_name'] = entry.name if entry else None
+
+    # The context is not part of the manifest, but it identifies the
+    # directory in the parse cache
+    stat = context.stat() if context else None
+    fingerprint['context_size'] = stat.st_size if stat else None
+    fingerprint['context_mtime'] = stat.st_mtime if stat else None
+
+    return fingerprint
+
+
+def digest(fingerprint):
+    """Computes the SHA-1 of the files listed in a fingerprint.
+
+    Args:
+        fingerprint (dict): fingerprint returned by ``scan``
+
+    Returns:
+        The hexadecimal digest of the files content
+    """
+    sha = hashlib.sha1()
+    for suffix in suffixes:
+        name = fingerprint[suffix + '_name']
+        if name is None:
+            continue
+        sha.update(name.encode())
+        _profile.count('files_opened')
+        _profile.count('bytes_read', fingerprint[suffix + '_size'] or 0)
+        with open(os.path.join(fingerprint['root'], name), 'rb') as f:
+            for chunk in iter(lambda: f.read(2**20), b''):
+                sha.update(chunk)
+
+    return sha.hexdigest()
+
+
+def is_unchanged(known, fingerprint):
+    """Returns True if the sizes and modification times in the
+    fingerprint match those recorded in the manifest.
+    """
+    return all(
+        known[suffix + attr] == fingerprint[suffix + attr]
+        for suffix in suffixes for attr in ('_size', '_mtime')
+    )
+
+
+def load(session):
+    """Loads the whole manifest with a single query.
+
+    Returns:
+        A dictionary mapping (uuid, jobid) to the recorded fingerprint
+    """
+    columns = ManifestRow.__table__.columns
+    query = session.query(*[getattr(ManifestRow, c.name) for c in columns])
+    return {
+        (row.uuid, row.jobid): row._asdict() for row in query
+    }
+
+
+def update(session, fingerprint):
+    """Records in the manifest that a directory was ingested."""
+    row = {
+        key: value for key, value in fingerprint.items()
+        if key in ManifestRow.__table__.columns
+    }
+    row['ingested'] = datetime.datetime.now()
+    replace_rows(
+        session, ManifestRow, [row], uuid=row['uuid'], jobid=row['jobid']
+    )
+
+
+def prune(session, directory):
+    """Removes from the manifest the directories under the path passed
+    as argument that don't exist anymore. The results that were ingested
+    from them are kept in the DB.
+
+    Returns:
+        The number of entries removed
+    """
+    directory = os.path.join(os.path.abspath(directory), '')
+    query = session.query(ManifestRow.uuid, ManifestRow.jobid, ManifestRow.root)
+    query = query.filter(ManifestRow.root.startswith(directory, autoescape=True))
+
+    removed = 0
+    for uuid, jobid, root in query.all():
+        if not os.path.isdir(root):
+            session.query(ManifestRow).filter_by(uuid=uuid, jobid=jobid).delete()
+            removed += 1
+
+    return removed
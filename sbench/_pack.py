@@ -0,0 +1,345 @@
+"""Compact storage of the result directories of a campaign.
+
+A pack is a single append-only file, made of zlib compressed blocks
+followed by an index and a footer::
+
+    magic | block | ... | block | index | footer | block | ... | index | footer
+
+Files are stored as content-addressed blobs, so identical files (empty
+error files, identical inputs, ...) are stored once. Blobs are grouped
+in blocks of about ``block_size`` bytes before being compressed, so that
+small files compress well while a directory can still be read without
+decompressing the whole pack. The environment dumps of the jobs of the
+same cluster and software are stored as a line diff against the first
+dump seen, which is stored once as a base.
+
+Each append writes the new blocks, then a new index and a new footer
+after the previous ones, so that an interrupted append never corrupts
+what was already in the pack: readers use the last complete footer.
+"""
+import collections
+import difflib
+import hashlib
+import json
+import os
+import os.path
+import re
+import struct
+import zlib
+
+#: First bytes of a pack
+magic = b'SBPACK01'
+
+#: Offset and length of the index, followed by the magic
+footer = struct.Struct('<QQ8s')
+
+#: Approximate number of bytes of blobs compressed together
+block_size = 2**17
+
+#: Number of decompressed blocks kept in memory by readers
+cached_blocks = 8
+
+#: Regex needed to get the job tag (id, or array and task ids) of a directory
+job_tag_regex = re.compile(r'^run\.(\d+(?:_\d+)?)\.start$')
+
+#: Suffix of the environment dumps, stored as diffs
+environment_suffix = '.env'
+
+
+def is_pack(path):
+    """Returns True if path is a pack."""
+    if not os.path.isfile(path):
+        return False
+    with open(path, 'rb') as f:
+        return f.read(len(magic)) == magic
+
+
+def _split_lines(data):
+    # Bytes are decoded losslessly, so that diffs can be stored as JSON
+    return data.decode('utf-8', 'surrogateescape').splitlines(keepends=True)
+
+
+def _join_lines(lines):
+    return ''.join(lines).encode('utf-8', 'surrogateescape')
+
+
+def make_diff(base, data):
+    """Returns the hunks that transform base into data, as a list of
+    ``[start, stop, lines]`` meaning that ``base[start:stop]`` is
+    replaced by ``lines``.
+    """
+    base, lines = _split_lines(base), _split_lines(data)
+    matcher = difflib.SequenceMatcher(None, base, lines, autojunk=False)
+    return [
+        [i1, i2, lines[j1:j2]]
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal'
+    ]
+
+
+def apply_diff(base, hunks):
+    """Applies the hunks returned by ``make_diff`` to base."""
+    base = _split_lines(base)
+    lines, position = [], 0
+    for start, stop, new_lines in hunks:
+        lines += base[position:start]
+        lines += new_lines
+        position = stop
+    lines += base[position:]
+    return _join_lines(lines)
+
+
+class Pack(object):
+    """A pack file, opened for reading or for appending.
+
+    Args:
+        filename (path): the pack
+        mode (str): 'r' to read an existing pack, 'a' to append to a
+            pack, which is created if needed
+    """
+    def __init__(self, filename, mode='r'):
+        self.filename = filename
+        self.mode = mode
+        # Blocks are stored as [offset, length], and blobs as [SHA-1,
+        # block, start, length], where start is the offset of the blob
+        # in the decompressed block. Other entries refer to blobs by
+        # their position in the list.
+        self.index = {'blocks': [], 'blobs': [], 'bases': {}, 'directories': {}}
+        self._modified = False
+        self._shas = {}
+        self._pending, self._pending_size = [], 0
+        self._block_cache = collections.OrderedDict()
+        self._base_cache = {}
+        self._jobs = None
+
+        if mode == 'a' and not os.path.exists(filename):
+            with open(filename, 'wb') as f:
+                f.write(magic)
+
+        self._file = open(filename, 'r+b' if mode == 'a' else 'rb')
+        if self._file.read(len(magic)) != magic:
+            raise ValueError('{0} is not a pack'.format(filename))
+
+        self._end = self._load_index()
+        self._shas = {blob[0]: i for i, blob in enumerate(self.index['blobs'])}
+
+    def _load_index(self):
+        """Loads the index of the last complete footer.
+
+        Returns:
+            The offset at which new records are appended
+        """
+        self._file.seek(0, os.SEEK_END)
+        end = self._file.tell()
+        if end == len(magic):
+            return end
+
+        if end >= len(magic) + footer.size:
+            self._file.seek(end - footer.size)
+            offset, length, tail = footer.unpack(self._file.read(footer.size))
+            if tail == magic and self._read_index(offset, length):
+                return end
+
+        # The last append was interrupted: look for the last valid footer
+        self._file.seek(0)
+        data = self._file.read()
+        position = len(data)
+        while True:
+            position = data.rfind(magic, len(magic), position)
+            if position < footer.size:
+                raise ValueError('{0} has no valid index'.format(self.filename))
+            stop = position + len(magic)
+            offset, length, _ = footer.unpack(data[stop - footer.size:stop])
+            if self._read_index(offset, length):
+                return stop
+
+    def _read_index(self, offset, length):
+        try:
+            self._file.seek(offset)
+            self.index = json.loads(zlib.decompress(self._file.read(length)))
+            return True
+        except (zlib.error, ValueError, OverflowError):
+            return False
+
+    def close(self):
+        if self._modified:
+            self._flush()
+            index = zlib.compress(json.dumps(self.index).encode())
+            self._file.seek(self._end)
+            self._file.write(index)
+            self._file.write(footer.pack(self._end, len(index), magic))
+            self._file.truncate()
+            self._end = self._file.tell()
+            self._modified = False
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _flush(self):
+        """Writes the pending blobs as a new block."""
+        if not self._pending:
+            return
+        compressed = zlib.compress(b''.join(self._pending))
+        self._file.seek(self._end)
+        self._file.write(compressed)
+        self.index['blocks'].append([self._end, len(compressed)])
+        self._end += len(compressed)
+        self._pending, self._pending_size = [], 0
+
+    def _put(self, data):
+        """Stores a blob, unless it is already in the pack.
+
+        Returns:
+            The position of the blob in the index
+        """
+        sha = hashlib.sha1(data).hexdigest()
+        if sha not in self._shas:
+            self._shas[sha] = len(self.index['blobs'])
+            self.index['blobs'].append(
+                [sha, len(self.index['blocks']), self._pending_size, len(data)]
+            )
+            self._pending.append(data)
+            self._pending_size += len(data)
+            self._modified = True
+            if self._pending_size >= block_size:
+                self._flush()
+        return self._shas[sha]
+
+    def _read_block(self, block):
+        if block == len(self.index['blocks']):
+            return b''.join(self._pending)
+
+        # Files of a directory are usually in the same block, apart from
+        # deduplicated files that are in the block where they first appeared
+        if block in self._block_cache:
+            self._block_cache.move_to_end(block)
+        else:
+            offset, length = self.index['blocks'][block]
+            self._file.seek(offset)
+            self._block_cache[block] = zlib.decompress(self._file.read(length))
+            if len(self._block_cache) > cached_blocks:
+                self._block_cache.popitem(last=False)
+        return self._block_cache[block]
+
+    def _get(self, blob):
+        _, block, start, length = self.index['blobs'][blob]
+        return self._read_block(block)[start:start + length]
+
+    def _get_base(self, blob):
+        # Bases are shared by many directories, so they are kept in memory
+        if blob not in self._base_cache:
+            self._base_cache[blob] = self._get(blob)
+        return self._base_cache[blob]
+
+    def directories(self):
+        """Returns the names of the directories in the pack, in the
+        order they were added.
+        """
+        return list(self.index['directories'])
+
+    def jobs(self):
+        """Returns a dictionary mapping the tag of each job (its id, or
+        ``<array id>_<task id>``) to the directories where it ran.
+        """
+        jobs = {}
+        for name, entry in self.index['directories'].items():
+            jobs.setdefault(entry['job'], []).append(name)
+        return jobs
+
+    def _job_directories(self, job):
+        if self._jobs is None or self._modified:
+            self._jobs = self.jobs()
+        return self._jobs.get(job, [])
+
+    def add(self, directory, name, group):
+        """Adds the files of a result directory to the pack.
+
+        Args:
+            directory (path): the result directory
+            name (str): name of the directory in the pack
+            group (str): directories of the same group share the base
+                of their environment dumps (e.g. cluster and software)
+
+        Returns:
+            The number of bytes of the files added
+        """
+        files, job, nbytes = {}, None, 0
+        for entry in sorted(os.scandir(directory), key=lambda e: e.name):
+            if not entry.is_file():
+                continue
+            with open(entry.path, 'rb') as f:
+                data = f.read()
+            nbytes += len(data)
+
+            match = job_tag_regex.match(entry.name)
+            if match:
+                job = match.group(1)
+
+            if entry.name.endswith(environment_suffix):
+                files[entry.name] = self._put_environment(data, group)
+            else:
+                files[entry.name] = self._put(data)
+
+        self.index['directories'][name] = {'job': job, 'files': files}
+        self._modified = True
+        return nbytes
+
+    def _put_environment(self, data, group):
+        base = self.index['bases'].get(group)
+        if base is None:
+            self.index['bases'][group] = self._put(data)
+            return self.index['bases'][group]
+
+        hunks = make_diff(self._get_base(base), data)
+        diff = json.dumps(hunks).encode()
+        # Unrelated dumps are stored as they are
+        if len(diff) >= len(data):
+            return self._put(data)
+        return [base, self._put(diff)]
+
+    def read(self, name):
+        """Reads the files of a directory.
+
+        Args:
+            name (str): name of the directory in the pack
+
+        Returns:
+            A dictionary mapping the names of the files to their content
+        """
+        contents = {}
+        for filename, ref in self.index['directories'][name]['files'].items():
+            if isinstance(ref, list):
+                base, diff = ref
+                contents[filename] = apply_diff(self._get_base(base), json.loads(self._get(diff)))
+            else:
+                contents[filename] = self._get(ref)
+        return contents
+
+    def read_job(self, job):
+        """Reads the directories where a job ran.
+
+        Args:
+            job (str): tag of the job, as in ``jobs``
+
+        Returns:
+            A list of pairs of directory name and content of its files
+        """
+        return [(name, self.read(name)) for name in self._job_directories(job)]
+
+
+def iter_directories(filename):
+    """Reads the result directories stored in a pack.
+
+    Yields:
+        The path of each result directory, made of the path of the pack
+        and of the name of the directory, and a dictionary mapping the
+        names of its files to their content
+    """
+    with Pack(filename) as pack:
+        for name in pack.directories():
+            contents = pack.read(name)
+            if 'context.json' in contents:
+                yield os.path.join(filename, name), contents
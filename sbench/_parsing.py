@@ -0,0 +1,134 @@
+import itertools
+import re
+
+from . import _profile
+
+#: Approximate number of bytes read at once
+buffer_size = 2**20
+
+
+def _iter_chunks(filename):
+    _profile.count('files_opened')
+    with open(filename) as f:
+        lines = f.readlines(buffer_size)
+        while lines:
+            if _profile.enabled:
+                _profile.count('bytes_read', sum(map(len, lines)))
+            yield lines
+            lines = f.readlines(buffer_size)
+
+
+def iter_lines(filename):
+    """Returns an iterator over the lines of a file. The file is read in
+    chunks of roughly ``buffer_size`` bytes, so that only a small part of
+    it is held in memory at any time.
+
+    Args:
+        filename (path): file to be read
+
+    Returns:
+        An iterator over the lines, including the trailing newline
+    """
+    return itertools.chain.from_iterable(_iter_chunks(filename))
+
+
+def match_lines(lines, regex):
+    """Returns an iterator over the matches of ``regex`` for every line
+    that matches it.
+
+    Args:
+        lines (iterable): lines to be parsed
+        regex: compiled regex, matched at the beginning of each line
+    """
+    return filter(None, map(regex.match, lines))
+
+
+def key_value_regex(keys):
+    """Builds a single regex that matches any of the ``KEY=value`` lines
+    for the keys passed as argument.
+
+    Args:
+        keys (iterable): names of the keys
+
+    Returns:
+        A compiled regex with the groups ``key`` and ``value``
+    """
+    alternatives = '|'.join(re.escape(k) for k in sorted(keys))
+    return re.compile(r'(?P<key>{0})=(?P<value>[^\n]*)$'.format(alternatives))
+
+
+def scan_key_values(lines, fields):
+    """Finds the values of a set of ``KEY=value`` lines in a single pass,
+    stopping as soon as all of them have been found.
+
+    Args:
+        lines (iterable): lines to be parsed
+        fields (dict): maps each key to a tuple containing the name under
+            which the value will be returned and a compiled regex that
+            the value must match entirely
+
+    Returns:
+        A dictionary with the values found
+    """
+    match = key_value_regex(fields).match
+    values, to_be_parsed = {}, set(fields)
+
+    for line in lines:
+        r = match(line)
+        if not r or r.group('key') not in to_be_parsed:
+            continue
+
+        name, value_regex = fields[r.group('key')]
+        value = value_regex.fullmatch(r.group('value'))
+        if value:
+            values[name] = value.group(0)
+            to_be_parsed.remove(r.group('key'))
+
+        if not to_be_parsed:
+            break
+
+    return values
+
+
+def spec(parser_cls):
+    """Returns the column of the x axis of a test (None if the test
+    has a single value per job), the column compared (the first one if
+    the parser declares several ``metrics``) and True if higher values
+    are better.
+    """
+    x = getattr(parser_cls, 'int_tag', None)
+    metric = getattr(parser_cls, 'metric', getattr(parser_cls, 'float_tag', None))
+    if metric is None:
+        metric = next(iter(getattr(parser_cls, 'metrics', ())), None)
+    return x, metric, getattr(parser_cls, 'higher_is_better', True)
+
+
+def metrics(parser_cls):
+    """Returns the columns compared and summarized for a test: the
+    ``metrics`` declared by its parser, or the one returned by ``spec``.
+    """
+    declared = tuple(getattr(parser_cls, 'metrics', ()))
+    if declared:
+        return declared
+    metric = spec(parser_cls)[1]
+    return (metric,) if metric else ()
+
+
+def series(parser_cls):
+    """Returns the columns that tell apart the series of results of a
+    test, besides its x axis (e.g. the threads and binding of STREAM).
+    Results of different series are never reduced together.
+    """
+    return tuple(getattr(parser_cls, 'series', ()))
+
+
+def series_name(test, columns, values, metric=None):
+    """Returns the name of a series of a test, e.g.
+    'stream[threads=18,binding=socket]', which is the name of the test
+    if it has no series columns. The metric is part of the name of the
+    series of tests with several ``metrics``, e.g.
+    'mdtest[metric=file_create,mode=shared]'.
+    """
+    names = ['metric={0}'.format(metric)] if metric else []
+    names += ['{0}={1}'.format(c, v) for c, v in zip(columns, values)]
+    return '{0}[{1}]'.format(test, ','.join(names)) if names else test
@@ -0,0 +1,166 @@
+"""Phase timers and counters, to find where ``run`` and ``collect``
+spend their time.
+
+Recording is disabled by default: a phase then costs a function call
+returning a shared no-op context manager, and a counter a function call
+and a test.
+
+Phases are named after the step they time (e.g. 'db.commit') and
+record the total time spent in the step and how many times it ran.
+Phases of different threads or processes overlap, so the sum of all
+phases can be larger than the elapsed time.
+"""
+import collections
+import contextlib
+import json
+import threading
+import time
+
+#: True if phases and counters are recorded
+enabled = False
+
+_lock = threading.Lock()
+_seconds = collections.Counter()
+_calls = collections.Counter()
+_counters = collections.Counter()
+_null = contextlib.nullcontext()
+
+
+class _Phase(object):
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *args):
+        elapsed = time.perf_counter() - self.start
+        with _lock:
+            _seconds[self.name] += elapsed
+            _calls[self.name] += 1
+
+
+def phase(name):
+    """Returns a context manager that times a phase.
+
+    Args:
+        name (str): name of the phase
+    """
+    return _Phase(name) if enabled else _null
+
+
+def count(name, n=1):
+    """Increments a counter by n."""
+    if enabled:
+        with _lock:
+            _counters[name] += n
+
+
+def _timed(name, iterable):
+    iterator = iter(iterable)
+    while True:
+        with _Phase(name):
+            item = next(iterator, _null)
+        if item is _null:
+            return
+        yield item
+
+
+def iterate(name, iterable):
+    """Returns an iterator over iterable, recording the time spent
+    to produce its items as a phase.
+    """
+    return _timed(name, iterable) if enabled else iterable
+
+
+def enable():
+    """Clears the phases and counters recorded so far, and starts
+    recording new ones.
+    """
+    global enabled
+    take()
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def take():
+    """Returns the phases and counters recorded so far, and clears them.
+
+    Returns:
+        A dictionary with the time and number of calls of each phase
+        and the value of each counter, that can be passed to ``merge``
+    """
+    with _lock:
+        snapshot = {
+            'seconds': dict(_seconds), 'calls': dict(_calls), 'counters': dict(_counters)
+        }
+        _seconds.clear()
+        _calls.clear()
+        _counters.clear()
+    return snapshot
+
+
+def merge(snapshot):
+    """Adds the phases and counters returned by ``take``, e.g. in
+    another process, to the ones of this process.
+    """
+    with _lock:
+        _seconds.update(snapshot['seconds'])
+        _calls.update(snapshot['calls'])
+        _counters.update(snapshot['counters'])
+
+
+def report():
+    """Returns the phases and counters recorded so far, sorted by name."""
+    with _lock:
+        return {
+            'phases': {
+                name: {'seconds': _seconds[name], 'calls': _calls[name]}
+                for name in sorted(_seconds)
+            },
+            'counters': dict(sorted(_counters.items()))
+        }
+
+
+@contextlib.contextmanager
+def profiling(command, filename=None, pstats_filename=None):
+    """Records the phases and counters of a command. Does nothing if
+    no output file is given.
+
+    Args:
+        command (str): name of the command, stored in the report
+        filename (path): JSON file where the report is written
+        pstats_filename (path): file where the statistics of cProfile
+            are written, in the format read by ``pstats``
+    """
+    if not filename and not pstats_filename:
+        yield
+        return
+
+    profiler = None
+    if pstats_filename:
+        import cProfile
+        profiler = cProfile.Profile()
+
+    enable()
+    start = time.perf_counter()
+    if profiler:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(pstats_filename)
+        elapsed = time.perf_counter() - start
+        disable()
+
+        if filename:
+            with open(filename, 'w') as f:
+                json.dump(dict(command=command, elapsed=elapsed, **report()), f, indent=2)
@@ -0,0 +1,419 @@
+"""Summary tables of the results, maintained incrementally by
+``sbench collect`` so that dashboards read a row per series and week
+instead of every result.
+
+A rollup summarizes the results of a test for a cluster, compiler, mpi,
+number of nodes, x (e.g. the message size) and week. Jobs that ran
+several problems for the same x (e.g. HPL sweeps) count once, with
+their best result, as in ``sbench compare``. Tests whose parser declares
+series columns (e.g. the threads and binding of STREAM) have a rollup per
+series, whose test is named by ``_parsing.series_name``, as do the
+metrics of tests with several of them (e.g. the rates of mdtest).
+
+Quantiles are estimated with a sketch of the distribution: values are
+counted in buckets whose bounds grow geometrically, so that any value
+of a bucket is within ``relative_accuracy`` of its center. Sketches are
+merged by adding the counts of their buckets, which doesn't depend on
+the order in which results were collected: the rollups maintained
+incrementally are the same as the ones rebuilt from scratch, up to the
+rounding errors of the sums.
+
+Variances are computed with Welford's algorithm, and merged with the
+formula of Chan et al., which are stable even when the spread of the
+results is small compared to their mean.
+"""
+import datetime
+import json
+import math
+
+import sqlalchemy
+from sqlalchemy import Column, Date, DateTime, Float, Integer, String, Text
+
+from ._parsing import metrics, series, series_name, spec
+from ._sql import Base, scopes_per_query, select_matching
+
+#: Relative accuracy of the quantiles estimated by the sketches
+relative_accuracy = 0.01
+
+#: Smallest value told apart by the sketches, smaller values are
+#: counted as this one
+min_value = 1e-12
+
+_gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+_log_gamma = math.log(_gamma)
+
+#: Columns identifying a rollup
+key_columns = ('cluster', 'compiler', 'mpi', 'test', 'nnodes', 'x', 'week')
+
+
+class RollupRow(Base):
+    """Summary of the results of a series during a week"""
+    __tablename__ = 'Rollups'
+
+    cluster = Column(String, primary_key=True, nullable=False)
+    compiler = Column(String, primary_key=True, nullable=False)
+    mpi = Column(String, primary_key=True, nullable=False)
+    test = Column(String, primary_key=True, nullable=False)
+    # -1 if unknown, and 0 for tests without an x axis
+    nnodes = Column(Integer, primary_key=True, nullable=False)
+    x = Column(Integer, primary_key=True, nullable=False)
+    # Monday of the week when the jobs started
+    week = Column(Date, primary_key=True, nullable=False)
+
+    count = Column(Integer, nullable=False)
+    min = Column(Float)
+    max = Column(Float)
+    total = Column(Float)
+    mean = Column(Float)
+    # Sum of the squared differences to the mean, and sample variance
+    m2 = Column(Float)
+    variance = Column(Float)
+    median = Column(Float)
+    p95 = Column(Float)
+    # Buckets of the sketch, as a JSON list of [index, count] pairs
+    sketch = Column(Text, nullable=False)
+    # Result of the most recent job, and when it started
+    latest = Column(Float)
+    latest_start = Column(DateTime)
+    latest_jobid = Column(Integer)
+
+
+def _bucket(value):
+    return math.ceil(math.log(max(value, min_value)) / _log_gamma)
+
+
+class Summary(object):
+    """Summary of a set of results, that can be merged with others."""
+    __slots__ = (
+        'count', 'min', 'max', 'total', 'm2', 'buckets', 'latest', 'latest_start', 'latest_jobid'
+    )
+
+    def __init__(self):
+        self.count, self.total, self.m2 = 0, 0.0, 0.0
+        self.min = self.max = None
+        self.buckets = {}
+        self.latest = self.latest_start = self.latest_jobid = None
+
+    def add(self, value, start, jobid):
+        """Adds the result of a job that started at ``start``."""
+        delta = value - self.mean
+        self.count += 1
+        self.total += value
+        self.m2 += delta * (value - self.mean)
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        i = _bucket(value)
+        self.buckets[i] = self.buckets.get(i, 0) + 1
+        if self.latest_start is None or (start, jobid) > (self.latest_start, self.latest_jobid):
+            self.latest, self.latest_start, self.latest_jobid = value, start, jobid
+
+    def merge(self, other):
+        """Adds the results summarized by another summary.
+
+        Returns:
+            This summary
+        """
+        if other.count:
+            delta = other.mean - self.mean
+            n = self.count + other.count
+            self.m2 += other.m2 + delta * delta * self.count * other.count / n
+        self.count += other.count
+        self.total += other.total
+        self.min = min(v for v in (self.min, other.min) if v is not None)
+        self.max = max(v for v in (self.max, other.max) if v is not None)
+        for i, n in other.buckets.items():
+            self.buckets[i] = self.buckets.get(i, 0) + n
+        if self.latest_start is None or (
+            (other.latest_start, other.latest_jobid) > (self.latest_start, self.latest_jobid)
+        ):
+            self.latest = other.latest
+            self.latest_start, self.latest_jobid = other.latest_start, other.latest_jobid
+        return self
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    @property
+    def variance(self):
+        """Sample variance of the results, None if there are less than 2."""
+        return self.m2 / (self.count - 1) if self.count > 1 else None
+
+    def quantile(self, q):
+        """Returns an estimate of a quantile of the results, within
+        ``relative_accuracy`` of the exact one.
+        """
+        rank = q * (self.count - 1)
+        seen = 0
+        for i in sorted(self.buckets):
+            seen += self.buckets[i]
+            if seen > rank:
+                value = 2 * _gamma**i / (_gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def row(self, key):
+        """Returns the columns of the ``RollupRow`` of the summary."""
+        row = dict(zip(key_columns, key))
+        row.update(
+            count=self.count, min=self.min, max=self.max, total=self.total,
+            mean=self.mean, m2=self.m2, variance=self.variance, median=self.quantile(0.5), p95=self.quantile(0.95),
+            sketch=json.dumps(sorted(self.buckets.items()), separators=(',', ':')),
+            latest=self.latest, latest_start=self.latest_start, latest_jobid=self.latest_jobid
+        )
+        return row
+
+    @classmethod
+    def from_row(cls, row):
+        """Returns the summary stored in a ``RollupRow``."""
+        summary = cls()
+        summary.count, summary.total, summary.m2 = row.count, row.total, row.m2
+        summary.min, summary.max = row.min, row.max
+        summary.buckets = {i: n for i, n in json.loads(row.sketch)}
+        summary.latest, summary.latest_start = row.latest, row.latest_start
+        summary.latest_jobid = row.latest_jobid
+        return summary
+
+
+def is_reduced(table, x, columns=()):
+    """Returns True if a job can have several results for the same x
+    and values of the series ``columns``.
+    """
+    return bool({c.name for c in table.primary_key.columns} - {'cluster', 'jobid', x} - set(columns))
+
+
+def _key(test, cluster, compiler, mpi, nnodes, x, start):
+    week = start.date() - datetime.timedelta(days=start.weekday())
+    return (
+        cluster, compiler or '', mpi or '', test,
+        -1 if nnodes is None else nnodes, x or 0, week
+    )
+
+
+def summarize(test, parser_cls, rows, jobs, summaries):
+    """Adds new results of a test to summaries.
+
+    Args:
+        test (str): name of the test
+        parser_cls: parser of the test
+        rows (list): new rows of results, as dictionaries with the
+            columns of ``parser_cls.row_cls``
+        jobs (dict): maps the cluster and id of the jobs of the rows
+            to their columns in ``Jobs``
+        summaries (dict): maps the key of each rollup to its ``Summary``
+    """
+    x, _, higher_is_better = spec(parser_cls)
+    best = max if higher_is_better else min
+    columns = series(parser_cls)
+    reduced = is_reduced(parser_cls.row_cls.__table__, x, columns)
+    names = metrics(parser_cls)
+    for metric in names:
+        values = {}
+        for row in rows:
+            value = row.get(metric)
+            if value is None:
+                continue
+            k = row['cluster'], row['jobid'], row.get(x) if x else None, tuple(row.get(c) for c in columns)
+            values[k] = best(values[k], value) if reduced and k in values else value
+
+        for (cluster, jobid, xvalue, series_values), value in values.items():
+            job = jobs[cluster, jobid]
+            if job.get('start') is None:
+                continue
+            # Dates are stored without their time zone
+            start = job['start'].replace(tzinfo=None)
+            name = series_name(test, columns, series_values, metric if len(names) > 1 else None)
+            k = _key(name, cluster, job['compiler'], job['mpi'], job['nnodes'], xvalue, start)
+            summaries.setdefault(k, Summary()).add(value, start, jobid)
+
+
+def update(session, summaries):
+    """Merges the summaries of new results in the rollups of the DB.
+
+    Args:
+        session (session): session to be updated
+        summaries (dict): summaries returned by ``summarize``
+    """
+    if not summaries:
+        return
+
+    table = RollupRow.__table__
+    keys, stored = list(summaries), []
+    for i in range(0, len(keys), scopes_per_query):
+        chunk = keys[i:i + scopes_per_query]
+        for row in select_matching(session, table, list(table.columns), key_columns, chunk):
+            k = tuple(getattr(row, n) for n in key_columns)
+            summaries[k] = Summary.from_row(row).merge(summaries[k])
+            stored.append(k)
+
+    # The rollups merged with new results are replaced, one by one by
+    # their primary key
+    if stored:
+        condition = sqlalchemy.and_(*[table.columns[n] == sqlalchemy.bindparam('k_' + n) for n in key_columns])
+        session.execute(table.delete().where(condition), [
+            {'k_' + n: v for n, v in zip(key_columns, k)} for k in stored
+        ])
+
+    session.execute(table.insert(), [s.row(k) for k, s in summaries.items()])
+
+
+def _results_query(parser_cls, metric, where=''):
+    """Returns the query of the results of a metric summarized in the
+    rollups of a test, one per job, x and series, with extra conditions
+    in ``where``.
+    """
+    x, _, higher_is_better = spec(parser_cls)
+    columns = series(parser_cls)
+    table = parser_cls.row_cls.__table__
+    value, group = '"{0}"'.format(metric), ''
+    selected = ''.join(', "{0}"'.format(c) for c in columns)
+    if is_reduced(table, x, columns):
+        value = '{0}({1})'.format('MAX' if higher_is_better else 'MIN', value)
+        group = ' GROUP BY "cluster", "compiler", "mpi", "nnodes", "start", "jobid"'
+        group += (', "{0}"'.format(x) if x else '') + selected
+    return sqlalchemy.text(
+        'SELECT "cluster", "compiler", "mpi", "nnodes", "start", "jobid", {x}{selected}, {value} '
+        'FROM "{table}View" WHERE "{metric}" IS NOT NULL AND "start" IS NOT NULL{where}{group}'.format(
+            x='"{0}"'.format(x) if x else '0', selected=selected, value=value, table=table.name,
+            metric=metric, where=where, group=group
+        )
+    ).columns(start=DateTime)
+
+
+def _results(test, parser_cls, metric, rows):
+    """Yields the key of the rollup, the value, the start and the job id
+    of the rows returned by ``_results_query``.
+    """
+    columns = series(parser_cls)
+    if len(metrics(parser_cls)) == 1:
+        metric = None
+    for row in rows:
+        cluster, compiler, mpi, nnodes, start, jobid, xvalue = row[:7]
+        name = series_name(test, columns, row[7:7 + len(columns)], metric)
+        yield _key(name, cluster, compiler, mpi, nnodes, xvalue, start), row[-1], start, jobid
+
+
+def rebuild(connection, parsers, chunk_size=100000):
+    """Summarizes all the results in the DB.
+
+    Args:
+        connection: connection to the DB
+        parsers (dict): maps the name of the tests to their parser
+
+    Returns:
+        A dictionary mapping the key of each rollup to its ``Summary``
+    """
+    views = set(sqlalchemy.inspect(connection).get_view_names())
+    summaries = {}
+    for test, parser_cls in parsers.items():
+        table = parser_cls.row_cls.__table__
+        if table.name + 'View' not in views:
+            continue
+
+        for metric in metrics(parser_cls):
+            query = _results_query(parser_cls, metric)
+            result = connection.execution_options(stream_results=True).execute(query)
+            for rows in result.partitions(chunk_size):
+                for k, v, start, jobid in _results(test, parser_cls, metric, rows):
+                    summaries.setdefault(k, Summary()).add(v, start, jobid)
+
+    return summaries
+
+
+def _week(k):
+    # Key of a rollup without its x, i.e. the series and the week
+    return k[:5] + k[6:]
+
+
+def _like_escape(value):
+    return ''.join('!' + c if c in '!%_' else c for c in value)
+
+
+def refresh(session, parsers, jobs):
+    """Summarizes again, from the results in the DB, the rollups of the
+    series and weeks of some jobs, e.g. after their results were
+    deleted to be replaced.
+
+    Args:
+        session (session): session to be updated
+        parsers (dict): maps the name of the tests to their parser
+        jobs (list): test, cluster, compiler, mpi, number of nodes and
+            start of each job
+    """
+    weeks = {
+        _week(_key(test, cluster, compiler, mpi, nnodes, 0, start)): (test, cluster, start)
+        for test, cluster, compiler, mpi, nnodes, start in jobs
+        if start is not None and metrics(parsers[test])
+    }
+    if not weeks:
+        return
+
+    summaries = {}
+    for week, (test, cluster, start) in weeks.items():
+        begin = datetime.datetime.combine(week[-1], datetime.time())
+        params = {'cluster': cluster, 'begin': begin, 'end': begin + datetime.timedelta(days=7)}
+        for metric in metrics(parsers[test]):
+            query = _results_query(
+                parsers[test], metric, ' AND "cluster" = :cluster AND "start" >= :begin AND "start" < :end'
+            ).bindparams(
+                sqlalchemy.bindparam('begin', type_=DateTime), sqlalchemy.bindparam('end', type_=DateTime)
+            )
+            rows = session.execute(query, params)
+            for k, v, start, jobid in _results(test, parsers[test], metric, rows):
+                # The week of the key, named after the test, not the series
+                if _week(k[:3] + (test,) + k[4:]) == week:
+                    summaries.setdefault(k, Summary()).add(v, start, jobid)
+
+    # The rollups of the series of the tests are deleted along with the
+    # ones of the tests
+    table = RollupRow.__table__
+    names = [n for n in key_columns if n != 'x']
+    condition = sqlalchemy.and_(
+        sqlalchemy.or_(
+            table.columns['test'] == sqlalchemy.bindparam('k_test'),
+            table.columns['test'].like(sqlalchemy.bindparam('k_series'), escape='!')
+        ),
+        *[table.columns[n] == sqlalchemy.bindparam('k_' + n) for n in names if n != 'test']
+    )
+    session.execute(table.delete().where(condition), [
+        dict({'k_' + n: v for n, v in zip(names, w)}, k_series=_like_escape(w[3]) + '[%') for w in weeks
+    ])
+    if summaries:
+        session.execute(table.insert(), [s.row(k) for k, s in summaries.items()])
+
+
+def load(connection):
+    """Loads the rollups stored in the DB.
+
+    Returns:
+        A dictionary mapping the key of each rollup to its ``Summary``
+    """
+    return {
+        tuple(getattr(row, n) for n in key_columns): Summary.from_row(row)
+        for row in connection.execute(sqlalchemy.select(RollupRow.__table__))
+    }
+
+
+def differences(stored, rebuilt, rel_tol=1e-9):
+    """Compares the rollups stored in the DB to rebuilt ones.
+
+    Sums and variances are compared with a tolerance, as their rounding
+    errors depend on the order in which the results were added.
+
+    Returns:
+        The sorted keys of the rollups that are missing, extra or
+        different in ``stored``
+    """
+    keys = []
+    for k in set(stored) | set(rebuilt):
+        a, b = stored.get(k), rebuilt.get(k)
+        if a is None or b is None:
+            keys.append(k)
+        elif (
+            (a.count, a.min, a.max, a.buckets, a.latest, a.latest_start, a.latest_jobid)
+            != (b.count, b.min, b.max, b.buckets, b.latest, b.latest_start, b.latest_jobid)
+            or not math.isclose(a.total, b.total, rel_tol=rel_tol)
+            or not math.isclose(a.m2, b.m2, rel_tol=rel_tol, abs_tol=rel_tol * a.count * a.mean**2)
+        ):
+            keys.append(k)
+    return sorted(keys)
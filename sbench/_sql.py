@@ -1,3 +1,529 @@
+import io
+import os
+
+import sqlalchemy
+import sqlalchemy.event
 import sqlalchemy.ext.declarative
+import sqlalchemy.orm
 
 Base = sqlalchemy.ext.declarative.declarative_base()
+
+#: Pragmas set on each new connection to a SQLite DB
+sqlite_pragmas = {
+    # Commits don't fsync the DB
+    'synchronous': 'NORMAL',
+    'temp_store': 'MEMORY',
+    # 64 MiB of page cache (negative values are in KiB)
+    'cache_size': -2**16,
+}
+
+#: Pragmas set on top of them when the DB is known to be on a local
+#: disk, i.e. when the ``SBENCH_SQLITE_LOCAL`` environment variable is
+#: set. Both rely on shared memory, which isn't shared between the hosts
+#: writing to a DB on a network filesystem (NFS, GPFS...).
+local_sqlite_pragmas = {
+    # Readers don't block the writer
+    'journal_mode': 'WAL',
+    # Memory-map up to 1 GiB of the DB file
+    'mmap_size': 2**30,
+}
+
+
+def _sqlite_pragmas():
+    """Returns the pragmas set on the connections to SQLite DBs."""
+    if os.environ.get('SBENCH_SQLITE_LOCAL', '') not in ('', '0'):
+        return dict(sqlite_pragmas, **local_sqlite_pragmas)
+    # WAL is persistent, and may have been set by previous versions
+    return dict(sqlite_pragmas, journal_mode='DELETE')
+
+
+def _set_sqlite_pragmas(pragmas):
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma, value in pragmas.items():
+            cursor.execute('PRAGMA {0}={1}'.format(pragma, value))
+        cursor.close()
+    return set_pragmas
+
+
+def is_url(db):
+    """Returns True if db is a SQLAlchemy URL, False if it is the path
+    to a SQLite DB.
+    """
+    return '://' in db
+
+
+def create_engine(db, echo=False, pool_size=5):
+    """Creates an engine tuned for bulk ingestion and analysis queries.
+    SQLite DBs are opened in WAL mode only if ``SBENCH_SQLITE_LOCAL`` is
+    set (see ``local_sqlite_pragmas``).
+
+    Args:
+        db (str): SQLAlchemy URL of the DB (e.g.
+            ``postgresql://user@host/benchmarks``), or path to a
+            SQLite DB
+        echo (bool): if True, log all the statements
+        pool_size (int): number of connections kept open to a DB
+            server, which is also the number of connections that can be
+            opened on top of them when all are in use
+
+    Returns:
+        The engine
+    """
+    url = sqlalchemy.engine.make_url(db if is_url(db) else 'sqlite:///' + db)
+    if url.get_backend_name() == 'sqlite':
+        engine = sqlalchemy.create_engine(url, echo=echo)
+        sqlalchemy.event.listen(engine, 'connect', _set_sqlite_pragmas(_sqlite_pragmas()))
+        return engine
+
+    # Connections to a server are checked before being reused, as
+    # collectors can stay idle for a long time while parsing
+    return sqlalchemy.create_engine(
+        url, echo=echo, pool_size=pool_size, max_overflow=pool_size,
+        pool_pre_ping=True
+    )
+
+
+def job_foreign_key():
+    """Returns the foreign key from a table of results to ``Jobs``.
+
+    Results refer to the job that produced them by the cluster and the
+    id of the job, which together are the primary key of ``Jobs``.
+    """
+    return sqlalchemy.ForeignKeyConstraint(
+        ['cluster', 'jobid'], ['Jobs.cluster', 'Jobs.id']
+    )
+
+
+def view_columns(table):
+    """Returns the columns of the view of a table of results.
+
+    Args:
+        table: table of results, with a foreign key to ``Jobs``
+
+    Returns:
+        A list of pairs with the name of each column in the view and
+        the column of ``Jobs`` or ``table`` it comes from
+    """
+    jobs = Base.metadata.tables['Jobs']
+    columns = [(c.name, c) for c in jobs.columns if c.name != 'id']
+    columns.append(('jobid', jobs.columns['id']))
+    columns += [
+        (c.name, c) for c in table.columns if c.name not in ('cluster', 'jobid')
+    ]
+    return columns
+
+
+def job_tables():
+    """Returns the tables of results, i.e. those that refer to ``Jobs``."""
+    return [
+        table for table in Base.metadata.sorted_tables
+        if {fk.column.table.name for fk in table.foreign_keys} == {'Jobs'}
+    ]
+
+
+def _job_views():
+    """Returns the name and definition of a view for each table of
+    results, with the results denormalized with the metadata of their
+    job.
+    """
+    views = []
+    for table in job_tables():
+        columns = []
+        for name, column in view_columns(table):
+            prefix = 'r' if column.table is table else 'j'
+            if name == column.name:
+                columns.append('{0}."{1}"'.format(prefix, name))
+            else:
+                columns.append('{0}."{1}" AS "{2}"'.format(prefix, column.name, name))
+
+        definition = (
+            'SELECT {0} FROM "{1}" AS r JOIN "Jobs" AS j '
+            'ON r."cluster" = j."cluster" AND r."jobid" = j."id"'
+        ).format(', '.join(columns), table.name)
+        views.append((table.name + 'View', definition))
+
+    return views
+
+
+def _rebuild_table(connection, table, views):
+    """Recreates a table whose primary key differs from the one in the
+    DB (e.g. ``HPL``, whose rows were once keyed by job only), and copies
+    its rows. ``create_all`` leaves existing tables as they are, and the
+    new rows would otherwise clash with the old key.
+
+    Raises:
+        ValueError: if some columns of the new key are not in the table
+    """
+    old_columns = {c['name'] for c in sqlalchemy.inspect(connection).get_columns(table.name)}
+    key = [c.name for c in table.primary_key.columns]
+    if not set(key) <= old_columns:
+        raise ValueError(
+            'the primary key of table {0} changed to ({1}), which can\'t be '
+            'filled from its columns: collect into a new DB'.format(table.name, ', '.join(key))
+        )
+
+    # The view of the table refers to it, and is recreated afterwards
+    _drop_views(connection, [table.name + 'View'], views)
+    copy = table.name + '_old'
+    connection.execute(sqlalchemy.text('CREATE TABLE "{0}" AS SELECT * FROM "{1}"'.format(copy, table.name)))
+    connection.execute(sqlalchemy.text('DROP TABLE "{0}"'.format(table.name)))
+    table.create(connection)
+
+    columns = ', '.join('"{0}"'.format(c.name) for c in table.columns if c.name in old_columns)
+    connection.execute(sqlalchemy.text(
+        'INSERT INTO "{0}" ({1}) SELECT {1} FROM "{2}" WHERE {3}'.format(
+            table.name, columns, copy, ' AND '.join('"{0}" IS NOT NULL'.format(k) for k in key)
+        )
+    ))
+    connection.execute(sqlalchemy.text('DROP TABLE "{0}"'.format(copy)))
+
+
+def _add_columns(connection, table, views):
+    """Adds the columns of a table that are missing in the DB, which
+    ``create_all`` doesn't do either. The views that select columns of
+    the table are dropped, and recreated afterwards with the new ones.
+
+    Raises:
+        ValueError: if a missing column can't be left empty in old rows
+    """
+    old_columns = {c['name'] for c in sqlalchemy.inspect(connection).get_columns(table.name)}
+    missing = [c for c in table.columns if c.name not in old_columns]
+    if not missing:
+        return
+
+    for column in missing:
+        if not column.nullable:
+            raise ValueError(
+                'column {0} of table {1} can\'t be added to the rows already '
+                'in it: collect into a new DB'.format(column.name, table.name)
+            )
+        connection.execute(sqlalchemy.text('ALTER TABLE "{0}" ADD COLUMN "{1}" {2}'.format(
+            table.name, column.name, column.type.compile(dialect=connection.dialect)
+        )))
+
+    if table.name == 'Jobs':
+        _drop_views(connection, [name for name, _ in _job_views()], views)
+    else:
+        _drop_views(connection, [table.name + 'View'], views)
+
+
+def _drop_views(connection, names, views):
+    """Drops the views among ``names`` that exist, and removes them from
+    the set ``views`` of existing views.
+    """
+    for name in names:
+        if name in views:
+            connection.execute(sqlalchemy.text('DROP VIEW "{0}"'.format(name)))
+            views.discard(name)
+
+
+def create_schema(engine):
+    """Creates the tables, indexes and views that are missing in a DB.
+
+    Indexes are created separately from tables, as ``create_all``
+    doesn't add new indexes to tables that already exist. Tables whose
+    primary key changed are rebuilt by ``_rebuild_table``, and new
+    columns are added by ``_add_columns``.
+
+    Args:
+        engine: engine connected to the DB
+
+    Raises:
+        ValueError: if a table can't be rebuilt with its new key, or
+            its new columns can't be added
+    """
+    with engine.begin() as connection:
+        inspector = sqlalchemy.inspect(connection)
+        tables, views = set(inspector.get_table_names()), set(inspector.get_view_names())
+        for table in Base.metadata.sorted_tables:
+            if table.name not in tables:
+                continue
+            key = inspector.get_pk_constraint(table.name)['constrained_columns']
+            if set(key) != {c.name for c in table.primary_key.columns}:
+                _rebuild_table(connection, table, views)
+            else:
+                _add_columns(connection, table, views)
+
+    Base.metadata.create_all(engine)
+
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+
+        # Not all backends support CREATE VIEW IF NOT EXISTS
+        views = set(sqlalchemy.inspect(connection).get_view_names())
+        for name, definition in _job_views():
+            if name not in views:
+                connection.execute(sqlalchemy.text(
+                    'CREATE VIEW "{0}" AS {1}'.format(name, definition)
+                ))
+
+
+class Session(sqlalchemy.orm.Session):
+    """Session that writes the rows added by ``insert_new_rows`` in bulk
+    when it is committed. Other sessions passed to sbench get the same
+    listeners, on the session itself, when rows are first added to them.
+    """
+
+
+def _defer_writes(session):
+    if isinstance(session, Session) or session.info.get('deferred_writes'):
+        return
+    session.info['deferred_writes'] = True
+    sqlalchemy.event.listen(session, 'before_commit', _write_new_rows)
+    sqlalchemy.event.listen(session, 'after_commit', _end_transaction)
+    sqlalchemy.event.listen(session, 'after_rollback', _end_transaction)
+
+
+def insert_new_rows(session, row_cls, rows, **scope):
+    """Inserts the rows that are not in the DB yet.
+
+    Rows are identified by the primary key of ``row_cls``. The keys
+    already present in the DB are loaded with a single query, restricted
+    to the rows matching ``scope`` (usually a job).
+
+    New rows are kept in the session and written in bulk, without
+    building ORM objects, when the session is committed: until then,
+    they are not seen by flushes and queries of the transaction, and
+    ``pending_rows`` returns them.
+
+    Args:
+        session (session): SQLite session to be updated
+        row_cls: class describing the table to be updated
+        rows (list): dictionaries with the columns of ``row_cls``
+        **scope: filters that select the part of the table to check
+
+    Returns:
+        The number of rows inserted
+    """
+    table = row_cls.__table__
+    key = [column.name for column in table.primary_key.columns]
+    existing = _known_keys(session, table, scope)
+    if existing is None:
+        query = session.query(*[getattr(row_cls, k) for k in key])
+        existing = set(query.filter_by(**scope))
+    # Rows waiting for the commit are not in the DB yet
+    pending = session.info.setdefault('new_keys', {}).setdefault(table, set())
+
+    new_rows = []
+    for row in rows:
+        row_key = tuple(row[k] for k in key)
+        if row_key not in existing and row_key not in pending:
+            pending.add(row_key)
+            new_rows.append(row)
+
+    _defer_writes(session)
+    session.info.setdefault('new_rows', {}).setdefault(table, []).extend(new_rows)
+    return len(new_rows)
+
+
+def pending_rows(session, row_cls):
+    """Returns the rows added by ``insert_new_rows`` that will be
+    written when the session is committed.
+    """
+    return session.info.get('new_rows', {}).get(row_cls.__table__, [])
+
+
+def delete_rows(session, row_cls, **scope):
+    """Deletes the rows matching ``scope``, right away, so that the rows
+    inserted afterwards by ``insert_new_rows`` are not seen as existing.
+
+    Args:
+        session (session): session to be updated
+        row_cls: class describing the table to be updated
+        **scope: filters that select the rows to be deleted
+    """
+    existing = _known_keys(session, row_cls.__table__, scope)
+    # There's nothing to delete if the keys of the scope were
+    # loaded and none was found
+    if existing is None or existing:
+        session.query(row_cls).filter_by(**scope).delete()
+    if existing:
+        existing.clear()
+
+
+def replace_rows(session, row_cls, rows, **scope):
+    """Replaces the rows matching ``scope`` by new rows. Existing rows
+    are written when the session is committed, as in ``insert_new_rows``.
+
+    Args:
+        session (session): session to be updated
+        row_cls: class describing the table to be updated
+        rows (list): dictionaries with the columns of ``row_cls``
+        **scope: filters that select the rows to be replaced
+    """
+    delete_rows(session, row_cls, **scope)
+    insert_new_rows(session, row_cls, rows, **scope)
+
+
+#: Maximum number of scopes whose keys are loaded by a single query
+scopes_per_query = 256
+
+
+def select_matching(session, table, columns, names, values):
+    """Selects the rows of a table whose columns match one of several
+    tuples of values.
+
+    SQLite doesn't use the indexes to look up an IN list of tuples, and
+    scans the whole table instead: it gets a join with the tuples, which
+    are looked up one by one in the index of the table. The query is
+    written in SQL, as SQLAlchemy names the columns of VALUES with a
+    syntax that SQLite doesn't accept.
+
+    Args:
+        session (session): session on the DB
+        table: table to be queried
+        columns (list): columns of the table to be selected
+        names (list): names of the columns matched
+        values (list): tuples of values of the columns matched
+
+    Returns:
+        The result of the query
+    """
+    matched = [table.columns[n] for n in names]
+    if session.get_bind().dialect.name != 'sqlite':
+        return session.execute(
+            sqlalchemy.select(*columns).where(sqlalchemy.tuple_(*matched).in_(values))
+        )
+
+    params = {
+        'k{0}_{1}'.format(i, j): value
+        for i, key in enumerate(values) for j, value in enumerate(key)
+    }
+    query = sqlalchemy.text(
+        'WITH "keys" ({names}) AS (VALUES {values}) '
+        'SELECT {columns} FROM "keys" JOIN "{table}" ON {on}'.format(
+            names=', '.join('"{0}"'.format(n) for n in names),
+            values=', '.join(
+                '({0})'.format(', '.join(':k{0}_{1}'.format(i, j) for j in range(len(names))))
+                for i in range(len(values))
+            ),
+            columns=', '.join('"{0}"."{1}"'.format(table.name, c.name) for c in columns),
+            table=table.name,
+            on=' AND '.join('"{0}"."{1}" = "keys"."{1}"'.format(table.name, n) for n in names)
+        )
+    ).bindparams(*[
+        sqlalchemy.bindparam(name, type_=matched[int(name.split('_')[1])].type) for name in params
+    ]).columns(*columns)
+    return session.execute(query, params)
+
+
+def load_keys(session, row_cls, scopes):
+    """Loads at once the keys of the rows matching any of several
+    scopes, so that ``insert_new_rows`` and ``replace_rows`` don't need
+    to query the DB for each of them. The keys are forgotten at the end
+    of the transaction.
+
+    Args:
+        session (session): session to be updated
+        row_cls: class describing the table
+        scopes (list): filters that select parts of the table, as
+            dictionaries with the same keys
+    """
+    if not scopes:
+        return
+
+    # The keys are forgotten by the same listeners as the new rows
+    _defer_writes(session)
+    table = row_cls.__table__
+    names = tuple(sorted(scopes[0]))
+    known = session.info.setdefault('known_keys', {}).setdefault((table, names), {})
+    values = list({tuple(scope[n] for n in names) for scope in scopes} - set(known))
+
+    # The columns of the scopes are usually part of the key
+    key = list(table.primary_key.columns)
+    selected = key + [table.columns[n] for n in names if table.columns[n] not in key]
+    positions = [selected.index(table.columns[n]) for n in names]
+    for i in range(0, len(values), scopes_per_query):
+        chunk = values[i:i + scopes_per_query]
+        for v in chunk:
+            known[v] = set()
+        for row in select_matching(session, table, selected, names, chunk):
+            known[tuple(row[p] for p in positions)].add(tuple(row[:len(key)]))
+
+
+def _known_keys(session, table, scope):
+    """Returns the keys loaded by ``load_keys`` for a scope, or None if
+    they weren't loaded.
+    """
+    names = tuple(sorted(scope))
+    known = session.info.get('known_keys', {}).get((table, names))
+    if known is None:
+        return None
+    return known.get(tuple(scope[n] for n in names))
+
+
+def _copy_value(value):
+    """Formats a value for the text format of PostgreSQL's COPY."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, str):
+        return value.replace('\\', '\\\\').replace('\t', '\\t').replace(
+            '\n', '\\n').replace('\r', '\\r')
+    return str(value)
+
+
+def _copy(connection, table, rows):
+    """Loads rows in a table of a PostgreSQL DB with COPY, which is
+    much faster than INSERT statements.
+    """
+    columns = [c.name for c in table.columns]
+    data = io.StringIO(''.join(
+        '\t'.join(_copy_value(row.get(c)) for c in columns) + '\n' for row in rows
+    ))
+    statement = 'COPY "{0}" ({1}) FROM STDIN'.format(
+        table.name, ', '.join('"{0}"'.format(c) for c in columns)
+    )
+
+    cursor = connection.connection.cursor()
+    try:
+        if hasattr(cursor, 'copy_expert'):
+            # psycopg2
+            cursor.copy_expert(statement, data)
+        else:
+            # psycopg 3
+            with cursor.copy(statement) as copy:
+                copy.write(data.getvalue())
+    finally:
+        cursor.close()
+
+
+#: Drivers whose connections support COPY
+copy_drivers = ('psycopg2', 'psycopg')
+
+
+@sqlalchemy.event.listens_for(Session, 'before_commit')
+def _write_new_rows(session):
+    """Writes the rows added by ``insert_new_rows``, a table at a time.
+
+    Rows are loaded with COPY in PostgreSQL, and with a single
+    ``executemany`` per table in other DBs.
+    """
+    new_rows = session.info.pop('new_rows', None)
+    session.info.pop('new_keys', None)
+    if not new_rows:
+        return
+
+    connection = session.connection()
+    dialect = connection.dialect
+    use_copy = dialect.name == 'postgresql' and dialect.driver in copy_drivers
+
+    # Jobs are written before their results
+    for table in Base.metadata.sorted_tables:
+        if not new_rows.get(table):
+            continue
+        columns = [c.name for c in table.columns]
+        rows = [{c: row.get(c) for c in columns} for row in new_rows[table]]
+        if use_copy:
+            _copy(connection, table, rows)
+        else:
+            connection.execute(table.insert(), rows)
+
+
+@sqlalchemy.event.listens_for(Session, 'after_commit')
+@sqlalchemy.event.listens_for(Session, 'after_rollback')
+def _end_transaction(session):
+    for name in ('new_rows', 'new_keys', 'known_keys'):
+        session.info.pop(name, None)
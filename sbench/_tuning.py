@@ -0,0 +1,181 @@
+"""Tuning of the parameters of HPL.
+
+HPL runs every combination of the problem sizes (N), block sizes (NB)
+and process grids (P x Q) listed in its input file, one after the other
+in the same job. Tuning jobs use this to sweep a grid of parameters:
+
+1. the first job of a configuration sweeps a coarse grid;
+2. each following job sweeps a grid twice as fine, centered on the
+   best result so far and restricted to its process grid;
+3. tuning stops when the steps of the grid are below ``min_n_step`` and
+   ``min_block_step``, or after ``max_rounds`` jobs.
+
+The state of the tuning is read from the results in the DB: the steps
+already reached are the smallest differences between the values swept
+by each job, so no state is kept besides the results themselves.
+"""
+from math import sqrt
+
+#: Fractions of the largest problem fitting in memory swept first
+coarse_fractions = (0.78, 0.86)
+
+#: Largest fraction of the memory used by a problem
+max_fraction = 0.9
+
+#: Block sizes swept first
+coarse_block_sizes = (128, 192, 256)
+
+#: Number of process grids swept first, the closest to square
+coarse_grids = 2
+
+#: Steps of N, relative to N, and of NB under which tuning stops
+min_n_step = 0.01
+min_block_step = 8
+
+#: Maximum number of tuning jobs of a configuration
+max_rounds = 4
+
+
+def max_problem_size(mem, nnodes):
+    """Returns the order of the largest matrix of doubles that fits
+    in the memory of the nodes.
+
+    Args:
+        mem (int): memory of a node, in GiB
+        nnodes (int): number of nodes
+    """
+    return sqrt(mem * nnodes * 2**30 / 8)
+
+
+def grids(ntasks, count):
+    """Returns the ``count`` process grids of ntasks processes that are
+    the closest to square, as (P, Q) pairs with P <= Q.
+    """
+    pairs = [(p, ntasks // p) for p in range(1, int(sqrt(ntasks)) + 1) if ntasks % p == 0]
+    pairs.sort(key=lambda pq: pq[1] - pq[0])
+    return pairs[:count]
+
+
+def _align(n, block_size):
+    return int(n) // block_size * block_size
+
+
+def _step(values):
+    """Returns the smallest difference between distinct values, 0 if
+    there is a single value.
+    """
+    values = sorted(set(values))
+    return min((b - a for a, b in zip(values, values[1:])), default=0)
+
+
+def coarse_sweep(n_max, ntasks):
+    """Returns the sweep of the first tuning job of a configuration.
+
+    Args:
+        n_max (float): largest problem fitting in memory
+        ntasks (int): number of processes
+
+    Returns:
+        A dictionary with the round of the sweep, and the lists of Ns,
+        NBs and process grids to be swept
+    """
+    block_sizes = list(coarse_block_sizes)
+    return {
+        'round': 1,
+        'Ns': [_align(f * n_max, max(block_sizes)) for f in coarse_fractions],
+        'NBs': block_sizes,
+        'grids': [list(pq) for pq in grids(ntasks, coarse_grids)],
+    }
+
+
+def next_sweep(rows, n_max, ntasks):
+    """Returns the next sweep of a configuration, given the results of
+    its previous jobs.
+
+    Jobs with a single result are not tuning jobs, and are ignored.
+
+    Args:
+        rows (list): results of the configuration, as dictionaries with
+            the jobid, N, NB, P, Q and gflops of each result
+        n_max (float): largest problem fitting in memory
+        ntasks (int): number of processes
+
+    Returns:
+        The next sweep, as returned by ``coarse_sweep``, or None if
+        tuning is done, and the best result of the previous sweeps, or
+        None if there was none
+    """
+    jobs = {}
+    for row in rows:
+        jobs.setdefault(row['jobid'], []).append(row)
+    sweeps = [job for job in jobs.values() if len(job) > 1]
+    if not sweeps:
+        return coarse_sweep(n_max, ntasks), None
+
+    best = max((row for job in sweeps for row in job), key=lambda row: row['gflops'])
+    if len(sweeps) >= max_rounds:
+        return None, best
+
+    # Each sweep is twice as fine as the finest one so far
+    n_step = min(_step(row['N'] for row in job) for job in sweeps)
+    nb_step = min(_step(row['NB'] for row in job) for job in sweeps)
+    half_nb = nb_step // 2 // min_block_step * min_block_step if nb_step > min_block_step else 0
+    block_sizes = sorted({
+        max(nb, min_block_step) for nb in (best['NB'] - half_nb, best['NB'], best['NB'] + half_nb)
+    })
+
+    half_n = _align(n_step // 2, max(block_sizes)) if n_step > min_n_step * best['N'] else 0
+    if not half_n and not half_nb:
+        return None, best
+
+    sizes = sorted({
+        _align(n, max(block_sizes)) for n in (best['N'] - half_n, best['N'], best['N'] + half_n)
+        if n <= max_fraction * n_max
+    })
+
+    return {
+        'round': len(sweeps) + 1,
+        'Ns': sizes or [_align(best['N'], max(block_sizes))],
+        'NBs': block_sizes,
+        'grids': [[best['P'], best['Q']]],
+    }, best
+
+
+def runtime(sweep, n_reference, seconds):
+    """Estimates the runtime of a sweep, in seconds.
+
+    Args:
+        sweep (dict): sweep, as returned by ``next_sweep``
+        n_reference (int): problem size whose runtime is known
+        seconds (float): runtime of a problem of size ``n_reference``
+    """
+    per_grid = sum(seconds * (n / n_reference)**3 for n in sweep['Ns'])
+    return per_grid * len(sweep['NBs']) * len(sweep['grids'])
+
+
+def load(connection):
+    """Loads the results of HPL from the DB.
+
+    Args:
+        connection: connection to the DB
+
+    Returns:
+        A dictionary mapping (cluster, compiler, mpi, nnodes) to the
+        list of results of that configuration, as taken by ``next_sweep``
+    """
+    cursor = connection.connection.cursor()
+    try:
+        cursor.execute(
+            'SELECT "cluster", "compiler", "mpi", "nnodes", "jobid", '
+            '"N", "NB", "P", "Q", "gflops" FROM "HPLView" WHERE "gflops" IS NOT NULL'
+        )
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    results = {}
+    for cluster, compiler, mpi, nnodes, jobid, n, nb, p, q, gflops in rows:
+        results.setdefault((cluster, compiler, mpi, nnodes), []).append({
+            'jobid': jobid, 'N': n, 'NB': nb, 'P': p, 'Q': q, 'gflops': gflops
+        })
+    return results
@@ -0,0 +1,149 @@
+import asyncio
+import getpass
+import os.path
+import time
+
+from . import _campaign
+
+#: Prefixes of the states of jobs that won't run anymore
+terminal_states = (
+    'BOOT_FAIL', 'CANCELLED', 'COMPLETED', 'DEADLINE', 'FAILED',
+    'NODE_FAIL', 'OUT_OF_MEMORY', 'PREEMPTED', 'TIMEOUT'
+)
+
+
+async def query_states(job_ids):
+    """Queries the state of a list of jobs with a single sacct call.
+
+    Args:
+        job_ids (list): ids of the jobs
+
+    Returns:
+        A dictionary mapping job ids, or ``<array id>_<task id>`` for
+        the tasks of job arrays, to their state. None if sacct failed.
+    """
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            'sacct', '--noheader', '--parsable2', '--allocations',
+            '--format=JobID,State', '--jobs=' + ','.join(job_ids),
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+        )
+    except OSError:
+        return None
+
+    stdout, _ = await proc.communicate()
+    if proc.returncode != 0:
+        return None
+
+    states = {}
+    for line in stdout.decode().splitlines():
+        job_id, _, state = line.partition('|')
+        states[job_id.strip()] = state.strip()
+
+    return states
+
+
+async def query_queued():
+    """Queries the jobs of the current user that are still in the queue,
+    with a single squeue call. This is used when sacct is not available,
+    e.g. on clusters without job accounting. Jobs are not selected with
+    --jobs, as squeue fails when none of them is known anymore.
+
+    Returns:
+        The ids of the jobs, and ``<array id>_<task id>`` of the tasks
+        of job arrays, that are pending or running. None if squeue
+        failed.
+    """
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            'squeue', '--noheader', '--array', '--format=%i',
+            '--user=' + getpass.getuser(),
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+        )
+    except OSError:
+        return None
+
+    stdout, _ = await proc.communicate()
+    if proc.returncode != 0:
+        return None
+
+    return {line.strip() for line in stdout.decode().splitlines()}
+
+
+def is_finished(job_id, directories):
+    """Returns True if the job wrote its ``.finished`` sentinel file in
+    every test directory it runs.
+    """
+    return all(
+        os.path.exists(os.path.join(d, 'run.{0}.finished'.format(_campaign.job_tag(job_id))))
+        for d in directories
+    )
+
+
+async def watch(jobs, ingest, interval=30.0, max_in_flight=8, echo=print, timeout=None):
+    """Ingests the test directories of a campaign as soon as their jobs
+    are done, and returns once all of them have been ingested.
+
+    At each tick the state of all the pending jobs is queried with a
+    single sacct call. A job is done when sacct reports a terminal state
+    or when it wrote all its sentinel files. If sacct fails, a job is
+    done once squeue doesn't list it anymore, so that jobs that were
+    cancelled or killed before writing their sentinel files are not
+    waited for forever.
+
+    Args:
+        jobs (dict): jobs of the campaign, as returned by
+            ``_campaign.load``
+        ingest: coroutine function called with each test directory
+        interval (float): seconds between two ticks
+        max_in_flight (int): maximum number of directories being
+            ingested at the same time
+        echo: function used to report progress
+        timeout (float): if not None, seconds after which the jobs that
+            are not done are not waited for anymore
+
+    Returns:
+        The ids of the jobs that were not done before the timeout
+    """
+    pending = dict(jobs)
+    semaphore = asyncio.Semaphore(max_in_flight)
+    in_flight = []
+    start = time.monotonic()
+
+    async def bounded_ingest(directory):
+        async with semaphore:
+            await ingest(directory)
+
+    while pending:
+        states = await query_states(_campaign.job_ids(pending))
+        queued = None
+        if states is None:
+            states = {}
+            queued = await query_queued()
+
+        for job_id in list(pending):
+            slurm_id = _campaign.slurm_job_id(job_id)
+            state = states.get(slurm_id, '')
+            directories = pending[job_id]
+            if not state.startswith(terminal_states):
+                if is_finished(job_id, directories):
+                    state = 'FINISHED'
+                elif queued is not None and slurm_id not in queued and slurm_id.split('_')[0] not in queued:
+                    state = 'LEFT QUEUE'
+                else:
+                    continue
+
+            del pending[job_id]
+            echo('[{0}] job {1}'.format(state, job_id))
+            in_flight.extend(
+                asyncio.ensure_future(bounded_ingest(d)) for d in directories
+            )
+
+        if pending:
+            if timeout is not None and time.monotonic() - start + interval > timeout:
+                break
+            echo('Waiting for {0} jobs'.format(len(pending)))
+            await asyncio.sleep(interval)
+
+    await asyncio.gather(*in_flight)
+    return list(pending)
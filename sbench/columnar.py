@@ -0,0 +1,329 @@
+"""Columnar export of the results, for analyses that don't need the ORM.
+
+Each table of results is exported denormalized with the metadata of its
+jobs, as in the views of the DB, and partitioned as::
+
+    <directory>/test=<test>/cluster=<cluster>/part-<n>.<format>
+
+Files are written in Parquet if pyarrow is available, or as uncompressed
+``.npz`` archives of numpy arrays otherwise. Both can be memory-mapped
+by ``read``.
+"""
+import glob
+import json
+import os
+import os.path
+import zipfile
+
+import sqlalchemy
+
+from ._sql import view_columns
+
+#: Extension of the files written in each format
+formats = {'parquet': '.parquet', 'npz': '.npz'}
+
+#: Name of the file, at the root of an export, that lists the exported jobs
+state_filename = 'export.json'
+
+
+def default_format():
+    """Returns 'parquet' if pyarrow can be imported, 'npz' otherwise."""
+    try:
+        import pyarrow.parquet  # NOQA: F401
+    except ImportError:
+        return 'npz'
+    return 'parquet'
+
+
+def load_state(directory):
+    """Loads the state of a previous export.
+
+    Returns:
+        A dictionary with the format of the export and, for each test,
+        the ids of the jobs exported on each cluster. None if nothing
+        was exported in the directory.
+    """
+    filename = os.path.join(directory, state_filename)
+    if not os.path.exists(filename):
+        return None
+
+    with open(filename) as f:
+        return json.load(f)
+
+
+def save_state(directory, state):
+    filename = os.path.join(directory, state_filename)
+    with open(filename + '.tmp', 'w') as f:
+        json.dump(state, f)
+    os.replace(filename + '.tmp', filename)
+
+
+def _to_numpy(values, column):
+    """Converts the values of a column to a numpy array.
+
+    Nullable integers are stored as floats, with NaN for missing values,
+    missing strings as empty strings and missing dates as NaT.
+    """
+    import numpy
+
+    if isinstance(column.type, sqlalchemy.DateTime):
+        # SQLite returns dates as ISO strings, that numpy parses
+        return numpy.array(values, dtype='datetime64[us]')
+    if isinstance(column.type, sqlalchemy.Integer):
+        dtype = 'float64' if column.nullable else 'int64'
+        return numpy.array(values, dtype=dtype)
+    if isinstance(column.type, sqlalchemy.Float):
+        return numpy.array(values, dtype='float64')
+    return numpy.array(['' if v is None else v for v in values], dtype=str)
+
+
+class _NpzWriter(object):
+    """Writes a partition as an uncompressed ``.npz`` archive, so that
+    its arrays can be memory-mapped. Chunks are kept in memory until
+    the partition is complete.
+    """
+    def __init__(self, filename, columns):
+        self.filename = filename
+        self.columns = columns
+        self.chunks = {name: [] for name, _ in columns}
+
+    def write(self, values):
+        for (name, column), v in zip(self.columns, values):
+            self.chunks[name].append(_to_numpy(v, column))
+
+    def close(self):
+        import numpy
+        numpy.savez(self.filename, **{
+            name: numpy.concatenate(chunks) for name, chunks in self.chunks.items()
+        })
+
+
+class _ParquetWriter(object):
+    """Writes a partition as a Parquet file, with a row group per chunk."""
+    def __init__(self, filename, columns):
+        import pyarrow
+        import pyarrow.parquet
+
+        self.columns = columns
+        self.types = [self._arrow_type(column) for _, column in columns]
+        schema = pyarrow.schema([
+            (name, t) for (name, _), t in zip(columns, self.types)
+        ])
+        self.writer = pyarrow.parquet.ParquetWriter(filename, schema)
+
+    @staticmethod
+    def _arrow_type(column):
+        import pyarrow
+
+        if isinstance(column.type, sqlalchemy.DateTime):
+            return pyarrow.timestamp('us')
+        if isinstance(column.type, sqlalchemy.Integer):
+            return pyarrow.int64()
+        if isinstance(column.type, sqlalchemy.Float):
+            return pyarrow.float64()
+        return pyarrow.string()
+
+    def write(self, values):
+        import pyarrow
+
+        arrays = []
+        for (_, column), t, v in zip(self.columns, self.types, values):
+            if isinstance(column.type, sqlalchemy.DateTime):
+                arrays.append(pyarrow.array(_to_numpy(v, column), type=t, from_pandas=True))
+            else:
+                arrays.append(pyarrow.array(v, type=t))
+        self.writer.write_batch(pyarrow.RecordBatch.from_arrays(
+            arrays, names=[name for name, _ in self.columns]
+        ))
+
+    def close(self):
+        self.writer.close()
+
+
+_writers = {'parquet': _ParquetWriter, 'npz': _NpzWriter}
+
+
+def _partition(directory, test, cluster):
+    return os.path.join(directory, 'test=' + test, 'cluster=' + cluster)
+
+
+def _part_filename(partition, fmt):
+    """Returns the name of the next part file of a partition."""
+    os.makedirs(partition, exist_ok=True)
+    n = len(glob.glob(os.path.join(partition, 'part-*')))
+    return os.path.join(partition, 'part-{0:05d}{1}'.format(n, formats[fmt]))
+
+
+def clear(directory, test):
+    """Removes the files exported for a test."""
+    pattern = os.path.join(directory, 'test=' + test, 'cluster=*', 'part-*')
+    for filename in glob.glob(pattern):
+        os.remove(filename)
+
+
+def export_table(connection, table, test, directory, fmt, exported, chunk_size=100000):
+    """Streams the rows of a table of results, joined with the metadata
+    of their jobs, to columnar files partitioned by cluster.
+
+    Rows are fetched in chunks from the view of the table, so that no ORM
+    object is built and at most a chunk of rows is held as Python objects.
+
+    Args:
+        connection: connection to the DB
+        table: table of results to be exported
+        test (str): name of the test stored in the table
+        directory (path): root of the export
+        fmt (str): one of ``formats``
+        exported (dict): ids of the jobs already exported for each
+            cluster, which are skipped. Updated with the new ids.
+        chunk_size (int): number of rows fetched at once
+
+    Returns:
+        The number of rows exported, and the files written
+    """
+    columns = view_columns(table)
+    names = [name for name, _ in columns]
+    icluster, ijobid = names.index('cluster'), names.index('jobid')
+
+    where = ''
+    if any(exported.values()):
+        connection.execute(sqlalchemy.text(
+            'CREATE TEMPORARY TABLE IF NOT EXISTS "_exported" '
+            '("cluster" VARCHAR, "jobid" INTEGER)'
+        ))
+        connection.execute(sqlalchemy.text('DELETE FROM "_exported"'))
+        connection.execute(
+            sqlalchemy.text('INSERT INTO "_exported" VALUES (:cluster, :jobid)'),
+            [{'cluster': c, 'jobid': i} for c, ids in exported.items() for i in ids]
+        )
+        where = (
+            ' WHERE NOT EXISTS (SELECT 1 FROM "_exported" AS e '
+            'WHERE e."cluster" = v."cluster" AND e."jobid" = v."jobid")'
+        )
+
+    query = 'SELECT {0} FROM "{1}View" AS v{2} ORDER BY v."cluster"'.format(
+        ', '.join('v."{0}"'.format(name) for name in names), table.name, where
+    )
+    result = connection.execution_options(stream_results=True).execute(
+        sqlalchemy.text(query)
+    )
+
+    nrows, files = 0, []
+    writer, cluster = None, None
+    new_ids = {}
+    while True:
+        rows = result.fetchmany(chunk_size)
+        if not rows:
+            break
+
+        # Rows are sorted by cluster, so that each partition is written
+        # by a single writer
+        start = 0
+        while start < len(rows):
+            if rows[start][icluster] != cluster:
+                if writer is not None:
+                    writer.close()
+                cluster = rows[start][icluster]
+                filename = _part_filename(_partition(directory, test, cluster), fmt)
+                writer = _writers[fmt](filename, columns)
+                files.append(filename)
+
+            stop = start
+            while stop < len(rows) and rows[stop][icluster] == cluster:
+                stop += 1
+
+            values = list(zip(*rows[start:stop]))
+            writer.write(values)
+            new_ids.setdefault(cluster, set()).update(values[ijobid])
+            nrows += stop - start
+            start = stop
+
+    if writer is not None:
+        writer.close()
+
+    for c, ids in new_ids.items():
+        exported[c] = sorted(set(exported.get(c, [])) | ids)
+
+    return nrows, files
+
+
+def _memmap_npz(filename, columns=None):
+    """Memory-maps the arrays of an uncompressed ``.npz`` archive.
+
+    ``numpy.load`` can't memory-map archives, but the members of an
+    uncompressed zip file are stored contiguously, so each ``.npy``
+    member can be mapped at its offset in the archive.
+    """
+    import numpy
+    import numpy.lib.format
+
+    arrays = {}
+    with open(filename, 'rb') as f, zipfile.ZipFile(f) as archive:
+        for info in archive.infolist():
+            name = info.filename[:-len('.npy')]
+            if columns is not None and name not in columns:
+                continue
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError('{0} is compressed and can\'t be memory-mapped'.format(filename))
+
+            # The local header has a fixed size of 30 bytes, followed
+            # by the name of the file and an extra field
+            f.seek(info.header_offset + 26)
+            name_length = int.from_bytes(f.read(2), 'little')
+            extra_length = int.from_bytes(f.read(2), 'little')
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+
+            version = numpy.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = numpy.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = numpy.lib.format.read_array_header_2_0(f)
+
+            arrays[name] = numpy.memmap(
+                filename, dtype=dtype, mode='r', offset=f.tell(),
+                shape=shape, order='F' if fortran_order else 'C'
+            )
+
+    return arrays
+
+
+def _read_file(filename, columns=None):
+    if filename.endswith(formats['npz']):
+        return _memmap_npz(filename, columns)
+
+    import pyarrow.parquet
+    table = pyarrow.parquet.read_table(filename, columns=columns, memory_map=True)
+    return {name: table.column(name).to_numpy() for name in table.column_names}
+
+
+def read(path, columns=None):
+    """Reads exported results as numpy arrays.
+
+    Arrays read from a single file are memory-mapped, as far as the
+    format allows it: numeric columns of Parquet files without missing
+    values, and all the columns of ``.npz`` files. Reading a directory
+    concatenates its files, which copies the arrays.
+
+    Args:
+        path (path): a part file, or a directory with the partitions of
+            a single test (e.g. ``<export>/test=osu_bw``)
+        columns (list): names of the columns to be read, all if None
+
+    Returns:
+        A dictionary mapping the names of the columns to numpy arrays
+    """
+    if not os.path.isdir(path):
+        return _read_file(path, columns)
+
+    filenames = sorted(glob.glob(os.path.join(path, '**', 'part-*'), recursive=True))
+    if not filenames:
+        return {}
+    if len(filenames) == 1:
+        return _read_file(filenames[0], columns)
+
+    import numpy
+    parts = [_read_file(filename, columns) for filename in filenames]
+    return {
+        name: numpy.concatenate([part[name] for part in parts])
+        for name in parts[0]
+    }
@@ -1,16 +1,23 @@
 
+import collections
+import concurrent.futures
+import datetime
+import functools
+import importlib
 import json
 import os
 import os.path
+import re
 import subprocess
+import time
 import uuid
 
 import click
-import jinja2
-import sqlalchemy
-import sqlalchemy.orm
 
-from ._sql import Base
+from . import _campaign, _parsing, _profile
+
+# Modules that depend on SQLAlchemy are imported only by the commands
+# that access the DB, to keep the startup of the other commands fast
 
 # TODO: move this to a configuration file?
 mpi_stacks = {
@@ -35,39 +42,62 @@ clusters_info = {
         'target': 'E5v2',
         'ncores': 16,
         'mem': [64, 256, 512],
-        'softwares': 'paien'
+        'softwares': 'paien',
+        # Theoretical peak of a node in GFLOPS: 16 cores x 2.6 GHz x 8 flops (AVX)
+        'rpeak': 332.8,
     },
     'eltanin':  {
         'target': 'E5v3',
         'ncores': 24,
         'mem': [64],
-        'softwares': 'paien'
+        'softwares': 'paien',
+        # Theoretical peak of a node in GFLOPS: 24 cores x 2.5 GHz x 16 flops (AVX2)
+        'rpeak': 960.0,
     },
     'fidis': {
         'target': 'E5v4',
         'ncores': 28,
         'mem': [128, 256],
-        'softwares': 'humagne'
+        'softwares': 'humagne',
+        # Theoretical peak of a node in GFLOPS: 28 cores x 2.6 GHz x 16 flops (AVX2)
+        'rpeak': 1164.8,
     },
     'gacrux': {
         'target': 's6g1',
         'ncores': 28,
         'mem': [192],
-        'softwares': 'humagne'
+        'softwares': 'humagne',
+        # Theoretical peak of a node in GFLOPS: 28 cores x 2.6 GHz x 32 flops (AVX-512)
+        'rpeak': 2329.6,
     },
     'helvetios': {
 #        'target': 's6g1',
         'ncores': 36,
         'mem': [192],
-        'softwares': 'humagne'
+        'softwares': 'humagne',
+        # Theoretical peak of a node in GFLOPS: 36 cores x 2.3 GHz x 32 flops (AVX-512)
+        'rpeak': 2649.6,
     },
 }
 
+#: Memory of each target: number of sockets of a node, last level cache
+#: of a socket in MiB and expected peak bandwidth of a node in MB/s
+#: (sockets x channels x MT/s x 8 bytes), used to size and assess the
+#: STREAM tests
+target_info = {
+    'E5v2': {'sockets': 2, 'llc': 20, 'peak_bandwidth': 2 * 4 * 1600 * 8},
+    'E5v3': {'sockets': 2, 'llc': 30, 'peak_bandwidth': 2 * 4 * 2133 * 8},
+    'E5v4': {'sockets': 2, 'llc': 35, 'peak_bandwidth': 2 * 4 * 2400 * 8},
+    # The largest cache of the CPUs of this target (Gold 6132 and 6140)
+    's6g1': {'sockets': 2, 'llc': 24.75, 'peak_bandwidth': 2 * 6 * 2666 * 8},
+}
+
 test_list = {
     'osu_bw': {
         'template': 'slurm_osu.sh',
         'subdir': 'pt2pt',
         'command': 'osu_bw',
+        'estimated_runtime': 120,
         'configurations': [
             # (nnodes, ntasks)
             (1, 2),
@@ -78,6 +108,7 @@ test_list = {
         'template': 'slurm_osu.sh',
         'subdir': 'pt2pt',
         'command': 'osu_bibw',
+        'estimated_runtime': 120,
         'configurations': [
             # (nnodes, ntasks)
             (1, 2),
@@ -88,6 +119,7 @@ test_list = {
         'template': 'slurm_osu.sh',
         'subdir': 'pt2pt',
         'command': 'osu_latency',
+        'estimated_runtime': 120,
         'configurations': [
             # (nnodes, ntasks)
             (1, 2),
@@ -98,6 +130,7 @@ test_list = {
         'template': 'slurm_osu.sh',
         'subdir': 'collective',
         'command': 'osu_alltoall',
+        'estimated_runtime': 300,
         'configurations': [
             # (nnodes, ntasks)
             (1, None),
@@ -108,15 +141,82 @@ test_list = {
         'template': 'slurm_osu.sh',
         'subdir': 'collective',
         'command': 'osu_allreduce',
+        'estimated_runtime': 300,
         'configurations': [
             # (nnodes, ntasks)
             (1, None),
             (2, None)
         ]
     },
+    # Run between each pair of nodes of the job, a round of disjoint
+    # pairs at a time, to find the slow nodes and links
+    'osu_bw_pairs': {
+        'template': 'slurm_osu_pairs.sh',
+        'subdir': 'pt2pt',
+        'command': 'osu_bw',
+        'estimated_runtime': 14 * 120,
+        'configurations': [
+            # (nnodes, ntasks)
+            (8, None)
+        ],
+        # Estimated runtime of a round, used to estimate the runtime
+        # of the job from the number of rounds
+        'round_runtime': 120
+    },
+    'osu_latency_pairs': {
+        'template': 'slurm_osu_pairs.sh',
+        'subdir': 'pt2pt',
+        'command': 'osu_latency',
+        'estimated_runtime': 14 * 120,
+        'configurations': [
+            # (nnodes, ntasks)
+            (8, None)
+        ],
+        'round_runtime': 120
+    },
+    # I/O bandwidth and metadata rates of the scratch filesystem, where
+    # each job writes in a directory of its own
+    'ior': {
+        'template': 'slurm_ior.sh',
+        'subdir': '.',
+        'command': 'ior',
+        'estimated_runtime': 900,
+        'configurations': [
+            # (nnodes, ntasks)
+            (2, None),
+            (8, None)
+        ],
+        'scratch': '/scratch/${USER}/sbench-io'
+    },
+    'mdtest': {
+        'template': 'slurm_mdtest.sh',
+        'subdir': '.',
+        'command': 'mdtest',
+        'estimated_runtime': 600,
+        'configurations': [
+            # (nnodes, ntasks)
+            (1, None),
+            (4, None)
+        ],
+        'scratch': '/scratch/${USER}/sbench-io'
+    },
+    # Sweeps the number of OpenMP threads and their binding in one job
+    'stream': {
+        'template': 'slurm_stream.sh',
+        'subdir': '.',
+        'command': 'stream',
+        'estimated_runtime': 600,
+        'configurations': [
+            # (nnodes, ntasks)
+            (1, 1)
+        ],
+        # Source of STREAM, compiled by each job for its target
+        'source': '/ssoft/spack/external/stream/5.10/stream.c'
+    },
     'hpl': {
         'template': 'slurm_hpl.sh',
         'command': 'xhpl',
+        'estimated_runtime': 3600,
         'configurations': [
             # (nnodes, ntasks)
             (2, None)
@@ -124,17 +224,105 @@ test_list = {
         'extra_directives': [
             '#SBATCH --time 1:0:0'
         ],
-        'subdir': '.'
+        'subdir': '.',
+        # Estimated runtime of the default problem, used to size the
+        # time limit of tuning sweeps
+        'problem_runtime': 900
     },
 
 }
 
 
+#: Estimated time, in seconds, that each job spends on its nodes
+#: besides running benchmarks (prolog, epilog, loading modules, etc.)
+job_overhead = 120
+
+
+class _Registry(dict):
+    """Classes indexed by test name. Classes are added by decorators
+    when their module is imported, and modules are imported only when
+    one of their test names is used.
+
+    Modules are found through the entry points in ``group``, which lets
+    other packages register benchmarks, or in ``builtins`` if sbench is
+    used without being installed.
+    """
+    def __init__(self, group, builtins):
+        super(_Registry, self).__init__()
+        self.group = group
+        self.builtins = builtins
+        self._entry_points = None
+
+    @property
+    def entry_points(self):
+        """Maps test names to the ``module:attribute`` defining them."""
+        if self._entry_points is None:
+            self._entry_points = dict(self.builtins)
+            self._entry_points.update(_entry_points(self.group))
+        return self._entry_points
+
+    def names(self):
+        """Returns the names of all the tests, loaded or not."""
+        return sorted(set(self.entry_points) | set(dict.keys(self)))
+
+    def load_all(self):
+        """Imports the modules of all the tests."""
+        for name in self.names():
+            self[name]
+
+    def __contains__(self, name):
+        return dict.__contains__(self, name) or name in self.entry_points
+
+    def __missing__(self, name):
+        module, _, attribute = self.entry_points[name].partition(':')
+        module = importlib.import_module(module)
+        if not dict.__contains__(self, name):
+            dict.__setitem__(self, name, getattr(module, attribute))
+        return dict.__getitem__(self, name)
+
+
+def _entry_points(group):
+    """Returns the entry points of a group as a dictionary mapping their
+    names to their ``module:attribute`` value.
+    """
+    try:
+        import importlib.metadata as metadata
+    except ImportError:
+        return {}
+
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, 'select'):
+        selected = entry_points.select(group=group)
+    else:
+        selected = entry_points.get(group, [])
+
+    return {ep.name: ep.value for ep in selected}
+
+
 #: List of parsers
-_parsers = {}
+_parsers = _Registry('sbench.parsers', {
+    'osu_bw': 'sbench.osu:OsuBw',
+    'osu_bibw': 'sbench.osu:OsuBiBw',
+    'osu_latency': 'sbench.osu:OsuLatency',
+    'osu_alltoall': 'sbench.osu:OsuAlltoall',
+    'osu_allreduce': 'sbench.osu:OsuAllreduce',
+    'osu_bw_pairs': 'sbench.osu:OsuBwPairs',
+    'osu_latency_pairs': 'sbench.osu:OsuLatencyPairs',
+    'ior': 'sbench.ior:IORParser',
+    'mdtest': 'sbench.ior:MdtestParser',
+    'stream': 'sbench.stream:StreamParser',
+    'hpl': 'sbench.hpl:HPLParser'
+})
 
 #: Lists of benchmarks preparators
-_preparators = {}
+_preparators = _Registry('sbench.preparators', {
+    'hpl': 'sbench.preparators:HPLPreparator',
+    'osu_bw_pairs': 'sbench.preparators:OsuPairsPreparator',
+    'osu_latency_pairs': 'sbench.preparators:OsuPairsPreparator',
+    'ior': 'sbench.preparators:IORPreparator',
+    'mdtest': 'sbench.preparators:MdtestPreparator',
+    'stream': 'sbench.preparators:StreamPreparator'
+})
 
 
 def parser(name):
@@ -144,6 +332,295 @@ def parser(name):
     return _decorator
 
 
+def _warn_directory(root):
+    click.echo(
+        click.style('[WARNING]', fg='yellow', bold=True)
+        + ' couldn\'t process directory: {0}'.format(root)
+    )
+
+
+def parse_directory(root, contents=None, files=None):
+    """Parses the benchmark run at root, without touching the DB.
+
+    Args:
+        root (path): directory containing the tests results
+        contents (dict): if not None, content of the files of the
+            directory, which is not read from disk
+        files (dict): if not None, the files of the job, as returned by
+            ``SlurmJob.classify``, and the directory is not listed
+
+    Returns:
+        A dictionary with the name of the test, the information on the
+        job and the rows of results, all stored as plain python objects
+    """
+    if contents is None:
+        with open(os.path.join(root, 'context.json')) as f:
+            text = f.read()
+        _profile.count('files_opened')
+        _profile.count('bytes_read', len(text))
+    else:
+        text = contents['context.json']
+    context = json.loads(text)
+
+    from . import slurm
+    job = slurm.SlurmJob(root, context, contents, files)
+    test = _parsers[context['name']](job, context)
+
+    # The job must be parsed first, as it sets the cluster name
+    # that is needed to fill the rows of results
+    with _profile.phase('parse.job'):
+        job_record = job.parse()
+    with _profile.phase('parse.results'):
+        rows = test.parse()
+    return {
+        'root': root,
+        'name': context['name'],
+        'job': job_record,
+        'rows': rows
+    }
+
+
+def _try_ingest(task):
+    """Parses a directory for ``collect``. The parsing is skipped if the
+    content of the files matches the digest recorded in the manifest.
+
+    Args:
+        task (tuple): directory, its fingerprint, the known digest,
+            the content of its files if it was read from an archive,
+            the files of the job, if they are already known, and
+            whether its rows replace the ones in the DB
+
+    Returns:
+        The directory and the parsed record, or None on failure
+    """
+    from . import _manifest
+
+    root, fingerprint, known_digest, contents, files, replace = task
+    try:
+        if fingerprint:
+            fingerprint['digest'] = _manifest.digest(fingerprint)
+            if fingerprint['digest'] == known_digest:
+                return root, {'root': root, 'manifest': fingerprint}
+
+        record = parse_directory(root, contents, files)
+        record['manifest'] = fingerprint
+        record['replace'] = replace
+        return root, record
+    except Exception:
+        return root, None
+
+
+def _try_ingest_profiled(task):
+    """Same as ``_try_ingest``, also returning the phases and counters
+    recorded by the worker, to be merged in the main process.
+    """
+    return _try_ingest(task), _profile.take()
+
+
+def _merge_profiles(results):
+    for result, snapshot in results:
+        _profile.merge(snapshot)
+        yield result
+
+
+def _parser_versions(name):
+    """Returns the versions of the parsers used for a test."""
+    from . import slurm
+    return slurm.SlurmJob.version, getattr(_parsers[name], 'version', 0)
+
+
+def _warn_missing(directory, missing, shown=5):
+    """Warns about the test directories of a campaign that don't exist."""
+    click.echo(
+        click.style('[WARNING]', fg='yellow', bold=True)
+        + ' {0} test directories listed in {1} are missing: {2}{3}'.format(
+            len(missing), os.path.join(directory, _campaign.filename),
+            ', '.join(missing[:shown]), ', ...' if len(missing) > shown else ''
+        )
+    )
+
+
+def _result_directories(directory, visit=None):
+    """Returns an iterator over the test directories of a campaign, as
+    returned by ``_discovery.walk``.
+    """
+    from . import _discovery
+
+    # If the campaign lists its test directories there's no
+    # need to walk the tree
+    campaign = _campaign.load(directory)
+    if campaign:
+        missing = _campaign.missing(campaign, _discovery.threads)
+        if not missing:
+            return _discovery.listed(_campaign.directories(campaign), visit)
+        _warn_missing(directory, missing)
+        click.echo('Walking {0} instead'.format(directory))
+
+    # Directories containing tests data are the leaves with a context
+    return _discovery.walk(directory, visit)
+
+
+def _ingest_task(root, manifest, force=False, entries=None):
+    """Prepares the ingestion of a directory by ``_try_ingest``.
+
+    Args:
+        root (path): directory containing the tests results
+        manifest (dict): ingestion manifest, as returned by
+            ``_manifest.load``
+        force (bool): if True, ingest the directory even if unchanged
+        entries (dict): if not None, maps the names of the files in
+            ``root`` to their ``os.DirEntry``, and ``root`` is not listed
+
+    Returns:
+        The task to be passed to ``_try_ingest``, or None if the
+        directory didn't change since it was ingested. Directories that
+        changed since, and all of them with ``force``, replace the rows
+        of their job.
+    """
+    from . import _discovery, _manifest, slurm
+
+    # The directory is listed once, for both the fingerprint and the
+    # files of the job
+    if entries is None:
+        entries = _discovery.list_files(root)[1]
+    fingerprint = _manifest.scan(root, entries)
+    files = slurm.SlurmJob.classify(root, entries)
+    known = None
+    if fingerprint:
+        known = manifest.get((fingerprint['uuid'], fingerprint['jobid']))
+
+    if not known or force:
+        return root, fingerprint, None, None, files, force
+
+    if _manifest.is_unchanged(known, fingerprint):
+        return None
+
+    return root, fingerprint, known['digest'], None, files, True
+
+
+def _create_tables(engine):
+    """Creates the tables of all the tests, if they don't exist."""
+    from . import _manifest, _rollups, slurm  # NOQA: F401
+    from ._sql import create_schema
+
+    _parsers.load_all()
+    try:
+        create_schema(engine)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+
+def _open_session(db, verbose):
+    """Opens a session on the DB, creating the tables if needed."""
+    import sqlalchemy.orm
+    from ._sql import Session, create_engine
+
+    engine = create_engine(db, echo=verbose)
+    _create_tables(engine)
+    return sqlalchemy.orm.sessionmaker(bind=engine, class_=Session)()
+
+
+def _delete_job(session, name, cluster, jobid):
+    """Deletes a job, its nodes and its results from the DB.
+
+    Returns:
+        The columns of the job needed to update the rollups, or None if
+        the job wasn't in the DB
+    """
+    from . import slurm
+    from ._sql import delete_rows
+
+    job = session.query(
+        slurm.JobRow.compiler, slurm.JobRow.mpi, slurm.JobRow.nnodes, slurm.JobRow.start
+    ).filter_by(cluster=cluster, id=jobid).first()
+
+    # Rows referring to the job are deleted first
+    delete_rows(session, _parsers[name].row_cls, cluster=cluster, jobid=jobid)
+    delete_rows(session, slurm.JobNodeRow, cluster=cluster, jobid=jobid)
+    delete_rows(session, slurm.JobRow, cluster=cluster, id=jobid)
+    return job._asdict() if job else None
+
+
+def _store(session, record):
+    """Adds a record returned by ``parse_directory`` to the session. If
+    the record replaces the rows of its job, they are deleted first, and
+    the job as it was is recorded under 'replaced'.
+
+    Returns:
+        The number of rows added to the session
+    """
+    from . import _manifest, slurm
+
+    nrows = 0
+    with _profile.phase('db.store'):
+        if 'job' in record:
+            if record.get('replace'):
+                job = record['job']
+                record['replaced'] = _delete_job(session, record['name'], job['cluster'], job['id'])
+            nrows += slurm.SlurmJob.store(session, record['job'])
+            nrows += _parsers[record['name']].store(session, record['rows'])
+
+        if record.get('manifest'):
+            _manifest.update(session, record['manifest'])
+
+    _profile.count('rows_inserted', nrows)
+    return nrows
+
+
+def _load_keys(session, records):
+    """Loads at once the keys of the rows of a batch of records that are
+    already in the DB, instead of querying them for each record.
+    """
+    from . import _manifest, slurm
+    from ._sql import load_keys
+
+    jobs = [record for record in records if 'job' in record]
+    load_keys(session, slurm.JobRow, [
+        {'cluster': r['job']['cluster'], 'id': r['job']['id']} for r in jobs
+    ])
+    load_keys(session, slurm.JobNodeRow, [
+        {'cluster': r['job']['cluster'], 'jobid': r['job']['id']} for r in jobs
+    ])
+    for name in {r['name'] for r in jobs}:
+        load_keys(session, _parsers[name].row_cls, [
+            {'cluster': r['job']['cluster'], 'jobid': r['job']['id']}
+            for r in jobs if r['name'] == name
+        ])
+    load_keys(session, _manifest.ManifestRow, [
+        {'uuid': r['manifest']['uuid'], 'jobid': r['manifest']['jobid']}
+        for r in records if r.get('manifest')
+    ])
+
+
+def _update_rollups(session, records):
+    """Adds the results of a batch of records that are new in the DB
+    to the rollups, in the same transaction.
+
+    Results can't be taken out of a rollup: the rollups of the results
+    that were replaced are summarized again from the DB, where they were
+    deleted, before the new results are added.
+    """
+    from . import _rollups
+    from ._sql import pending_rows
+
+    replaced = []
+    for r in records:
+        job = r.get('replaced')
+        if job:
+            replaced.append((r['name'], r['job']['cluster'], job['compiler'], job['mpi'], job['nnodes'], job['start']))
+    if replaced:
+        parsers = {name: _parsers[name] for name, *_ in replaced}
+        _rollups.refresh(session, parsers, replaced)
+
+    jobs = {(r['job']['cluster'], r['job']['id']): r['job'] for r in records if 'job' in r}
+    summaries = {}
+    for name in {r['name'] for r in records if 'job' in r}:
+        parser_cls = _parsers[name]
+        rows = pending_rows(session, parser_cls.row_cls)
+        _rollups.summarize(name, parser_cls, rows, jobs, summaries)
+    _rollups.update(session, summaries)
+
+
 def update_sql_db(root, session):
     """Updates the session passed as argument with information from the
     benchmark run at root.
@@ -156,30 +633,84 @@ def update_sql_db(root, session):
         True if the session was updated, False if some error wa encountered
     """
 
-    Base.metadata.create_all(session.bind)
-
-    t = os.path.join(root, 'context.json')
-
-    with open(t) as f:
-        context = json.load(f)
+    _create_tables(session.bind)
 
     try:
-        from . import slurm
-        job = slurm.SlurmJob(root, context)
-        job.update_sql_db(session)
-        test = _parsers[context['name']](job, context)
-        test.update_sql_db(session)
-        session.commit()
+        record = parse_directory(root)
+        _store(session, record)
+        _update_rollups(session, [record])
+        with _profile.phase('db.commit'):
+            session.commit()
     except Exception as e:
-        click.echo(
-            click.style('[WARNING]', fg='yellow', bold=True)
-            + ' couldn\'t process directory: {0}'.format(root)
-        )
+        session.rollback()
+        _warn_directory(root)
         return False
 
     return True
 
 
+def _commit_batch(session, batch):
+    """Stores a batch of records in a single transaction. If the
+    transaction fails, records are committed one at a time to
+    isolate the directories that can't be processed.
+
+    Returns:
+        Number of directories and rows committed to the DB
+    """
+    try:
+        with _profile.phase('db.load_keys'):
+            _load_keys(session, batch)
+        nrows = sum(_store(session, record) for record in batch)
+        with _profile.phase('db.rollups'):
+            _update_rollups(session, batch)
+        with _profile.phase('db.commit'):
+            session.commit()
+        return len(batch), nrows
+    except Exception:
+        session.rollback()
+
+    if len(batch) == 1:
+        _warn_directory(batch[0]['root'])
+        return 0, 0
+
+    ndirs, nrows = 0, 0
+    for record in batch:
+        d, r = _commit_batch(session, [record])
+        ndirs, nrows = ndirs + d, nrows + r
+
+    return ndirs, nrows
+
+
+def write_records(session, records, batch_size=1):
+    """Writes to the DB the records produced by ``_try_ingest``,
+    committing once every ``batch_size`` directories.
+
+    Args:
+        session (session): SQLite session to be updated
+        records (iterable): pairs of directory and parsed record
+        batch_size (int): number of directories per transaction
+
+    Returns:
+        Number of directories and rows committed to the DB
+    """
+    ndirs, nrows, batch = 0, 0, []
+    for root, record in records:
+        if record is None:
+            _warn_directory(root)
+            continue
+
+        batch.append(record)
+        if len(batch) >= batch_size:
+            d, r = _commit_batch(session, batch)
+            ndirs, nrows, batch = ndirs + d, nrows + r, []
+
+    if batch:
+        d, r = _commit_batch(session, batch)
+        ndirs, nrows = ndirs + d, nrows + r
+
+    return ndirs, nrows
+
+
 def preparator(name):
     def _decorator(cls):
         _preparators[name] = cls
@@ -189,26 +720,425 @@ def preparator(name):
 
 @click.group()
 def sbench():
-    """SCITAS osu-micro-bechmarks runner"""
+    """SCITAS osu-micro-bechmarks runner
+
+    SQLite DBs on a local disk can be opened in WAL mode, and memory-mapped,
+    by setting SBENCH_SQLITE_LOCAL=1. Don't set it for DBs on a network
+    filesystem.
+    """
     pass
 
 
+#: Errors of sbatch that are worth retrying the submission
+transient_errors = re.compile(
+    r'socket timed out|temporarily unavailable|temporarily unable'
+    r'|unable to contact slurm controller|try again',
+    re.IGNORECASE
+)
+
+
+def _submit(batch_file, extra_args, retries=5, backoff=1.0):
+    """Submits a batch file to Slurm, retrying with an exponential
+    backoff when sbatch fails with a transient error.
+
+    Args:
+        batch_file (path): batch file to be submitted
+        extra_args (list): extra arguments for sbatch
+        retries (int): maximum number of retries
+        backoff (float): seconds to wait before the first retry
+
+    Returns:
+        The job id, the latency of the successful call and the number
+        of retries
+
+    Raises:
+        click.ClickException: if the job couldn't be submitted
+    """
+    for attempt in range(retries + 1):
+        start = time.time()
+        with _profile.phase('sbatch'):
+            p = subprocess.run(
+                ['sbatch', '--parsable', *extra_args, batch_file],
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                universal_newlines=True
+            )
+        latency = time.time() - start
+        _profile.count('sbatch_calls')
+
+        if p.returncode == 0:
+            # With --parsable the output is "jobid[;cluster]"
+            return p.stdout.strip().split(';')[0], latency, attempt
+
+        if attempt == retries or not transient_errors.search(p.stderr):
+            break
+        time.sleep(backoff * 2**attempt)
+
+    msg = 'couldn\'t submit {0}: {1}'.format(batch_file, p.stderr.strip())
+    raise click.ClickException(msg)
+
+
+def _submit_all(submissions, extra_args, threads, retries):
+    """Submits batch files concurrently, with a bounded number of
+    sbatch calls in flight.
+
+    Args:
+        submissions (list): batch files to be submitted, each with the
+            list of contexts of the tests it runs and a flag that is
+            True for job arrays, which run a task per context
+        extra_args (list): extra arguments for sbatch
+        threads (int): maximum number of concurrent sbatch calls
+        retries (int): maximum number of retries per submission
+
+    Returns:
+        The jobs submitted, in the format of the campaign manifest,
+        the latencies of the sbatch calls, the number of retries and
+        the errors encountered
+    """
+    jobs, latencies, nretries, errors = {}, [], 0, []
+
+    with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+        futures = {
+            executor.submit(_submit, batch_file, extra_args, retries): (contexts, is_array)
+            for batch_file, contexts, is_array in submissions
+        }
+        for future in concurrent.futures.as_completed(futures):
+            contexts, is_array = futures[future]
+            try:
+                job_id, latency, attempts = future.result()
+            except click.ClickException as e:
+                errors.append(e.message)
+                continue
+
+            latencies.append(latency)
+            nretries += attempts
+            try:
+                keys = [
+                    '{0}_{1}'.format(job_id, idx) if is_array else _campaign.pack_step_id(job_id, idx)
+                    for idx in range(len(contexts))
+                ]
+            except ValueError as e:
+                # The batch file of the pack exits without running its tests
+                errors.append(str(e))
+                continue
+            for key, context in zip(keys, contexts):
+                directory = os.path.abspath(context['test_directory'])
+                jobs.setdefault(key, {})[directory] = context
+
+    return jobs, latencies, nretries, errors
+
+
+def _array_shape(context):
+    """Returns the resources requested by a job. Configurations with
+    the same shape can be submitted together as a job array.
+    """
+    return (
+        context['cluster'], context.get('target'), context['nnodes'],
+        context['ntasks'], tuple(context['extra_directives'])
+    )
+
+
+def _write_array(env, directory, contexts):
+    """Writes the batch file of a job array, where each task runs the
+    batch file of one of the contexts passed as argument.
+
+    Returns:
+        The path to the batch file
+    """
+    array_directory = os.path.join(directory, 'array-' + str(uuid.uuid4()))
+    os.makedirs(array_directory)
+
+    names = {c['name'] for c in contexts}
+    array_context = dict(
+        contexts[0],
+        name=names.pop() if len(names) == 1 else 'sbench',
+        array_directory=array_directory,
+        directories=[c['test_directory'] for c in contexts]
+    )
+
+    batch_file = os.path.join(array_directory, 'slurm_array.sh')
+    with open(batch_file, 'w') as f:
+        f.write(env.get_template('slurm_array.sh').render(**array_context))
+
+    return batch_file
+
+
+def _pack_key(context):
+    """Returns the key of the packs a test can be added to. Tests with
+    the same key can run one after the other in the same allocation.
+    """
+    return (
+        context['cluster'], context.get('target'), context['compiler'],
+        context['mpi'], context['nnodes'], tuple(context['extra_directives'])
+    )
+
+
+def _pack(contexts):
+    """Groups compatible tests in packs. A pack never contains the same
+    test twice, so that the repetitions of a test run in different
+    allocations. Each test of a pack is stored under its own job id,
+    given by ``_campaign.job_tag``.
+
+    Args:
+        contexts (list): contexts of the tests to be run
+
+    Returns:
+        A list of packs, each being a list of contexts
+    """
+    packs, open_packs = [], {}
+    for context in contexts:
+        candidates = open_packs.setdefault(_pack_key(context), [])
+        for pack in candidates:
+            if len(pack) < _campaign.max_pack_steps and all(c['name'] != context['name'] for c in pack):
+                pack.append(context)
+                break
+        else:
+            candidates.append([context])
+            packs.append(candidates[-1])
+
+    return packs
+
+
+def _node_hours(packs):
+    """Estimates the node-hours spent on a list of packs of tests."""
+    seconds = sum(
+        pack[0]['nnodes'] * (job_overhead + sum(
+            c.get('estimated_runtime', test_list[c['name']].get('estimated_runtime', 0))
+            for c in pack
+        ))
+        for pack in packs
+    )
+    return seconds / 3600.
+
+
+def _write_pack(env, directory, contexts):
+    """Writes the batch file of a job running the tests of a pack as
+    sequential steps in the same allocation.
+
+    Returns:
+        The path to the batch file
+    """
+    pack_directory = os.path.join(directory, 'pack-' + str(uuid.uuid4()))
+    os.makedirs(pack_directory)
+
+    names = {c['name'] for c in contexts}
+    pack_context = dict(
+        contexts[0],
+        name=names.pop() if len(names) == 1 else 'sbench',
+        # Each step sets its own number of tasks
+        ntasks=None,
+        pack_directory=pack_directory,
+        pack_step_base=_campaign.pack_step_base,
+        steps=contexts
+    )
+
+    batch_file = os.path.join(pack_directory, 'slurm_pack.sh')
+    with open(batch_file, 'w') as f:
+        f.write(env.get_template('slurm_pack.sh').render(**pack_context))
+
+    return batch_file
+
+
+def _existing_db(ctx, param, value):
+    """Checks that a SQLite DB passed as an option exists. DBs passed
+    as SQLAlchemy URLs are checked when connecting to them.
+    """
+    if value and '://' not in value and not os.path.isfile(value):
+        raise click.BadParameter('file {0} does not exist'.format(value))
+    return value
+
+
+def _hpl_results(db):
+    """Loads the results of the previous HPL jobs from a DB."""
+    import sqlalchemy
+    from . import _tuning
+    from ._sql import create_engine
+
+    engine = create_engine(db)
+    if 'HPLView' not in sqlalchemy.inspect(engine).get_view_names():
+        return {}
+    with engine.connect() as connection:
+        return _tuning.load(connection)
+
+
+def _tune_hpl(context, cluster_info, results):
+    """Adds to the context of a HPL test the next sweep of its tuning,
+    and sets the time limit of the job accordingly.
+
+    Args:
+        context (dict): context of the test
+        cluster_info (dict): cluster where the test runs
+        results (dict): results of the previous jobs, as returned by
+            ``_hpl_results``
+
+    Returns:
+        False if the tuning of this configuration is done, True otherwise
+    """
+    from . import _tuning
+
+    nnodes = context['nnodes']
+    ntasks = context['ntasks'] or cluster_info['ncores'] * nnodes
+    n_max = _tuning.max_problem_size(min(cluster_info['mem']), nnodes)
+    key = context['cluster'], context['compiler'], context['mpi'], nnodes
+    sweep, best = _tuning.next_sweep(results.get(key, []), n_max, ntasks)
+
+    msg = ''
+    if best:
+        msg = ', best so far N={N} NB={NB} P={P} Q={Q}: {gflops:.1f} GFLOPS'.format(**best)
+        if 'rpeak' in cluster_info:
+            msg += ' ({0:.1%} of Rpeak)'.format(best['gflops'] / (cluster_info['rpeak'] * nnodes))
+
+    if sweep is None:
+        click.echo('\t\ttuning done' + msg)
+        return False
+
+    n_default = n_max * _preparators['hpl'].memory_percent / 100
+    seconds = _tuning.runtime(sweep, n_default, test_list['hpl']['problem_runtime'])
+    # Leave some margin, as the runtime of each problem is a rough estimate
+    minutes = int(1.5 * seconds / 60) + 1
+    context['extra_directives'] = [
+        d for d in context['extra_directives'] if '--time' not in d
+    ] + ['#SBATCH --time {0}:{1:02d}:0'.format(minutes // 60, minutes % 60)]
+    context['estimated_runtime'] = int(seconds)
+    context['hpl_sweep'] = sweep
+
+    click.echo('\t\ttuning round {0}: Ns={1} NBs={2} grids={3}{4}'.format(
+        sweep['round'], sweep['Ns'], sweep['NBs'],
+        ' '.join('{0}x{1}'.format(p, q) for p, q in sweep['grids']), msg
+    ))
+    return True
+
+
+def _adaptive_results(db, since, directory):
+    """Loads the summaries of the recent results of the tests with an
+    x axis (e.g. OSU, IOR), and counts the runs of the campaign in
+    ``directory`` that are not in the DB yet.
+    """
+    from . import _adaptive, slurm  # NOQA: F401
+    from ._sql import create_engine
+
+    _parsers.load_all()
+    engine = create_engine(db)
+    with engine.connect() as connection:
+        results = _adaptive.load(connection, {t: _parsers[t] for t in _parsers.names()}, since)
+        pending = _adaptive.pending(connection, _campaign.load(directory), since)
+    return results, pending
+
+
+def _repeat_noisy(context, results, pending, target, max_runs):
+    """Returns how many times a configuration of a test with an x axis
+    is run in adaptive mode.
+
+    Args:
+        context (dict): context of the test
+        results (dict): summaries of the recent results, as returned by
+            ``_adaptive_results``
+        pending (dict): runs of each configuration that are not in the
+            DB yet, as returned by ``_adaptive_results``
+        target (float): target half-width of the confidence intervals
+        max_runs (int): maximum number of runs of the configuration
+    """
+    from . import _adaptive
+
+    key = _adaptive.key(context)
+    npending = pending.get(key, 0)
+    repeats, runs, widest = _adaptive.repetitions(results.get(key, {}), target, max_runs, npending)
+
+    msg = '{0} runs so far'.format(runs)
+    if npending:
+        msg += ', {0} pending'.format(npending)
+    if widest:
+        msg += ', widest interval at {0}: +/-{1:.1%}'.format(*widest)
+    if repeats:
+        click.echo('\t\t{0}, running {1} more'.format(msg, repeats))
+    elif widest is not None and widest[1] <= target:
+        click.echo('\t\t{0}, converged'.format(msg))
+    elif runs + npending >= max_runs:
+        click.echo('\t\t{0}, budget exhausted'.format(msg))
+    else:
+        click.echo('\t\t{0}, waiting for the pending runs'.format(msg))
+    return repeats
+
+
+def _profiled(command):
+    """Adds to a command the options that record where it spends its time."""
+    @click.option(
+        '--profile', 'profile_file', default=None, type=click.Path(dir_okay=False, writable=True),
+        help='Write the time spent in each phase and other counters to this JSON file'
+    )
+    @click.option(
+        '--cprofile', 'pstats_file', default=None, type=click.Path(dir_okay=False, writable=True),
+        help='Profile the main process with cProfile, and write the statistics to this file'
+    )
+    @functools.wraps(command)
+    def wrapper(*args, profile_file, pstats_file, **kwargs):
+        with _profile.profiling(command.__name__, profile_file, pstats_file):
+            return command(*args, **kwargs)
+
+    return wrapper
+
+
 @sbench.command()
+@_profiled
 @click.option('--tests', default=None, help='Tests to be run')
 @click.option('--clusters', default=None,
               help='Clusters to which tests should be submitted')
 @click.option('--runner_args', default=None,
               help='List of extra arguments for the runner')
+@click.option('--array', is_flag=True, default=False,
+              help='Submit configurations with the same resources as job arrays')
+@click.option('--pack', is_flag=True, default=False,
+              help='Run compatible tests as steps of the same job')
+@click.option('--submit-threads', default=4, type=click.IntRange(min=1),
+              help='Maximum number of concurrent calls to sbatch')
+@click.option('--retries', default=5, type=click.IntRange(min=0),
+              help='Retries of sbatch calls failing with transient errors')
+@click.option('--hpl-tuning', is_flag=True, default=False,
+              help='Sweep the parameters of HPL, narrowing the sweeps of --db')
+@click.option('--adaptive', is_flag=True, default=False,
+              help='Only run the OSU and IOR tests whose results in --db are still too noisy')
+@click.option('--target-ci', default=0.05, type=click.FloatRange(min=0, min_open=True),
+              help='Target half-width of the 95% confidence intervals, relative to the mean')
+@click.option('--max-runs', default=10, type=click.IntRange(min=1),
+              help='Maximum number of runs of each configuration with --adaptive')
+@click.option('--since', default=None, type=click.DateTime(),
+              help='Only count the results of jobs started after this date '
+                   'with --adaptive [default: 7 days ago]')
+@click.option('--db', default=None, callback=_existing_db,
+              help='DB with the results of the previous jobs')
 @click.argument(
     'directory',
     type=click.Path(exists=True, file_okay=False, dir_okay=True, writable=True)
 )
-def run(tests, clusters, runner_args, directory):
+def run(tests, clusters, runner_args, array, pack, submit_threads, retries, hpl_tuning,
+        adaptive, target_ci, max_runs, since, db, directory):
     """Runs the specified benchmark using slurm. Puts all relevant
     files in a tree starting from the directory passed in as a
     parameter.
+
+    With --hpl-tuning, each HPL job sweeps a grid of problem sizes,
+    block sizes and process grids. The sweeps of each configuration
+    get finer and centered on the best result of the previous ones,
+    read from --db, until they converge. Configurations whose tuning
+    is done are not submitted again.
+
+    With --adaptive, the OSU and IOR tests are only run for the
+    configurations whose results in --db are too few or too noisy: the
+    confidence interval of the mean of some size must still be wider than
+    --target-ci. Configurations are run several times at once if their
+    variance shows that one run won't be enough, up to --max-runs.
+    Running this again once the jobs are collected (e.g. by 'sbench
+    watch') repeats the noisy configurations until they converge. The
+    runs submitted in DIRECTORY since --since that are not in --db yet
+    are counted as pending, and not submitted again.
     """
 
+    if array and pack:
+        raise click.ClickException('--array and --pack are mutually exclusive')
+    if adaptive and not db:
+        raise click.ClickException('--db is needed with --adaptive')
+    if hpl_tuning and not db:
+        raise click.ClickException('--db is needed with --hpl-tuning')
+
     context = {}
 
     tests = tests.split(',') if tests else list(test_list)
@@ -223,6 +1153,7 @@ def run(tests, clusters, runner_args, directory):
         msg = 'couldn\'t find the following clusters: {0}'.format(', '.join(not_existing))
         raise click.ClickException(msg)
 
+    import jinja2
     env = jinja2.Environment(loader=jinja2.PackageLoader('sbench', 'templates'))
 
     template = env.get_template('slurm_template.sh')
@@ -231,6 +1162,14 @@ def run(tests, clusters, runner_args, directory):
     if runner_args:
         extra_args = runner_args.split(' ')
 
+    # Contexts of all the tests to be run
+    planned = []
+
+    hpl_results = _hpl_results(db) if hpl_tuning else {}
+    if adaptive:
+        since = since or datetime.datetime.now() - datetime.timedelta(days=7)
+        adaptive_results, pending_runs = _adaptive_results(db, since, directory)
+
     for cluster in clusters:
         cluster_info = clusters_info[cluster]
         if 'target' in  cluster_info:
@@ -259,59 +1198,787 @@ def run(tests, clusters, runner_args, directory):
                     context['nnodes'] = nnodes
                     context['ntasks'] = ntasks
 
-                    uid = str(uuid.uuid4())
-                    test_directory = os.path.join(directory, uid)
-                    batch_file = os.path.join(test_directory, 'slurm_batch.sh')
-
-                    context['test_directory'] = test_directory
-                    context['output_file'] = os.path.join(test_directory, 'run.%A.out')
-                    context['error_file'] = os.path.join(test_directory, 'run.%A.err')
                     context['extra_directives'] = test_list[test].get('extra_directives', [])
+                    if array:
+                        context['job_tag'] = '${SLURM_ARRAY_JOB_ID}_${SLURM_ARRAY_TASK_ID}'
+                    elif pack:
+                        # Set by the batch file of the pack for each step
+                        context['job_tag'] = '${SBENCH_JOB_ID}'
+                    else:
+                        context['job_tag'] = '${SLURM_JOB_ID}'
+
+                    context.pop('hpl_sweep', None)
+                    context.pop('estimated_runtime', None)
+                    if hpl_tuning and test == 'hpl':
+                        if not _tune_hpl(context, cluster_info, hpl_results):
+                            continue
+
+                    repeats = 1
+                    if adaptive and None not in _parsing.spec(_parsers[test])[:2]:
+                        repeats = _repeat_noisy(context, adaptive_results, pending_runs, target_ci, max_runs)
+
+                    for _ in range(repeats):
+                        uid = str(uuid.uuid4())
+                        test_directory = os.path.join(directory, uid)
+                        batch_file = os.path.join(test_directory, 'slurm_batch.sh')
+
+                        context['test_directory'] = test_directory
+                        context['output_file'] = os.path.join(test_directory, 'run.%A.out')
+                        context['error_file'] = os.path.join(test_directory, 'run.%A.err')
+
+                        with _profile.phase('run.prepare'):
+                            os.makedirs(test_directory)
 
-                    os.makedirs(test_directory)
+                            if test in _preparators:
+                                bench_prep = _preparators[test](test_directory, context)
+                                bench_prep.prepare()
 
-                    if test in _preparators:
-                        bench_prep = _preparators[test](test_directory, context)
-                        bench_prep.prepare()
+                            # TODO: This part needs to be made more general if we start
+                            # TODO: supporting more than one runner
+
+                            # Dump here context information, so that it can be accessed
+                            # easily by post-processing commands
+                            json_file = os.path.join(test_directory, 'context.json')
+                            with open(json_file, 'w') as f:
+                                json.dump(context, f)
+
+                            # Instantiate a batch file for Slurm, then submit the job
+                            sbatch_content = template.render(**context)
+                            with open(batch_file, 'w') as f:
+                                f.write(sbatch_content)
+
+                        planned.append(dict(context))
+
+    # Batch files to be submitted, with the contexts of their tests
+    if array:
+        arrays = collections.OrderedDict()
+        for context in planned:
+            arrays.setdefault(_array_shape(context), []).append(context)
+        submissions = [
+            (_write_array(env, directory, contexts), contexts, True)
+            for contexts in arrays.values()
+        ]
+    elif pack:
+        packs = _pack(planned)
+        before, after = _node_hours([[c] for c in planned]), _node_hours(packs)
+        click.echo(
+            'Packed {0} tests in {1} jobs [estimated node-hours: '
+            '{2:.1f} -> {3:.1f}]'.format(len(planned), len(packs), before, after)
+        )
+        submissions = [
+            (_write_pack(env, directory, contexts), contexts, False)
+            for contexts in packs
+        ]
+    else:
+        submissions = [
+            (os.path.join(c['test_directory'], 'slurm_batch.sh'), [c], False)
+            for c in planned
+        ]
 
-                    # TODO: This part needs to be made more general if we start
-                    # TODO: supporting more than one runner
+    start = time.time()
+    with _profile.phase('run.submit'):
+        jobs, latencies, nretries, errors = _submit_all(
+            submissions, extra_args, submit_threads, retries
+        )
+    elapsed = time.time() - start
 
-                    # Dump here context information, so that it can be accessed
-                    # easily by post-processing commands
-                    json_file = os.path.join(test_directory, 'context.json')
-                    with open(json_file, 'w') as f:
-                        json.dump(context, f)
+    # Record the job ids, so that other commands don't need to
+    # query Slurm to find them
+    _campaign.save(directory, jobs)
 
-                    # Instantiate a batch file for Slurm, then submit the job
-                    sbatch_content = template.render(**context)
-                    with open(batch_file, 'w') as f:
-                        f.write(sbatch_content)
+    if latencies:
+        click.echo(
+            'Submitted {0} jobs in {1:.2f}s [sbatch latency: mean {2:.2f}s, '
+            'max {3:.2f}s, {4} retries]'.format(
+                len(latencies), elapsed, sum(latencies) / len(latencies),
+                max(latencies), nretries
+            )
+        )
 
-                    subprocess.call(['sbatch', '--parsable', *extra_args, batch_file], stdout=subprocess.PIPE)
+    if errors:
+        raise click.ClickException('\n'.join(errors))
 
 
 @sbench.command()
+@_profiled
 @click.option(
-    '--db', default=':memory:', help='The DB to be created or updated'
+    '--db', default=':memory:',
+    help='The DB to be created or updated, as a SQLite file or a SQLAlchemy URL'
 )
 @click.option(
     '-v', '--verbose', is_flag=True, default=False, help='Activate verbosity'
 )
+@click.option(
+    '-j', '--jobs', default=1, type=click.IntRange(min=1),
+    help='Number of processes used to parse the results'
+)
+@click.option(
+    '--batch-size', default=1000, type=click.IntRange(min=1),
+    help='Directories committed per transaction'
+)
+@click.option(
+    '--force', is_flag=True, default=False,
+    help='Re-ingest directories that didn\'t change since the last collect'
+)
+@click.option(
+    '--prune', is_flag=True, default=False,
+    help='Forget directories that disappeared (results are kept in the DB)'
+)
+@click.option(
+    '--cache', 'cache_file', default=None, envvar='SBENCH_PARSE_CACHE',
+    type=click.Path(dir_okay=False),
+    help='File caching the parsed directories for all the DBs [env: SBENCH_PARSE_CACHE]'
+)
+@click.option(
+    '--cache-size', default=1024, type=click.IntRange(min=0),
+    help='Maximum size of the parse cache in MB'
+)
+@click.argument(
+    'paths', nargs=-1, required=True, type=click.Path(
+        exists=True, file_okay=True, dir_okay=True, readable=True
+    )
+)
+def collect(db, verbose, jobs, batch_size, force, prune, cache_file, cache_size, paths):
+    """Collects the results of previous runs and stores them in a
+    DB. Each path is either a directory passed to ``run``, a
+    pack made by ``pack``, or a tarball of such directories, which is
+    read without extracting it. If a directory contains a campaign
+    manifest, only the test directories listed there are collected.
+
+    Directories read from packs and tarballs are always parsed, as they
+    are not recorded in the ingestion manifest nor in the parse cache.
+    """
+    import multiprocessing
+    from . import _archive, _cache, _manifest, _pack
+
+    for path in paths:
+        if not (os.path.isdir(path) or _pack.is_pack(path) or _archive.is_archive(path)):
+            raise click.ClickException(
+                '{0} is not a directory, a pack or a tarball'.format(path)
+            )
+
+    session = _open_session(db, verbose)
+
+    if prune:
+        pruned = sum(
+            _manifest.prune(session, path) for path in paths if os.path.isdir(path)
+        )
+        session.commit()
+        click.echo('Pruned {0} directories from the manifest'.format(pruned))
+
+    manifest = _manifest.load(session)
+    skipped = []
+
+    cache, hits = None, []
+    if cache_file:
+        cache = _cache.ParseCache(cache_file, cache_size * 2**20, _parser_versions)
+
+    def scan(root, entries):
+        with _profile.phase('manifest.scan'):
+            return root, _ingest_task(root, manifest, force, entries)
+
+    def tasks():
+        for path in paths:
+            if not os.path.isdir(path):
+                module = _pack if _pack.is_pack(path) else _archive
+                for root, contents in _profile.iterate('archive.read', module.iter_directories(path)):
+                    yield root, None, None, contents, None, force
+                continue
+
+            # Directories are fingerprinted by the threads walking the tree
+            for root, task in _profile.iterate('walk', _result_directories(path, scan)):
+                _profile.count('directories_walked')
+                if task is None:
+                    skipped.append(root)
+                    continue
+
+                with _profile.phase('cache.lookup'):
+                    record = cache.get(task[1]) if cache and task[1] else None
+                if record is not None:
+                    hits.append((root, dict(record, replace=task[5])))
+                else:
+                    yield task
+
+    def merge(results):
+        # Records found in the cache are written along with the ones
+        # being parsed, and the latter are added to the cache
+        for result in results:
+            while hits:
+                yield hits.pop()
+            if cache and result[1] is not None:
+                cache.put(result[1])
+            yield result
+        while hits:
+            yield hits.pop()
+
+    start = time.time()
+    if jobs == 1:
+        records = merge(_try_ingest(task) for task in tasks())
+        ndirs, nrows = write_records(session, records, batch_size)
+    else:
+        # Workers only parse, the current process is the only
+        # one writing to the DB
+        if _profile.enabled:
+            with multiprocessing.Pool(jobs, initializer=_profile.enable) as pool:
+                results = pool.imap(_try_ingest_profiled, tasks(), chunksize=16)
+                ndirs, nrows = write_records(session, merge(_merge_profiles(results)), batch_size)
+        else:
+            with multiprocessing.Pool(jobs) as pool:
+                records = merge(pool.imap(_try_ingest, tasks(), chunksize=16))
+                ndirs, nrows = write_records(session, records, batch_size)
+    elapsed = time.time() - start
+
+    if cache:
+        cache.close()
+
+    click.echo(
+        'Collected {0} directories ({1} rows) in {2:.2f}s '
+        '[{3:.1f} directories/s, {4:.1f} rows/s], '
+        'skipped {5} unchanged directories{6}'.format(
+            ndirs, nrows, elapsed,
+            ndirs / elapsed if elapsed else 0.0,
+            nrows / elapsed if elapsed else 0.0,
+            len(skipped),
+            ', parse cache: {0} hits, {1} misses'.format(cache.hits, cache.misses)
+            if cache else ''
+        )
+    )
+
+
+@sbench.command()
+@click.option(
+    '--remove-files', is_flag=True, default=False,
+    help='Remove the test directories once they are in the pack'
+)
 @click.argument(
     'directory', type=click.Path(
         exists=True, file_okay=False, dir_okay=True, readable=True
     )
 )
-def collect(db, verbose, directory):
-    """Collects the results of a previous run and stores them in a
-    SQLite DB.
+@click.argument('pack_file', type=click.Path(dir_okay=False, writable=True))
+def pack(remove_files, directory, pack_file):
+    """Stores the test directories of a previous run in a single pack
+    file, that ``collect`` reads like the directory. Environment dumps
+    are stored as diffs against the one of the first job with the same
+    cluster and software, and identical files are stored once.
+
+    The pack is appended to if it exists, and directories that are
+    already in the pack are skipped.
     """
-    engine = sqlalchemy.create_engine('sqlite:///' + db, echo=verbose)
-    session = sqlalchemy.orm.sessionmaker(bind=engine)()
+    import shutil
+    from . import _pack
+
+    start = time.time()
+    packed, nbytes = [], 0
+    with _pack.Pack(pack_file, 'a') as p:
+        known = set(p.directories())
+        for root, _ in _result_directories(directory):
+            name = os.path.relpath(root, directory)
+            if name in known:
+                continue
+            with open(os.path.join(root, 'context.json')) as f:
+                context = json.load(f)
+            group = '{0}/{1}/{2}'.format(
+                context.get('cluster'), context.get('compiler'), context.get('mpi')
+            )
+            nbytes += p.add(root, name, group)
+            packed.append(root)
+    elapsed = time.time() - start
+
+    if remove_files:
+        for root in packed:
+            shutil.rmtree(root)
+
+    size = os.path.getsize(pack_file)
+    click.echo(
+        'Packed {0} directories ({1:.1f} MB) in {2:.2f}s, '
+        'the pack is {3:.1f} MB'.format(len(packed), nbytes / 2**20, elapsed, size / 2**20)
+    )
+
 
-    for root, dirs, files in os.walk(directory):
-        # If a directory containing tests data was found, then parse the
-        # output and collect it into a DB
-        if not dirs and 'context.json' in files:
-            update_sql_db(root, session)
+@sbench.command()
+@click.option(
+    '--db', default=':memory:',
+    help='The DB to be created or updated, as a SQLite file or a SQLAlchemy URL'
+)
+@click.option(
+    '-v', '--verbose', is_flag=True, default=False, help='Activate verbosity'
+)
+@click.option(
+    '-j', '--jobs', default=1, type=click.IntRange(min=1),
+    help='Number of processes used to parse the results'
+)
+@click.option(
+    '--interval', default=30.0, type=click.FloatRange(min=0),
+    help='Seconds between two queries of the state of the jobs'
+)
+@click.option(
+    '--max-in-flight', default=8, type=click.IntRange(min=1),
+    help='Maximum number of directories being ingested at the same time'
+)
+@click.option(
+    '--timeout', default=None, type=click.FloatRange(min=0),
+    help='Seconds after which the jobs that are not done are given up on'
+)
+@click.argument(
+    'directory', type=click.Path(
+        exists=True, file_okay=False, dir_okay=True, readable=True
+    )
+)
+def watch(db, verbose, jobs, interval, max_in_flight, timeout, directory):
+    """Stores the results of a campaign in a DB as soon as each
+    of its jobs is done, and exits when all of them are done, or
+    with an error when --timeout is reached first.
+    """
+    campaign = _campaign.load(directory)
+    if not campaign:
+        raise click.ClickException(
+            'no campaign manifest found in {0}'.format(directory)
+        )
+    missing = _campaign.missing(campaign)
+    if missing:
+        _warn_missing(directory, missing)
+
+    import asyncio
+    from . import _manifest, _watch
+
+    session = _open_session(db, verbose)
+    manifest = _manifest.load(session)
+    totals = [0, 0]
+
+    async def ingest(root):
+        task = _ingest_task(root, manifest)
+        if task is None:
+            return
+        loop = asyncio.get_event_loop()
+        record = await loop.run_in_executor(executor, _try_ingest, task)
+        # The DB is only written from the event loop
+        ndirs, nrows = write_records(session, [record])
+        totals[0], totals[1] = totals[0] + ndirs, totals[1] + nrows
+
+    start = time.time()
+    with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+        not_done = asyncio.run(_watch.watch(
+            campaign, ingest, interval, max_in_flight, echo=click.echo, timeout=timeout
+        ))
+    elapsed = time.time() - start
+
+    click.echo('Collected {0} directories ({1} rows) in {2:.2f}s'.format(
+        totals[0], totals[1], elapsed
+    ))
+    if not_done:
+        raise click.ClickException('timed out waiting for {0} jobs: {1}'.format(
+            len(not_done), ', '.join(not_done)
+        ))
+
+
+@sbench.command()
+@click.option(
+    '--separator', default='\n', help='Separator printed between job ids'
+)
+@click.argument(
+    'directory', type=click.Path(
+        exists=True, file_okay=False, dir_okay=True, readable=True
+    )
+)
+def jobs(separator, directory):
+    """Prints the ids of the jobs submitted by a previous run, as
+    recorded in its campaign manifest.
+    """
+    job_ids = _campaign.job_ids(_campaign.load(directory))
+    if not job_ids:
+        raise click.ClickException(
+            'no campaign manifest found in {0}'.format(directory)
+        )
+
+    click.echo(separator.join(job_ids))
+
+
+@sbench.command()
+@click.option(
+    '--db', required=True, callback=_existing_db,
+    help='The DB to be exported, as a SQLite file or a SQLAlchemy URL'
+)
+@click.option(
+    '--format', 'fmt', default=None, type=click.Choice(['parquet', 'npz']),
+    help='Format of the files [default: parquet if pyarrow is installed, else npz]'
+)
+@click.option(
+    '--incremental', is_flag=True, default=False,
+    help='Only export the jobs that were not exported before in the directory'
+)
+@click.option(
+    '--chunk-size', default=100000, type=click.IntRange(min=1),
+    help='Number of rows fetched from the DB at once'
+)
+@click.argument('directory', type=click.Path(file_okay=False, dir_okay=True))
+def export(db, fmt, incremental, chunk_size, directory):
+    """Exports the results stored in a DB to columnar files, with one
+    partition per test and cluster, to be read with
+    ``sbench.columnar.read``.
+    """
+    try:
+        from . import columnar
+        import numpy  # NOQA: F401
+    except ImportError:
+        raise click.ClickException(
+            'numpy is needed to export results, install sbench[export]'
+        )
+
+    state = columnar.load_state(directory) if incremental else None
+    if state and fmt and fmt != state['format']:
+        raise click.ClickException(
+            'previous export in {0} is in {1} format'.format(directory, state['format'])
+        )
+    fmt = fmt or (state['format'] if state else columnar.default_format())
+    if fmt == 'parquet' and columnar.default_format() != 'parquet':
+        raise click.ClickException(
+            'pyarrow is needed to export to Parquet, install sbench[export]'
+        )
+    if not state:
+        state = {'format': fmt, 'tests': {}}
+
+    import sqlalchemy
+    from . import slurm  # NOQA: F401
+    from ._sql import create_engine
+
+    _parsers.load_all()
+    engine = create_engine(db)
+    views = set(sqlalchemy.inspect(engine).get_view_names())
+
+    os.makedirs(directory, exist_ok=True)
+    nrows, files = 0, []
+    start = time.time()
+    with engine.connect() as connection:
+        for test in _parsers.names():
+            table = _parsers[test].row_cls.__table__
+            if table.name + 'View' not in views:
+                continue
+            if not incremental:
+                columnar.clear(directory, test)
+            exported = state['tests'].setdefault(test, {})
+            n, written = columnar.export_table(
+                connection, table, test, directory, fmt, exported, chunk_size
+            )
+            nrows, files = nrows + n, files + written
+    elapsed = time.time() - start
+    columnar.save_state(directory, state)
+
+    size = sum(os.path.getsize(f) for f in files)
+    click.echo(
+        'Exported {0} rows to {1} files in {2:.2f}s [{3:.1f} rows/s], '
+        '{4:.1f} MB written{5}'.format(
+            nrows, len(files), elapsed, nrows / elapsed if elapsed else 0.0,
+            size / 2**20,
+            ' ({0:.1f} MB of DB)'.format(os.path.getsize(db) / 2**20) if os.path.isfile(db) else ''
+        )
+    )
+
+
+@sbench.command('rebuild-rollups')
+@click.option(
+    '--db', required=True, callback=_existing_db,
+    help='The DB with the results, as a SQLite file or a SQLAlchemy URL'
+)
+@click.option(
+    '--check', is_flag=True, default=False,
+    help='Only check that the rollups in the DB are the same as rebuilt ones'
+)
+def rebuild_rollups(db, check):
+    """Rebuilds from scratch the summary tables of the results, which
+    ``sbench collect`` maintains incrementally. With --check, exits with
+    an error if the rollups in the DB differ from the rebuilt ones.
+    """
+    from . import _rollups, slurm  # NOQA: F401
+    from ._sql import create_engine
+
+    _parsers.load_all()
+    engine = create_engine(db)
+    _create_tables(engine)
+
+    start = time.time()
+    with engine.begin() as connection:
+        parsers = {test: _parsers[test] for test in _parsers.names()}
+        summaries = _rollups.rebuild(connection, parsers)
+        if check:
+            different = _rollups.differences(_rollups.load(connection), summaries)
+        else:
+            table = _rollups.RollupRow.__table__
+            connection.execute(table.delete())
+            if summaries:
+                connection.execute(table.insert(), [s.row(k) for k, s in summaries.items()])
+    elapsed = time.time() - start
+
+    nresults = sum(s.count for s in summaries.values())
+    if not check:
+        click.echo('Rebuilt {0} rollups of {1} results in {2:.2f}s'.format(
+            len(summaries), nresults, elapsed
+        ))
+        return
+
+    for key in different[:20]:
+        click.echo('Rollup differs: ' + ', '.join(
+            '{0}={1}'.format(name, value) for name, value in zip(_rollups.key_columns, key)
+        ))
+    if different:
+        raise click.ClickException('{0} of {1} rollups differ from the results'.format(
+            len(different), len(summaries)
+        ))
+    click.echo('Checked {0} rollups of {1} results in {2:.2f}s'.format(
+        len(summaries), nresults, elapsed
+    ))
+
+
+@sbench.command()
+@click.option(
+    '--db', required=True, callback=_existing_db,
+    help='The DB with the results, as a SQLite file or a SQLAlchemy URL'
+)
+@click.option(
+    '--baseline-date', default=None, type=click.DateTime(),
+    help='Compare the jobs started after this date to the ones started before'
+)
+@click.option(
+    '--baseline-stack', default=None, type=click.Choice(sorted(mpi_stacks)),
+    help='Compare the jobs of --stack to the ones of this software stack'
+)
+@click.option(
+    '--stack', default=None, type=click.Choice(sorted(mpi_stacks)),
+    help='Software stack compared to --baseline-stack'
+)
+@click.option('--tests', default=None, help='Tests to be compared')
+@click.option(
+    '--threshold', default=0.1, type=click.FloatRange(min=0, max=1),
+    help='Relative loss of performance reported as a regression'
+)
+@click.option(
+    '--runs', default=10, type=click.IntRange(min=1),
+    help='Number of most recent runs of each configuration used on each side'
+)
+@click.option(
+    '--bootstrap', default=1000, type=click.IntRange(min=1),
+    help='Number of bootstrap resamples'
+)
+@click.option(
+    '--confidence', default=0.95, type=click.FloatRange(min=0, max=1),
+    help='Level of the confidence intervals'
+)
+def compare(db, baseline_date, baseline_stack, stack, tests, threshold, runs, bootstrap, confidence):
+    """Compares the results to a baseline, and exits with an error if
+    some results regressed. A result regressed if its median is worse
+    than the baseline by more than the threshold, and the whole
+    confidence interval of the ratio is below 1.
+
+    The baseline is either the jobs started before a date, or the jobs
+    of another software stack. In the latter case, the i-th compiler
+    and MPI of each stack in ``mpi_stacks`` are compared.
+
+    Tests with several metrics (e.g. the rates of mdtest) or series (e.g.
+    its modes) are compared for each of them.
+    """
+    if (baseline_date is None) == (baseline_stack is None):
+        raise click.ClickException('exactly one of --baseline-date and --baseline-stack is needed')
+    if baseline_stack and not stack:
+        raise click.ClickException('--stack is needed with --baseline-stack')
+
+    try:
+        import numpy
+        from . import _compare
+    except ImportError:
+        raise click.ClickException(
+            'numpy is needed to compare results, install sbench[export]'
+        )
+
+    import sqlalchemy
+    from . import slurm  # NOQA: F401
+    from ._sql import create_engine
+
+    _parsers.load_all()
+    tests = tests.split(',') if tests else _parsers.names()
+    engine = create_engine(db)
+    views = set(sqlalchemy.inspect(engine).get_view_names())
+
+    start = time.time()
+    npoints, nseries, regressions = 0, 0, []
+    with engine.connect() as connection:
+        for test in tests:
+            x, _, higher_is_better = _parsing.spec(_parsers[test])
+            columns = _parsing.series(_parsers[test])
+            names = _parsing.metrics(_parsers[test])
+            table = _parsers[test].row_cls.__table__
+            if table.name + 'View' not in views:
+                continue
+
+            for metric in names:
+                data, labels = _compare.load(
+                    connection, table, x, metric, runs, baseline_date, higher_is_better, columns
+                )
+                if baseline_date:
+                    side = (data['start'] >= numpy.datetime64(baseline_date)).astype('int64')
+                    keys = [data['cluster'], data['compiler'], data['mpi'], data['nnodes'], data['series']]
+                else:
+                    # The software of each row, as the side of the comparison
+                    # and the position of the software in its stack
+                    stacks = {}
+                    for i, (c, m) in enumerate(mpi_stacks[baseline_stack]):
+                        stacks[c, m] = (0, i)
+                    for i, (c, m) in enumerate(mpi_stacks[stack]):
+                        stacks[c, m] = (1, i)
+                    sid, first = _compare.group([data['compiler'], data['mpi']])
+                    software = numpy.array([
+                        stacks.get((labels['compiler'][data['compiler'][i]],
+                                    labels['mpi'][data['mpi'][i]]), (-1, -1))
+                        for i in first
+                    ], dtype='int64').reshape(-1, 2)[sid]
+                    side = software[:, 0]
+                    keys = [data['cluster'], software[:, 1], data['nnodes'], data['series']]
+
+                selected = side >= 0
+                keys = [k[selected] for k in keys]
+                data = {k: v[selected] for k, v in data.items()}
+                side = side[selected]
+                if not len(side):
+                    continue
+
+                gid, first = _compare.group(keys + [data['x']])
+                sides = [
+                    _compare.latest(
+                        gid[side == s], len(first), data['start'][side == s],
+                        data['value'][side == s], runs
+                    )
+                    for s in (0, 1)
+                ]
+                result = _compare.compare(
+                    sides[0], sides[1], higher_is_better, bootstrap, confidence
+                )
+
+                compared = numpy.isfinite(result['ratio'])
+                npoints += int(compared.sum())
+                nseries += len(numpy.unique(_compare.group(keys)[0][first[compared]]))
+
+                # Rows that label each group. In stack mode, the rows of the
+                # candidates are used so that their software is reported.
+                label = first
+                if not baseline_date:
+                    candidates = numpy.flatnonzero(side == 1)[::-1]
+                    label = first.copy()
+                    label[gid[candidates]] = candidates
+
+                regressed = compared & (result['ratio'] < 1 - threshold) & (result['high'] < 1)
+                for g in numpy.flatnonzero(regressed):
+                    i = label[g]
+                    regressions.append((
+                        labels['cluster'][data['cluster'][i]],
+                        labels['compiler'][data['compiler'][i]],
+                        labels['mpi'][data['mpi'][i]],
+                        _parsing.series_name(
+                            test, columns, labels['series'][data['series'][i]], metric if len(names) > 1 else None
+                        ),
+                        data['nnodes'][i], data['x'][i] if x else '-', result['base'][g],
+                        result['candidate'][g], result['ratio'][g], result['low'][g], result['high'][g]
+                    ))
+    elapsed = time.time() - start
+
+    # Series of tests are named after their series columns, which can
+    # be longer than the names of the tests
+    width = max([14] + [len(r[3]) for r in regressions])
+    if regressions:
+        click.echo('{0:<10} {1:<14} {2:<10} {3:<{w}} {4:>6} {5:>9} {6:>12} {7:>12} {8:>22}'.format(
+            'cluster', 'compiler', 'mpi', 'test', 'nnodes', 'x', 'baseline', 'candidate', 'ratio [CI]', w=width
+        ))
+    for r in sorted(regressions, key=lambda r: r[8]):
+        click.echo(
+            '{0:<10} {1:<14} {2:<10} {3:<{w}} {4:>6} {5:>9} {6:>12.4g} {7:>12.4g} '
+            '{8:>6.2f} [{9:.2f}, {10:.2f}]'.format(*r, w=width)
+        )
+
+    click.echo(
+        'Compared {0} points of {1} series in {2:.2f}s, '
+        'found {3} regressions beyond {4:.0%}'.format(
+            npoints, nseries, elapsed, len(regressions), threshold
+        )
+    )
+    if regressions:
+        raise click.ClickException('performance regressions found')
+
+
+@sbench.command()
+@click.option(
+    '--db', required=True, callback=_existing_db,
+    help='The DB with the results, as a SQLite file or a SQLAlchemy URL'
+)
+@click.option(
+    '--tests', default='osu_bw_pairs,osu_latency_pairs',
+    help='Tests run between pairs of nodes to be analyzed'
+)
+@click.option(
+    '--since', default=None, type=click.DateTime(),
+    help='Only analyze the jobs started after this date'
+)
+@click.option(
+    '--threshold', default=0.2, type=click.FloatRange(min=0, max=1),
+    help='Relative loss of performance, compared to the median of the cluster, '
+         'reported as an outlier'
+)
+def links(db, tests, since, threshold):
+    """Finds the nodes and links that are slower than the others, from
+    the tests run between each pair of nodes of a job, and exits with
+    an error if some were found.
+
+    Each result is compared to the median of the results of the same
+    cluster and message size. Links are scored by the median of their
+    results, and nodes by the median score of their links. Links of the
+    slow nodes are not reported.
+    """
+    import sqlalchemy
+    from . import _links, slurm  # NOQA: F401
+    from ._sql import create_engine
+
+    tests = tests.split(',')
+    not_existing = [t for t in tests if t not in _parsers.names()]
+    if not_existing:
+        raise click.ClickException(
+            'couldn\'t find the following tests: {0}'.format(', '.join(not_existing))
+        )
+
+    _parsers.load_all()
+    engine = create_engine(db)
+    views = set(sqlalchemy.inspect(engine).get_view_names())
+
+    start = time.time()
+    nresults, slow = 0, []
+    with engine.connect() as connection:
+        for test in tests:
+            parser_cls = _parsers[test]
+            table = parser_cls.row_cls.__table__
+            if table.name + 'View' not in views:
+                continue
+            results = _links.load(connection, table, parser_cls.float_tag, since)
+            for cluster, rows in sorted(results.items()):
+                nresults += len(rows)
+                link_scores, node_scores = _links.scores(rows, parser_cls.higher_is_better)
+                slow_nodes = _links.outliers(node_scores, threshold)
+                slow += [(cluster, test, 'node', node, score) for node, score in slow_nodes]
+                # Links of slow nodes are slow because of the node
+                slow_nodes = {node for node, _ in slow_nodes}
+                slow += [
+                    (cluster, test, 'link', '{0} -> {1}'.format(*link), score)
+                    for link, score in _links.outliers(link_scores, threshold)
+                    if not slow_nodes.intersection(link)
+                ]
+    elapsed = time.time() - start
+
+    if slow:
+        click.echo('{0:<10} {1:<18} {2:<5} {3:<24} {4:>6}'.format(
+            'cluster', 'test', 'kind', 'name', 'score'
+        ))
+    for s in slow:
+        click.echo('{0:<10} {1:<18} {2:<5} {3:<24} {4:>6.2f}'.format(*s))
+
+    nnodes = sum(1 for s in slow if s[2] == 'node')
+    click.echo(
+        'Analyzed {0} results in {1:.2f}s, found {2} slow nodes and {3} slow links '
+        'beyond {4:.0%}'.format(nresults, elapsed, nnodes, len(slow) - nnodes, threshold)
+    )
+    if slow:
+        raise click.ClickException('slow nodes or links found')
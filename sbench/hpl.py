@@ -1,31 +1,41 @@
-import os
 import re
-import jinja2
-from math import sqrt
-from sqlalchemy import Column, Integer, Float, ForeignKey, String
 
-from ._sql import Base
-from .commands import parser, preparator, clusters_info
+from sqlalchemy import Column, Integer, Float, String
+
+from ._parsing import match_lines
+from ._sql import Base, insert_new_rows, job_foreign_key
+from .commands import parser
 
 
 class HPLRow(Base):
     """Results of the hpl benchmark"""
     __tablename__ = 'HPL'
+    __table_args__ = (job_foreign_key(),)
 
     # Foreign keys to identify a job
-    cluster = Column(String, ForeignKey('Jobs.cluster'), primary_key=True)
-    jobid = Column(Integer, ForeignKey('Jobs.id'), primary_key=True)
-
-    N = Column(Integer)
-    NB = Column(Integer)
-    P = Column(Integer)
-    Q = Column(Integer)
+    cluster = Column(String, primary_key=True)
+    jobid = Column(Integer, primary_key=True)
+
+    # Parameters of each problem, as a job can run several of them
+    N = Column(Integer, primary_key=True)
+    NB = Column(Integer, primary_key=True)
+    P = Column(Integer, primary_key=True)
+    Q = Column(Integer, primary_key=True)
     time = Column(Float)
     gflops = Column(Float)
 
 
 @parser('hpl')
 class HPLParser(object):
+    #: Row in the correct DB table
+    row_cls = HPLRow
+    #: Column compared by ``sbench compare``
+    metric = 'gflops'
+    #: Higher values are better
+    higher_is_better = True
+    #: Version of the parser, to be increased when ``parse`` changes
+    version = 1
+
     results_regex = re.compile(r'WR\w+\s+(?P<N>\d+)\s+(?P<NB>\d+)'
                                r'\s+(?P<P>\d+)\s+(?P<Q>\d+)'
                                r'\s+(?P<time>[0-9.e+]+)'
@@ -36,72 +46,46 @@ class HPLParser(object):
         self.job = job
         self.context = context
 
-    def update_sql_db(self, session):
-        rows = []
-        with open(self.job.output) as f:
-            for line in f.readlines():
-                r = self.results_regex.match(line)
-                if not r:
-                    continue
-
-                kwargs = {
-                    'cluster': self.job.cluster,
-                    'jobid': self.job.id,
-                }
-                for measure in ['N', 'NB', 'P', 'Q']:
-                    kwargs[measure] = int(r.group(measure))
-
-                for measure in ['time', 'gflops']:
-                    kwargs[measure] = float(r.group(measure))
-
-                rows.append(HPLRow(**kwargs))
-
-        session.add_all(rows)
+    def parse(self):
+        """Parses the output of the benchmark, without touching the DB.
 
+        Returns:
+            A list of dictionaries, each one with the columns of a ``HPLRow``
+        """
+        rows = []
+        for r in match_lines(self.job.lines('output'), self.results_regex):
+            kwargs = {
+                'cluster': self.job.cluster,
+                'jobid': int(self.job.id),
+            }
+            for measure in ['N', 'NB', 'P', 'Q']:
+                kwargs[measure] = int(r.group(measure))
 
-def _get_dimensions(n):
-        n = int(n)
-        divisors = (i for i in range(1, int(sqrt(n)+1)) if n % i == 0)
-        min_divisor = min(divisors, key=lambda d: abs(d - sqrt(n)))
-
-        return min_divisor, n // min_divisor
-
-
-@preparator('hpl')
-class HPLPreparator(object):
-    block_size = 256
-    memory_percent = 86
-
-    """Input file preparator for hpl benchmarks."""
-    def __init__(self, directory, context):
-        self.directory = directory
-        self.context = context
-
-    def prepare(self):
-        input_file = os.path.join(self.directory, 'HPL.dat')
+            for measure in ['time', 'gflops']:
+                kwargs[measure] = float(r.group(measure))
 
-        cluster_info = clusters_info[self.context['cluster']]
+            rows.append(kwargs)
 
-        if not self.context['ntasks']:
-            self.context['ntasks'] = cluster_info['ncores'] * self.context['nnodes']
-        mem = min(cluster_info['mem']) * self.context['nnodes'] * 2**30 / 8
-        mem = int((self.memory_percent / 100) * sqrt(mem))
-        mem = mem // self.block_size * self.block_size
+        return rows
 
-        if 'intel' in self.context['compiler']:
-            self.context['blas'] = 'intel-mkl'
-        else:
-            self.context['blas'] = 'openblas'
+    @classmethod
+    def store(cls, session, rows):
+        """Inserts in the DB the rows that are not already there.
 
-        self.context['P'], self.context['Q'] = _get_dimensions(self.context['ntasks'])
-        self.context['NB'] = self.block_size
-        self.context['memory'] = mem
-        self.context['memory_percent'] = self.memory_percent
+        Args:
+            session (session): SQLite session to be updated
+            rows (list): rows of a single job, as returned by ``parse``
 
-        env = jinja2.Environment(loader=jinja2.PackageLoader('sbench', 'templates'))
+        Returns:
+            The number of rows inserted
+        """
+        if not rows:
+            return 0
 
-        template = env.get_template('HPL.dat')
+        return insert_new_rows(
+            session, cls.row_cls, rows,
+            cluster=rows[0]['cluster'], jobid=rows[0]['jobid']
+        )
 
-        input_content = template.render(**self.context)
-        with open(input_file, 'w') as f:
-            f.write(input_content)
+    def update_sql_db(self, session):
+        self.store(session, self.parse())
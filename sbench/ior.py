@@ -0,0 +1,190 @@
+import re
+
+from sqlalchemy import Column, Integer, Float, String
+
+from ._sql import Base, insert_new_rows, job_foreign_key
+from .commands import parser
+
+
+class IORRow(Base):
+    """Results of the IOR benchmark"""
+    __tablename__ = 'IOR'
+    __table_args__ = (job_foreign_key(),)
+
+    # Foreign keys to identify a job
+    cluster = Column(String, primary_key=True)
+    jobid = Column(Integer, primary_key=True)
+
+    # 'fpp' for a file per process, 'shared' for a file shared by all
+    mode = Column(String, primary_key=True)
+    # Size of each I/O call, and of the data of each process, in bytes
+    transfer_size = Column(Integer, primary_key=True)
+    block_size = Column(Integer)
+    # Mean bandwidth in MiB/s and mean number of I/O calls per second
+    write_bandwidth = Column(Float)
+    read_bandwidth = Column(Float)
+    write_iops = Column(Float)
+    read_iops = Column(Float)
+
+
+class MdtestRow(Base):
+    """Results of the mdtest benchmark"""
+    __tablename__ = 'Mdtest'
+    __table_args__ = (job_foreign_key(),)
+
+    # Foreign keys to identify a job
+    cluster = Column(String, primary_key=True)
+    jobid = Column(Integer, primary_key=True)
+
+    # 'unique' for a directory per process, 'shared' for a single one
+    mode = Column(String, primary_key=True)
+    # Number of files and directories created by each process
+    items = Column(Integer)
+    # Mean number of operations per second
+    dir_create = Column(Float)
+    dir_stat = Column(Float)
+    dir_remove = Column(Float)
+    file_create = Column(Float)
+    file_stat = Column(Float)
+    file_read = Column(Float)
+    file_remove = Column(Float)
+    tree_create = Column(Float)
+    tree_remove = Column(Float)
+
+
+class _IOParser(object):
+    """Base class of the parsers of jobs that run a benchmark several
+    times, printing a ``run_regex`` header with the parameters of each
+    run before its output.
+
+    Subclasses define ``run_parameters``, which returns the columns set
+    by the header, and ``parse_line``, which adds the results found in
+    a line of output to the row of the run. ``parse_line`` can keep
+    what it needs in ``state``, which is emptied at each run.
+    """
+    #: Version of the parser, to be increased when ``parse`` changes
+    version = 1
+    #: Higher values are better
+    higher_is_better = True
+
+    def __init__(self, job, context):
+        self.job = job
+        self.context = context
+
+    def parse(self):
+        """Parses the output of the benchmark, without touching the DB.
+
+        Returns:
+            A list of dictionaries, each one with the columns of a ``row_cls``
+        """
+        rows, state = [], {}
+        for line in self.job.lines('output'):
+            match = self.run_regex.match(line)
+            if match:
+                rows.append(dict(
+                    cluster=self.job.cluster, jobid=int(self.job.id),
+                    **self.run_parameters(match)
+                ))
+                state = {}
+            elif rows:
+                self.parse_line(line, rows[-1], state)
+
+        return rows
+
+    @classmethod
+    def store(cls, session, rows):
+        """Inserts in the DB the rows that are not already there.
+
+        Args:
+            session (session): SQLite session to be updated
+            rows (list): rows of a single job, as returned by ``parse``
+
+        Returns:
+            The number of rows inserted
+        """
+        if not rows:
+            return 0
+
+        return insert_new_rows(
+            session, cls.row_cls, rows,
+            cluster=rows[0]['cluster'], jobid=rows[0]['jobid']
+        )
+
+    def update_sql_db(self, session):
+        self.store(session, self.parse())
+
+
+@parser('ior')
+class IORParser(_IOParser):
+    #: Row in the correct DB table
+    row_cls = IORRow
+    #: Size of the benchmark
+    int_tag = 'transfer_size'
+    #: Columns compared by ``sbench compare``
+    metrics = ('write_bandwidth', 'read_bandwidth', 'write_iops', 'read_iops')
+    #: A file per process and a shared file are compared apart
+    series = ('mode',)
+
+    run_regex = re.compile(r'^# ior mode=(\w+) transfer=(\d+) block=(\d+)')
+
+    def run_parameters(self, match):
+        return {
+            'mode': match.group(1),
+            'transfer_size': int(match.group(2)),
+            'block_size': int(match.group(3))
+        }
+
+    def parse_line(self, line, row, state):
+        # The summary is a table, whose columns depend on the version
+        fields = line.split()
+        if not fields:
+            return
+        if fields[0] == 'Operation' and 'Mean(MiB)' in fields:
+            state['columns'] = fields
+        elif fields[0] in ('write', 'read') and 'columns' in state:
+            columns = state['columns']
+            for column, name in (('Mean(MiB)', 'bandwidth'), ('Mean(OPs)', 'iops')):
+                if column in columns and len(fields) > columns.index(column):
+                    row['{0}_{1}'.format(fields[0], name)] = float(fields[columns.index(column)])
+
+
+@parser('mdtest')
+class MdtestParser(_IOParser):
+    #: Row in the correct DB table
+    row_cls = MdtestRow
+    #: Columns compared by ``sbench compare``. Trees are created and
+    #: removed once per run, which is too short to time reliably.
+    metrics = (
+        'file_create', 'file_stat', 'file_read', 'file_remove', 'dir_create', 'dir_stat', 'dir_remove'
+    )
+    #: A directory per process and a shared directory are compared apart
+    series = ('mode',)
+
+    run_regex = re.compile(r'^# mdtest mode=(\w+) items=(\d+)')
+    #: Matches the max, min and mean rate of an operation in the summary
+    rate_regex = re.compile(
+        r'^\s*((?:Directory|File|Tree) \w+)\s*:\s+([\d.]+)\s+([\d.]+)\s+([\d.]+)'
+    )
+    operations = {
+        'Directory creation': 'dir_create',
+        'Directory stat': 'dir_stat',
+        'Directory removal': 'dir_remove',
+        'File creation': 'file_create',
+        'File stat': 'file_stat',
+        'File read': 'file_read',
+        'File removal': 'file_remove',
+        'Tree creation': 'tree_create',
+        'Tree removal': 'tree_remove',
+    }
+
+    def run_parameters(self, match):
+        return {'mode': match.group(1), 'items': int(match.group(2))}
+
+    def parse_line(self, line, row, state):
+        # Recent versions also summarize the time of the operations
+        if line.startswith('SUMMARY'):
+            state['rates'] = 'time' not in line.split(':')[0]
+            return
+        match = self.rate_regex.match(line)
+        if match and state.get('rates') and match.group(1) in self.operations:
+            row[self.operations[match.group(1)]] = float(match.group(4))
@@ -1,18 +1,20 @@
 import re
 
-from sqlalchemy import Column, Integer, Float, ForeignKey, String
+from sqlalchemy import Column, Integer, Float, String
 
-from ._sql import Base
+from ._parsing import match_lines
+from ._sql import Base, insert_new_rows, job_foreign_key
 from .commands import parser
 
 
 class OsuLatencyRow(Base):
     """Results of the osu_latency benchmark"""
     __tablename__ = 'OsuLatency'
+    __table_args__ = (job_foreign_key(),)
 
     # Foreign keys to identify a job
-    cluster = Column(String, ForeignKey('Jobs.cluster'), primary_key=True)
-    jobid = Column(Integer, ForeignKey('Jobs.id'), primary_key=True)
+    cluster = Column(String, primary_key=True)
+    jobid = Column(Integer, primary_key=True)
     # Size of the message in bytes
     size = Column(Integer, primary_key=True, nullable=False)
     # Latency in micro-seconds
@@ -22,10 +24,11 @@ class OsuLatencyRow(Base):
 class OsuBwRow(Base):
     """Results of the osu_bw benchmark"""
     __tablename__ = 'OsuBandwith'
+    __table_args__ = (job_foreign_key(),)
 
     # Foreign keys to identify a job
-    cluster = Column(String, ForeignKey('Jobs.cluster'), primary_key=True)
-    jobid = Column(Integer, ForeignKey('Jobs.id'), primary_key=True)
+    cluster = Column(String, primary_key=True)
+    jobid = Column(Integer, primary_key=True)
     # Size of the message in bytes
     size = Column(Integer, primary_key=True, nullable=False)
     # Bandwidth in MB/sec.
@@ -35,10 +38,11 @@ class OsuBwRow(Base):
 class OsuBiBwRow(Base):
     """Results of the osu_bw benchmark"""
     __tablename__ = 'OsuBidirectionalBandwith'
+    __table_args__ = (job_foreign_key(),)
 
     # Foreign keys to identify a job
-    cluster = Column(String, ForeignKey('Jobs.cluster'), primary_key=True)
-    jobid = Column(Integer, ForeignKey('Jobs.id'), primary_key=True)
+    cluster = Column(String, primary_key=True)
+    jobid = Column(Integer, primary_key=True)
     # Size of the message in bytes
     size = Column(Integer, primary_key=True, nullable=False)
     # Bandwidth in MB/sec.
@@ -48,10 +52,11 @@ class OsuBiBwRow(Base):
 class OsuAlltoallRow(Base):
     """Results of the osu_latency benchmark"""
     __tablename__ = 'OsuAlltoall'
+    __table_args__ = (job_foreign_key(),)
 
     # Foreign keys to identify a job
-    cluster = Column(String, ForeignKey('Jobs.cluster'), primary_key=True)
-    jobid = Column(Integer, ForeignKey('Jobs.id'), primary_key=True)
+    cluster = Column(String, primary_key=True)
+    jobid = Column(Integer, primary_key=True)
     # Size of the message in bytes
     size = Column(Integer, primary_key=True, nullable=False)
     # Latency in micro-seconds
@@ -61,10 +66,45 @@ class OsuAlltoallRow(Base):
 class OsuAllreduceRow(Base):
     """Results of the osu_latency benchmark"""
     __tablename__ = 'OsuAllreduce'
+    __table_args__ = (job_foreign_key(),)
 
     # Foreign keys to identify a job
-    cluster = Column(String, ForeignKey('Jobs.cluster'), primary_key=True)
-    jobid = Column(Integer, ForeignKey('Jobs.id'), primary_key=True)
+    cluster = Column(String, primary_key=True)
+    jobid = Column(Integer, primary_key=True)
+    # Size of the message in bytes
+    size = Column(Integer, primary_key=True, nullable=False)
+    # Latency in micro-seconds
+    latency = Column(Float)
+
+
+class OsuBwPairsRow(Base):
+    """Results of osu_bw between each pair of nodes of a job"""
+    __tablename__ = 'OsuBandwithPairs'
+    __table_args__ = (job_foreign_key(),)
+
+    # Foreign keys to identify a job
+    cluster = Column(String, primary_key=True)
+    jobid = Column(Integer, primary_key=True)
+    # Nodes of the ranks sending and receiving the messages
+    src = Column(String, primary_key=True, nullable=False)
+    dst = Column(String, primary_key=True, nullable=False)
+    # Size of the message in bytes
+    size = Column(Integer, primary_key=True, nullable=False)
+    # Bandwidth in MB/sec.
+    bandwidth = Column(Float)
+
+
+class OsuLatencyPairsRow(Base):
+    """Results of osu_latency between each pair of nodes of a job"""
+    __tablename__ = 'OsuLatencyPairs'
+    __table_args__ = (job_foreign_key(),)
+
+    # Foreign keys to identify a job
+    cluster = Column(String, primary_key=True)
+    jobid = Column(Integer, primary_key=True)
+    # Nodes of the ranks sending and receiving the messages
+    src = Column(String, primary_key=True, nullable=False)
+    dst = Column(String, primary_key=True, nullable=False)
     # Size of the message in bytes
     size = Column(Integer, primary_key=True, nullable=False)
     # Latency in micro-seconds
@@ -77,45 +117,59 @@ int_and_float = re.compile('^([\d]+)[\s]*([\d.]+)$')
 
 class _OsuParser(object):
     """Base class for any parser of an osu benchmark test."""
+    #: Version of the parser, to be increased when ``parse`` changes
+    version = 1
+
     def __init__(self, job, context):
         self.job = job
         self.context = context
 
-    def update_sql_db(self, session):
+    def parse(self):
+        """Parses the output of the benchmark, without touching the DB.
+
+        Returns:
+            A list of dictionaries, each one with the columns of a ``row_cls``
+        """
         rows = []
-        with open(self.job.output) as f:
-            for line in f.readlines():
-                r = self.osu_test_regex.match(line)
-                if r:
-                    item, created = self.query_or_create(session, r)
-                    if created:
-                        rows.append(item)
+        for r in match_lines(self.job.lines('output'), self.osu_test_regex):
+            rows.append(self.make_row(r))
 
-        session.add_all(rows)
+        return rows
+
+    def update_sql_db(self, session):
+        self.store(session, self.parse())
 
 
 class _OsuIntAndFloat(_OsuParser):
     #: Parses the size and latency of the osu_latency benchmark
     osu_test_regex = int_and_float
 
-    def query_or_create(self, session, regexp):
-        int_value, created = int(regexp.group(1)), False
+    def make_row(self, regexp):
+        return {
+            'cluster': self.job.cluster,
+            'jobid': int(self.job.id),
+            self.int_tag: int(regexp.group(1)),
+            self.float_tag: float(regexp.group(2))
+        }
 
-        item = session.query(self.row_cls).filter_by(
-            jobid=self.job.id, size=int_value
-        ).first()
+    @classmethod
+    def store(cls, session, rows):
+        """Inserts in the DB the rows that are not already there.
 
-        if not item:
-            float_value = float(regexp.group(2))
-            kwargs = {
-                'cluster': self.job.cluster,
-                'jobid': self.job.id,
-                self.int_tag: int_value,
-                self.float_tag: float_value
-            }
-            item, created = self.row_cls(**kwargs), True
+        Args:
+            session (session): SQLite session to be updated
+            rows (list): rows of a single job, as returned by ``parse``
 
-        return item, created
+        Returns:
+            The number of rows inserted
+        """
+        if not rows:
+            return 0
+
+        return insert_new_rows(
+            session, cls.row_cls, rows,
+            cluster=rows[0]['cluster'], jobid=rows[0]['jobid']
+        )
 
 
 @parser('osu_latency')
@@ -126,6 +180,8 @@ class OsuLatency(_OsuIntAndFloat):
     int_tag = 'size'
     #: Latency in micro-seconds
     float_tag = 'latency'
+    #: Higher values are better
+    higher_is_better = False
 
 
 @parser('osu_bw')
@@ -136,6 +192,8 @@ class OsuBw(_OsuIntAndFloat):
     int_tag = 'size'
     #: Latency in micro-seconds
     float_tag = 'bandwidth'
+    #: Higher values are better
+    higher_is_better = True
 
 
 @parser('osu_bibw')
@@ -146,6 +204,8 @@ class OsuBiBw(_OsuIntAndFloat):
     int_tag = 'size'
     #: Latency in micro-seconds
     float_tag = 'bandwidth'
+    #: Higher values are better
+    higher_is_better = True
 
 
 @parser('osu_alltoall')
@@ -156,6 +216,8 @@ class OsuAlltoall(_OsuIntAndFloat):
     int_tag = 'size'
     #: Latency in micro-seconds
     float_tag = 'latency'
+    #: Higher values are better
+    higher_is_better = False
 
 
 @parser('osu_allreduce')
@@ -166,3 +228,59 @@ class OsuAllreduce(_OsuIntAndFloat):
     int_tag = 'size'
     #: Latency in micro-seconds
     float_tag = 'latency'
+    #: Higher values are better
+    higher_is_better = False
+
+
+#: Header printed before the results of each pair of nodes
+pair_header = re.compile(r'^# pair (\S+) (\S+)$')
+
+
+class _OsuPairs(_OsuIntAndFloat):
+    """Base class of the parsers of osu benchmarks run between each pair
+    of nodes of a job, whose output is the output of each pair preceded
+    by a ``pair_header``.
+    """
+    #: Compared by ``sbench links`` rather than by ``sbench compare``,
+    #: as a job has a result per pair of nodes
+    metric = None
+
+    def parse(self):
+        rows, pair = [], None
+        for line in self.job.lines('output'):
+            line = line.strip()
+            header = pair_header.match(line)
+            if header:
+                pair = header.groups()
+                continue
+            result = self.osu_test_regex.match(line)
+            if result and pair:
+                row = self.make_row(result)
+                row['src'], row['dst'] = pair
+                rows.append(row)
+
+        return rows
+
+
+@parser('osu_bw_pairs')
+class OsuBwPairs(_OsuPairs):
+    #: Row in the correct DB table
+    row_cls = OsuBwPairsRow
+    #: Size of the benchmark
+    int_tag = 'size'
+    #: Bandwidth in MB/sec.
+    float_tag = 'bandwidth'
+    #: Higher values are better
+    higher_is_better = True
+
+
+@parser('osu_latency_pairs')
+class OsuLatencyPairs(_OsuPairs):
+    #: Row in the correct DB table
+    row_cls = OsuLatencyPairsRow
+    #: Size of the benchmark
+    int_tag = 'size'
+    #: Latency in micro-seconds
+    float_tag = 'latency'
+    #: Higher values are better
+    higher_is_better = False
@@ -0,0 +1,221 @@
+import os
+from math import sqrt
+
+import jinja2
+
+from . import _links, _tuning
+from .commands import preparator, clusters_info, target_info, test_list
+
+# Preparators don't depend on the DB layer, so that preparing and
+# submitting jobs doesn't require loading SQLAlchemy
+
+
+def _get_dimensions(n):
+        n = int(n)
+        divisors = (i for i in range(1, int(sqrt(n)+1)) if n % i == 0)
+        min_divisor = min(divisors, key=lambda d: abs(d - sqrt(n)))
+
+        return min_divisor, n // min_divisor
+
+
+@preparator('hpl')
+class HPLPreparator(object):
+    block_size = 256
+    memory_percent = 86
+
+    """Input file preparator for hpl benchmarks.
+
+    The input file runs a single problem, unless the context has a
+    ``hpl_sweep`` from ``_tuning.next_sweep``, in which case all the
+    combinations of its parameters are run.
+    """
+    def __init__(self, directory, context):
+        self.directory = directory
+        self.context = context
+
+    def prepare(self):
+        input_file = os.path.join(self.directory, 'HPL.dat')
+
+        cluster_info = clusters_info[self.context['cluster']]
+
+        if not self.context['ntasks']:
+            self.context['ntasks'] = cluster_info['ncores'] * self.context['nnodes']
+        mem = _tuning.max_problem_size(min(cluster_info['mem']), self.context['nnodes'])
+        mem = int((self.memory_percent / 100) * mem)
+        mem = mem // self.block_size * self.block_size
+
+        if 'intel' in self.context['compiler']:
+            self.context['blas'] = 'intel-mkl'
+        else:
+            self.context['blas'] = 'openblas'
+
+        self.context['P'], self.context['Q'] = _get_dimensions(self.context['ntasks'])
+        self.context['NB'] = self.block_size
+        self.context['memory'] = mem
+        self.context['memory_percent'] = self.memory_percent
+
+        sweep = self.context.get('hpl_sweep')
+        if sweep:
+            self.context['Ns'], self.context['NBs'] = sweep['Ns'], sweep['NBs']
+            self.context['grids'] = sweep['grids']
+        else:
+            self.context['Ns'], self.context['NBs'] = [mem], [self.block_size]
+            self.context['grids'] = [[self.context['P'], self.context['Q']]]
+
+        env = jinja2.Environment(loader=jinja2.PackageLoader('sbench', 'templates'))
+
+        template = env.get_template('HPL.dat')
+
+        input_content = template.render(**self.context)
+        with open(input_file, 'w') as f:
+            f.write(input_content)
+
+
+@preparator('osu_bw_pairs')
+@preparator('osu_latency_pairs')
+class OsuPairsPreparator(object):
+    """Schedules the pairs of nodes of the osu tests run between each
+    pair of nodes of the job, in rounds of disjoint pairs. The nodes
+    are known only when the job runs, so pairs are scheduled as pairs
+    of indices in the list of nodes of the job.
+    """
+    def __init__(self, directory, context):
+        self.directory = directory
+        self.context = context
+
+    def prepare(self):
+        rounds = _links.schedule(self.context['nnodes'])
+        self.context['rounds'] = rounds
+        self.context['estimated_runtime'] = (
+            len(rounds) * test_list[self.context['name']]['round_runtime']
+        )
+
+
+@preparator('ior')
+class IORPreparator(object):
+    """Chooses the runs of IOR of a job from its number of nodes.
+
+    Every job writes then reads a file per process with transfers of
+    1 MiB, and a file shared by all the processes with transfers of a
+    block of the filesystem, so that processes don't write to the same
+    blocks. Jobs on a few nodes also measure the rate of small
+    transfers, which doesn't improve with more nodes and is slow.
+    """
+    tasks_per_node = 8
+    #: Data written by the processes of a node in each run
+    data_per_node = 16 * 2**30
+    #: Block size of the filesystem
+    fs_block_size = 4 * 2**20
+    small_transfer = 4096
+    small_data_per_node = 2**30
+    small_io_max_nodes = 2
+    #: Number of times each run is repeated by IOR
+    repetitions = 3
+
+    def __init__(self, directory, context):
+        self.directory = directory
+        self.context = context
+
+    def prepare(self):
+        nnodes = self.context['nnodes']
+        if not self.context['ntasks']:
+            self.context['ntasks'] = self.tasks_per_node * nnodes
+        tasks_per_node = max(self.context['ntasks'] // nnodes, 1)
+
+        block = self.data_per_node // tasks_per_node
+        block = max(block // self.fs_block_size, 1) * self.fs_block_size
+        runs = [
+            {'mode': 'fpp', 'transfer': 2**20, 'block': block},
+            {'mode': 'shared', 'transfer': self.fs_block_size, 'block': block},
+        ]
+        if nnodes <= self.small_io_max_nodes:
+            runs.append({
+                'mode': 'fpp', 'transfer': self.small_transfer,
+                'block': self.small_data_per_node // tasks_per_node
+            })
+
+        self.context['ior_runs'] = runs
+        self.context['tasks_per_node'] = tasks_per_node
+        self.context['repetitions'] = self.repetitions
+        self.context['scratch'] = test_list['ior']['scratch']
+
+
+@preparator('mdtest')
+class MdtestPreparator(object):
+    """Chooses the number of files created by each process of mdtest,
+    so that jobs on more nodes don't take much longer.
+
+    Each job creates, stats, reads and removes files in a directory per
+    process, then in a directory shared by all the processes.
+    """
+    tasks_per_node = 16
+    #: Files created by all the processes of a job, and bounds on the
+    #: files created by each process
+    total_items = 32000
+    min_items, max_items = 100, 1000
+    #: Number of times each run is repeated by mdtest
+    repetitions = 3
+
+    def __init__(self, directory, context):
+        self.directory = directory
+        self.context = context
+
+    def prepare(self):
+        if not self.context['ntasks']:
+            self.context['ntasks'] = self.tasks_per_node * self.context['nnodes']
+        items = self.total_items // self.context['ntasks']
+        self.context['items'] = min(max(items, self.min_items), self.max_items)
+        self.context['modes'] = ['unique', 'shared']
+        self.context['repetitions'] = self.repetitions
+        self.context['scratch'] = test_list['mdtest']['scratch']
+
+
+@preparator('stream')
+class StreamPreparator(object):
+    """Sizes the arrays of STREAM and lists the runs of the job.
+
+    Each array is ``llc_factor`` times as large as the last level caches
+    of the node, so that caches don't inflate the results, as long as
+    the three arrays fit in ``memory_percent`` of the memory. The job
+    runs STREAM with the threads bound to close or spread cores, for a
+    single thread, half a socket, a socket and the whole node, and with
+    the threads and memory of a single socket.
+    """
+    llc_factor = 10
+    memory_percent = 20
+    #: Number of times each kernel is run
+    ntimes = 20
+    #: Used for the targets not in ``target_info``
+    default_target = {'sockets': 2, 'llc': 32}
+
+    def __init__(self, directory, context):
+        self.directory = directory
+        self.context = context
+
+    def prepare(self):
+        cluster_info = clusters_info[self.context['cluster']]
+        target = target_info.get(cluster_info.get('target'), self.default_target)
+        ncores, sockets = cluster_info['ncores'], target['sockets']
+
+        cache = target['llc'] * sockets * 2**20
+        memory = min(cluster_info['mem']) * 2**30 * self.memory_percent / 100
+        # Arrays of doubles, with the same number of elements per core
+        size = int(min(self.llc_factor * cache, memory / 3) / 8)
+        self.context['array_size'] = size // ncores * ncores
+        self.context['ntimes'] = self.ntimes
+
+        if 'intel' in self.context['compiler']:
+            self.context['cc'], self.context['cflags'] = 'icc', '-O3 -xHost -qopenmp'
+        else:
+            self.context['cc'], self.context['cflags'] = 'gcc', '-O3 -march=native -fopenmp'
+        self.context['source'] = test_list['stream']['source']
+
+        per_socket = ncores // sockets
+        runs = []
+        for threads in sorted({1, per_socket // 2, per_socket, ncores} - {0}):
+            # Both bindings are the same for a thread or all the cores
+            for binding in ('close', 'spread'):
+                if binding == 'close' or 1 < threads < ncores:
+                    runs.append({'threads': threads, 'binding': binding})
+        runs.append({'threads': per_socket, 'binding': 'socket'})
+        self.context['stream_runs'] = runs
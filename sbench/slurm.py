@@ -1,11 +1,26 @@
 import datetime
-import glob
+import io
 import os
 import re
 
-from sqlalchemy import Column, DateTime, Integer, String
+from sqlalchemy import Column, DateTime, Index, Integer, String
 
-from ._sql import Base
+from . import _profile
+from ._parsing import iter_lines, scan_key_values
+from ._sql import Base, insert_new_rows, job_foreign_key
+
+
+def parse_date(date_str):
+    """Parses a date written by ``date -R``.
+
+    Args:
+        date_str (str): the date, possibly surrounded by whitespaces
+
+    Returns:
+        The corresponding ``datetime`` object
+    """
+    date_fmt = '%a, %d %b %Y %X %z'
+    return datetime.datetime.strptime(date_str.strip(), date_fmt)
 
 
 def read_date_file(filename):
@@ -17,10 +32,79 @@ def read_date_file(filename):
     Returns:
         The corresponding ``datetime`` object
     """
-    date_fmt = '%a, %d %b %Y %X %z'
     with open(filename) as f:
-        date_str = ''.join(f.readlines()).strip()
-        return datetime.datetime.strptime(date_str, date_fmt)
+        return parse_date(''.join(f.readlines()))
+
+
+#: Regex matching an index or a range of indices in a list of nodes
+_range_regex = re.compile(r'(\d+)(?:-(\d+))?')
+
+
+def _split_nodelist(nodelist):
+    """Splits a list of nodes at the commas that are not in brackets."""
+    items, depth, start = [], 0, 0
+    for i, c in enumerate(nodelist):
+        if c == '[':
+            depth += 1
+        elif c == ']':
+            depth -= 1
+        elif c == ',' and depth == 0:
+            items.append(nodelist[start:i])
+            start = i + 1
+        if depth not in (0, 1):
+            raise ValueError('unbalanced brackets in node list {0!r}'.format(nodelist))
+    if depth:
+        raise ValueError('unbalanced brackets in node list {0!r}'.format(nodelist))
+    items.append(nodelist[start:])
+    return items
+
+
+def _expand_hostname(name):
+    """Expands a name with any number of bracketed ranges, e.g.
+    'r[1-2]n[01-02]-ib'.
+    """
+    start = name.find('[')
+    if start < 0:
+        return [name]
+    end = name.index(']', start)
+    prefix, ranges, suffixes = name[:start], name[start + 1:end], _expand_hostname(name[end + 1:])
+
+    nodes = []
+    for r in ranges.split(','):
+        match = _range_regex.fullmatch(r)
+        if not match:
+            raise ValueError('malformed range {0!r} in {1!r}'.format(r, name))
+        first, last = match.groups()
+        if last is None:
+            indices = [first]
+        else:
+            # Leading zeros of the first index give the width of all of them
+            width = len(first)
+            indices = ['{0:0{1}d}'.format(i, width) for i in range(int(first), int(last) + 1)]
+        nodes.extend(prefix + i + suffix for i in indices for suffix in suffixes)
+    return nodes
+
+
+def expand_nodelist(nodelist):
+    """Expands a list of nodes in the compact format of Slurm.
+
+    Args:
+        nodelist (str): list of nodes, e.g. 'n[001-003,007],gpu1' or
+            'r[1-2]n[1-2]-ib'
+
+    Returns:
+        The names of the nodes, e.g. ['n001', 'n002', 'n003', 'n007', 'gpu1']
+
+    Raises:
+        ValueError: if the list is malformed
+    """
+    nodes = [
+        node for item in _split_nodelist(nodelist) for node in _expand_hostname(item)
+    ] if nodelist else []
+    bad = [node for node in nodes if not node or node.startswith('-')]
+    if bad:
+        raise ValueError('malformed node list {0!r}: {1}'.format(nodelist, ', '.join(map(repr, bad))))
+    return nodes
 
 
 class JobRow(Base):
@@ -40,62 +124,188 @@ class JobRow(Base):
     mpi = Column(String)
     nodelist = Column(String, nullable=False)
     root = Column(String, nullable=False)
+    #: Id of the Slurm job the test ran in, which differs from ``id``
+    #: for the tests of a pack after the first one (see ``_campaign``)
+    slurm_id = Column(Integer)
+    #: Index of the test among the steps of its pack, 0 if not packed
+    step = Column(Integer)
+
+    __table_args__ = (
+        # Lookups by job id only, and filters used by analysis queries
+        Index('ix_Jobs_id', 'id'),
+        Index('ix_Jobs_cluster_compiler_mpi_start', 'cluster', 'compiler', 'mpi', 'start'),
+    )
+
+
+class JobNodeRow(Base):
+    """Describes a node allocated to a job"""
+    __tablename__ = 'JobNodes'
+    __table_args__ = (
+        job_foreign_key(),
+        # Lookups of the jobs that ran on a node
+        Index('ix_JobNodes_node', 'node'),
+    )
+
+    cluster = Column(String, primary_key=True, nullable=False)
+    jobid = Column(Integer, primary_key=True, nullable=False)
+    node = Column(String, primary_key=True, nullable=False)
 
 
 class SlurmJob(object):
+    #: Version of the parser, to be increased when ``parse`` changes
+    version = 2
+
     #: Regex needed to parse information related to the Slurm job
     regexps = {
-        'id': re.compile('run.(\d*).start'),
-        'nodelist': re.compile('SLURM_NODELIST=([\w\[,\]-]*)$'),
-        'cluster': re.compile('SLURM_CLUSTER_NAME=([\w\[,\]]*)$'),
-        'nnodes': re.compile('SLURM_NNODES=([\d]*)$'),
-        'ntasks': re.compile('SLURM_NTASKS=([\d]*)$'),
-        'target': re.compile('SPACK_TARGET_TYPE=([\d\w_]*)$')
+        # Tasks of job arrays are named after the array and task ids
+        'id': re.compile(r'run\.(\d*)(?:_(\d+))?\.start'),
     }
 
-    def __init__(self, root, context):
+    #: Variables parsed from the environment of the job, with the name
+    #: of the corresponding column and the regex their value must match
+    environment_fields = {
+        'SLURM_JOB_ID': ('id', re.compile(r'[\d]+')),
+        'SBENCH_PACK_STEP': ('step', re.compile(r'[\d]+')),
+        'SLURM_NODELIST': ('nodelist', re.compile(r'[\w\[,\]-]*')),
+        'SLURM_CLUSTER_NAME': ('cluster', re.compile(r'[\w\[,\]]*')),
+        'SLURM_NNODES': ('nnodes', re.compile(r'[\d]*')),
+        'SLURM_NTASKS': ('ntasks', re.compile(r'[\d]*')),
+        'SPACK_TARGET_TYPE': ('target', re.compile(r'[\d\w_]*'))
+    }
+
+    #: Patterns of the names of the files written by each job
+    patterns = {
+        'output': '*.out',
+        'error': '*.err',
+        'environment': '*.env',
+        'start': '*.start',
+        'finish': '*.finished',
+    }
+
+    def __init__(self, root, context, contents=None, files=None):
+        """
+        Args:
+            root (path): directory where the job ran
+            context (dict): context of the test run by the job
+            contents (dict): if not None, maps the names of the files in
+                ``root`` to their content, and the files are not read
+                from disk (e.g. for directories read from an archive)
+            files (dict): if not None, the files of the job, as returned
+                by ``classify``, and ``root`` is not listed
+        """
         self.root = root
-        self.files = {
-            'output': glob.glob(os.path.join(root, '*.out')),
-            'error': glob.glob(os.path.join(root, '*.err')),
-            'environment': glob.glob(os.path.join(root, '*.env')),
-            'start': glob.glob(os.path.join(root, '*.start')),
-            'finish': glob.glob(os.path.join(root, '*.finished')),
-        }
+        self.contents = contents
+        if files is not None:
+            self.files = files
+        elif contents is not None:
+            self.files = self.classify(root, contents)
+        else:
+            with _profile.phase('slurm.list'):
+                self.files = self.classify(root, os.listdir(root))
 
         for key, value in self.files.items():
             setattr(self, key, value[0])
 
-        self.id = self.regexps['id'].search(self.start).group(1)
+        match = self.regexps['id'].search(self.start)
+        self.id = match.group(1)
+        self.array_task_id = match.group(2)
         self.context = context
         self.cluster = None
 
-    def update_sql_db(self, session):
+    @classmethod
+    def classify(cls, root, names):
+        """Sorts the files of a job by the patterns they match, in a
+        single pass over the names of the files of its directory. As
+        the patterns are all '*.<suffix>', names are matched by suffix.
+
+        Args:
+            root (path): directory where the job ran
+            names (iterable): names of the files in ``root``
 
-        to_be_parsed = {'nodelist', 'cluster', 'nnodes', 'ntasks', 'target'}
+        Returns:
+            A dictionary mapping each key of ``patterns`` to the sorted
+            paths of the files matching the pattern
+        """
+        files = {key: [] for key in cls.patterns}
+        suffixes = [(key, pattern[1:]) for key, pattern in cls.patterns.items()]
+        for name in sorted(names):
+            for key, suffix in suffixes:
+                if name.endswith(suffix):
+                    files[key].append(os.path.join(root, name))
+                    break
+        return files
+
+    def lines(self, key):
+        """Returns an iterator over the lines of one of the files of
+        the job.
+
+        Args:
+            key (str): one of the keys of ``patterns``, e.g. 'output'
+        """
+        filename = getattr(self, key)
+        if self.contents is None:
+            return iter_lines(filename)
+
+        text = self.contents[os.path.basename(filename)].decode()
+        return iter(io.StringIO(text, newline=None))
+
+    def parse(self):
+        """Parses the information on the job, without touching the DB.
+
+        Returns:
+            A dictionary with the columns of the corresponding ``JobRow``
+        """
         kwargs = {
-            'id': self.id,
             'compiler': self.context['compiler'],
             'mpi': self.context['mpi'],
             'root': self.root
         }
 
-        with open(self.environment, 'r') as f:
-            for line in f.readlines():
-                for item in list(to_be_parsed):
-                    t = self.regexps[item].search(line)
-                    if t:
-                        kwargs[item] = t.group(1)
-                        to_be_parsed.remove(item)
+        kwargs.update(scan_key_values(
+            self.lines('environment'), self.environment_fields
+        ))
 
-                if not to_be_parsed:
-                    break
+        # Each task of a job array has its own job id, which is the
+        # one stored in the DB. Other jobs are named after their id,
+        # which for the steps of a pack isn't the id of the Slurm job.
+        slurm_id = kwargs.get('id')
+        if self.array_task_id is None or 'id' not in kwargs:
+            kwargs['id'] = self.id
+        self.id = kwargs['id'] = int(kwargs['id'])
+        kwargs['slurm_id'] = int(slurm_id) if slurm_id else self.id
+        kwargs['step'] = int(kwargs.get('step') or 0)
+
+        for item in ('nnodes', 'ntasks'):
+            if kwargs.get(item):
+                kwargs[item] = int(kwargs[item])
+
+        kwargs['start'] = parse_date(''.join(self.lines('start')))
+        kwargs['finish'] = parse_date(''.join(self.lines('finish')))
 
         self.cluster = kwargs['cluster']
-        job_row = session.query(JobRow).filter_by(id=self.id).first()
+        return kwargs
+
+    @classmethod
+    def store(cls, session, job):
+        """Inserts a job and its nodes in the DB, unless they are
+        already there.
 
-        if not job_row:
-            kwargs['start'] = read_date_file(self.start)
-            kwargs['finish'] = read_date_file(self.finish)
-            job_row = JobRow(**kwargs)
-            session.add(job_row)
+        Args:
+            session (session): SQLite session to be updated
+            job (dict): job information, as returned by ``parse``
+
+        Returns:
+            The number of rows inserted
+        """
+        nodes = [
+            {'cluster': job['cluster'], 'jobid': job['id'], 'node': node}
+            for node in expand_nodelist(job.get('nodelist'))
+        ]
+        return insert_new_rows(
+            session, JobRow, [job], cluster=job['cluster'], id=job['id']
+        ) + insert_new_rows(
+            session, JobNodeRow, nodes, cluster=job['cluster'], jobid=job['id']
+        )
+
+    def update_sql_db(self, session):
+        self.store(session, self.parse())
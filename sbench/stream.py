@@ -0,0 +1,117 @@
+import re
+
+from sqlalchemy import Column, Integer, Float, String
+
+from ._sql import Base, insert_new_rows, job_foreign_key
+from .commands import parser, target_info
+
+
+class StreamRow(Base):
+    """Results of the STREAM benchmark"""
+    __tablename__ = 'Stream'
+    __table_args__ = (job_foreign_key(),)
+
+    # Foreign keys to identify a job
+    cluster = Column(String, primary_key=True)
+    jobid = Column(Integer, primary_key=True)
+
+    # Number of OpenMP threads, and how they are bound to the cores:
+    # 'close', 'spread', or 'socket' for the cores and memory of a socket
+    threads = Column(Integer, primary_key=True)
+    binding = Column(String, primary_key=True)
+    # Number of elements of each array
+    array_size = Column(Integer)
+    # Best rate of each kernel in MB/s
+    copy = Column(Float)
+    scale = Column(Float)
+    add = Column(Float)
+    triad = Column(Float)
+    # Triad rate relative to the expected peak bandwidth of the memory
+    # used, None if the target has no expected peak
+    efficiency = Column(Float)
+
+
+@parser('stream')
+class StreamParser(object):
+    #: Row in the correct DB table
+    row_cls = StreamRow
+    #: Column compared by ``sbench compare``
+    metric = 'triad'
+    #: Each thread count and binding is a series of its own: a socket
+    #: and a full node are compared to their own baselines
+    series = ('threads', 'binding')
+    #: Higher values are better
+    higher_is_better = True
+    #: Version of the parser, to be increased when ``parse`` changes
+    version = 1
+
+    #: Header printed by the job before each run of STREAM
+    run_regex = re.compile(r'^# stream threads=(\d+) binding=(\w+)')
+    array_size_regex = re.compile(r'^Array size = (\d+)')
+    kernel_regex = re.compile(r'^(Copy|Scale|Add|Triad):\s+([\d.]+)')
+
+    def __init__(self, job, context):
+        self.job = job
+        self.context = context
+
+    def _efficiency(self, row):
+        target = target_info.get(self.context.get('target'))
+        if not target or row.get('triad') is None:
+            return None
+        peak = target['peak_bandwidth']
+        if row['binding'] == 'socket':
+            peak /= target['sockets']
+        return row['triad'] / peak
+
+    def parse(self):
+        """Parses the output of the benchmark, without touching the DB.
+
+        Returns:
+            A list of dictionaries, each one with the columns of a ``row_cls``
+        """
+        rows = []
+        for line in self.job.lines('output'):
+            match = self.run_regex.match(line)
+            if match:
+                rows.append({
+                    'cluster': self.job.cluster,
+                    'jobid': int(self.job.id),
+                    'threads': int(match.group(1)),
+                    'binding': match.group(2)
+                })
+                continue
+            if not rows:
+                continue
+            match = self.kernel_regex.match(line)
+            if match:
+                rows[-1][match.group(1).lower()] = float(match.group(2))
+                continue
+            match = self.array_size_regex.match(line)
+            if match:
+                rows[-1]['array_size'] = int(match.group(1))
+
+        for row in rows:
+            row['efficiency'] = self._efficiency(row)
+        return rows
+
+    @classmethod
+    def store(cls, session, rows):
+        """Inserts in the DB the rows that are not already there.
+
+        Args:
+            session (session): SQLite session to be updated
+            rows (list): rows of a single job, as returned by ``parse``
+
+        Returns:
+            The number of rows inserted
+        """
+        if not rows:
+            return 0
+
+        return insert_new_rows(
+            session, cls.row_cls, rows,
+            cluster=rows[0]['cluster'], jobid=rows[0]['jobid']
+        )
+
+    def update_sql_db(self, session):
+        self.store(session, self.parse())
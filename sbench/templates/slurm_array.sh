@@ -0,0 +1,16 @@
+#!/bin/bash -l
+
+{% include "slurm_directives.sh" %}
+#SBATCH --array=0-{{ directories|length - 1 }}
+#SBATCH --output={{ array_directory }}/array.%A_%a.out
+#SBATCH --error={{ array_directory }}/array.%A_%a.err
+{% for directive in extra_directives %}
+{{ directive }}
+{% endfor %}
+
+# Each task of the array runs the batch file of one test directory
+directories=({{ directories|join(' ') }})
+test_directory=${directories[${SLURM_ARRAY_TASK_ID}]}
+job_tag=${SLURM_ARRAY_JOB_ID}_${SLURM_ARRAY_TASK_ID}
+
+bash -l ${test_directory}/slurm_batch.sh > ${test_directory}/run.${job_tag}.out 2> ${test_directory}/run.${job_tag}.err
@@ -0,0 +1,13 @@
+#SBATCH --account=scitas-ge
+#SBATCH --qos=scitas
+#SBATCH --job-name {{ name }}
+{% if target %}
+#SBATCH --constraint={{ target }}
+{% endif %}
+#SBATCH --mem=MaxMemPerNode
+#SBATCH --exclusive
+#SBATCH --nodes={{ nnodes }}
+{% if ntasks %}
+#SBATCH --ntasks={{ ntasks }}
+{% endif %}
+#SBATCH --cpus-per-task=1
@@ -0,0 +1,15 @@
+module load ior
+
+# Each job writes in a directory of its own, removed at the end
+io_directory={{ scratch }}/ior.${SLURM_JOB_ID}
+mkdir -p ${io_directory}
+
+# Data is read by the tasks of another node (-C -Q), so that reads
+# don't hit the page cache of the node that wrote it
+{% for run in ior_runs %}
+echo "# ior mode={{ run.mode }} transfer={{ run.transfer }} block={{ run.block }}"
+srun ior -a POSIX -w -r -e -C -Q {{ tasks_per_node }} -i {{ repetitions }} \
+    -t {{ run.transfer }} -b {{ run.block }}{% if run.mode == 'fpp' %} -F{% endif %} -o ${io_directory}/{{ run.mode }}
+{% endfor %}
+
+rm -rf ${io_directory}
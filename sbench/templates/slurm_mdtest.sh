@@ -0,0 +1,12 @@
+module load ior
+
+# Each job works in a directory of its own, removed at the end
+io_directory={{ scratch }}/mdtest.${SLURM_JOB_ID}
+mkdir -p ${io_directory}
+
+{% for mode in modes %}
+echo "# mdtest mode={{ mode }} items={{ items }}"
+srun mdtest -n {{ items }} -i {{ repetitions }}{% if mode == 'unique' %} -u{% endif %} -d ${io_directory}/{{ mode }}
+{% endfor %}
+
+rm -rf ${io_directory}
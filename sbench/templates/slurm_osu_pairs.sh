@@ -0,0 +1,31 @@
+module load osu-micro-benchmarks
+
+osu_test=${OSU_MICRO_BENCHMARKS_ROOT}/libexec/osu-micro-benchmarks/mpi/{{ subdir }}/{{ command }}
+# The outputs of the pairs are written outside of the test directory,
+# which must not have subdirectories to be found by 'sbench collect'
+pairs_directory=$(mktemp -d "${TMPDIR:-/tmp}/sbench-pairs.XXXXXX")
+
+# Nodes of the job, indexed as in the schedule of the pairs
+hosts=($(scontrol show hostnames "${SLURM_JOB_NODELIST}"))
+
+# The pairs of a round don't share nodes and run at the same time.
+# Ranks are placed on the nodes in the order of the host file, so
+# that the first node of each pair is the one sending the messages.
+{% for round in rounds %}
+{% for src, dst in round %}
+printf '%s\n%s\n' "${hosts[{{ src }}]}" "${hosts[{{ dst }}]}" > ${pairs_directory}/{{ src }}-{{ dst }}.hosts
+SLURM_HOSTFILE=${pairs_directory}/{{ src }}-{{ dst }}.hosts srun --nodes=2 --ntasks=2 --ntasks-per-node=1 \
+    --distribution=arbitrary ${osu_test} > ${pairs_directory}/{{ src }}-{{ dst }}.out &
+{% endfor %}
+wait
+{% endfor %}
+
+# The results of each pair follow the nodes of the pair
+{% for round in rounds %}
+{% for src, dst in round %}
+echo "# pair ${hosts[{{ src }}]} ${hosts[{{ dst }}]}"
+cat ${pairs_directory}/{{ src }}-{{ dst }}.out
+{% endfor %}
+{% endfor %}
+
+rm -rf ${pairs_directory}
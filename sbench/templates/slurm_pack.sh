@@ -0,0 +1,29 @@
+#!/bin/bash -l
+
+{% include "slurm_directives.sh" %}
+#SBATCH --output={{ pack_directory }}/pack.%j.out
+#SBATCH --error={{ pack_directory }}/pack.%j.err
+{% for directive in extra_directives %}
+{{ directive }}
+{% endfor %}
+
+{% if steps|length > 1 %}
+# The ids of the steps would clash with those of other jobs
+if [ ${SLURM_JOB_ID} -ge {{ pack_step_base }} ]; then
+    echo "job id ${SLURM_JOB_ID} is too large to pack tests" >&2
+    exit 1
+fi
+
+{% endif %}
+# Each test runs as a step of this job, writing its files in its own
+# directory under its own job id. srun takes the number of tasks from
+# SLURM_NTASKS.
+{% for step in steps %}
+export SBENCH_JOB_ID={% if loop.first %}${SLURM_JOB_ID}{% else %}$((SLURM_JOB_ID + {{ loop.index0 * pack_step_base }})){% endif %} SBENCH_PACK_STEP={{ loop.index0 }}
+{% if step.ntasks %}
+export SLURM_NTASKS={{ step.ntasks }} SLURM_NPROCS={{ step.ntasks }}
+{% else %}
+unset SLURM_NTASKS SLURM_NPROCS
+{% endif %}
+bash -l {{ step.test_directory }}/slurm_batch.sh > {{ step.test_directory }}/run.${SBENCH_JOB_ID}.out 2> {{ step.test_directory }}/run.${SBENCH_JOB_ID}.err
+{% endfor %}
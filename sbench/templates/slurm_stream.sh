@@ -0,0 +1,14 @@
+cd {{ test_directory }}
+# Arrays larger than 2 GB need the medium code model
+{{ cc }} {{ cflags }} -mcmodel=medium -DSTREAM_ARRAY_SIZE={{ array_size }} -DNTIMES={{ ntimes }} \
+    {{ source }} -o stream
+
+export OMP_PLACES=cores
+{% for run in stream_runs %}
+echo "# stream threads={{ run.threads }} binding={{ run.binding }}"
+{% if run.binding == 'socket' %}
+OMP_NUM_THREADS={{ run.threads }} OMP_PROC_BIND=close numactl --cpunodebind=0 --membind=0 ./stream
+{% else %}
+OMP_NUM_THREADS={{ run.threads }} OMP_PROC_BIND={{ run.binding }} ./stream
+{% endif %}
+{% endfor %}
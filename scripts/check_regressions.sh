@@ -0,0 +1,23 @@
+#!/bin/bash -l
+
+scratch_dir="/scratch/${USER}"
+
+# Create a virtual environment in a random location
+mkdir -p ${scratch_dir}/sbench/venv
+venv_dir="$(mktemp -d ${scratch_dir}/sbench/venv/py-36.XXXX)"
+
+module load gcc python
+virtualenv --python=python3 ${venv_dir}
+
+# Install sbench in the virtual environment, with numpy
+. ${venv_dir}/bin/activate
+pip install -e .[export]
+
+# Compare the results of tonight's campaign to the previous runs.
+# sbench exits with an error if any result regressed, which fails
+# the stage.
+db_dir="${HOME}/benchmarks/db"
+db="${SBENCH_DB:-${db_dir}/benchmarks.db}"
+
+echo CHECKING REGRESSIONS
+sbench compare --db ${db} --baseline-date "$(date --rfc-3339=date)"
@@ -42,35 +42,22 @@ sbench run ${target_flag} ${benchmarks_dir}
 db_dir="${HOME}/benchmarks/db"
 raw_results_dir="${HOME}/benchmarks/raw"
 mkdir -p ${db_dir} && mkdir -p ${raw_results_dir}
+# A DB server (e.g. SBENCH_DB=postgresql://user@host/benchmarks) can be
+# shared by all the nodes, instead of a SQLite file per node
+db="${SBENCH_DB:-${db_dir}/benchmarks.db}"
 
 
-function join_by { local IFS="$1"; shift; echo "$*"; }
-
-job_names="hpl,osu_bw,osu_bibw,osu_latency,osu_alltoall,osu_allreduce"
-job_deps=$(join_by ':' $(squeue --name=${job_names} --format="%.i" | tail -n +2))
-
 echo WAITING JOBS [$hostname]
 
-# Here we are touching a file that will be used as a
-# semaphore to indicate that we still need to wait for
-# some job to finish. This file will be deleted as the
-# final step of the process spawned in the background.
-# This is done because otherwise Jenkins (Java) will
-# timeout if the process is not producing any output
-# for 5 mins.
-touch ${benchmarks_dir}/waiting
-
-# Spawn the background process
-echo srun --dependency=afterany:${job_deps} -- sbench collect --db ${db_dir}/benchmarks.db ${benchmarks_dir}
-srun --dependency=afterany:${job_deps} -- sbench collect --db ${db_dir}/benchmarks.db ${benchmarks_dir} && rm ${benchmarks_dir}/waiting &
-
-# Wait for the background process to finish
-while [ -f ${benchmarks_dir}/waiting ] ;
-do
-    printf . && sleep 5
-done
-echo
+# Results are stored in the DB as soon as each job is done. The
+# progress printed at each poll also keeps Jenkins (Java) from
+# timing out, which happens if nothing is printed for 5 mins. Jobs
+# that are not done after a day are given up on, and archived as is.
+sbench watch --interval 60 --timeout 86400 --db ${db} ${benchmarks_dir}
 
-# Archive all the raw data
+# Archive all the raw data: test directories go to a pack, that
+# 'sbench collect' reads directly, and the rest to a tarball
 echo ARCHIVING DATA [${hostname}]
-tar -czvf ${raw_results_dir}/benchmarks-${hostname}-$(date --rfc-3339=date).tgz --remove-files ${benchmarks_dir}/*
+archive="${raw_results_dir}/benchmarks-${hostname}-$(date --rfc-3339=date)"
+sbench pack --remove-files ${benchmarks_dir} ${archive}.pack
+tar -czvf ${archive}.tgz --remove-files ${benchmarks_dir}/*
@@ -13,8 +13,33 @@ setup(
         'Jinja2',
         'SQLAlchemy'
     ],
+    extras_require={
+        'export': ['numpy', 'pyarrow'],
+        'postgresql': ['psycopg2']
+    },
     entry_points='''
         [console_scripts]
         sbench=sbench.commands:sbench
+
+        [sbench.parsers]
+        osu_bw=sbench.osu:OsuBw
+        osu_bibw=sbench.osu:OsuBiBw
+        osu_latency=sbench.osu:OsuLatency
+        osu_alltoall=sbench.osu:OsuAlltoall
+        osu_allreduce=sbench.osu:OsuAllreduce
+        osu_bw_pairs=sbench.osu:OsuBwPairs
+        osu_latency_pairs=sbench.osu:OsuLatencyPairs
+        ior=sbench.ior:IORParser
+        mdtest=sbench.ior:MdtestParser
+        stream=sbench.stream:StreamParser
+        hpl=sbench.hpl:HPLParser
+
+        [sbench.preparators]
+        hpl=sbench.preparators:HPLPreparator
+        osu_bw_pairs=sbench.preparators:OsuPairsPreparator
+        osu_latency_pairs=sbench.preparators:OsuPairsPreparator
+        ior=sbench.preparators:IORPreparator
+        mdtest=sbench.preparators:MdtestPreparator
+        stream=sbench.preparators:StreamPreparator
     '''
 )